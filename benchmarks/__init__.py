@@ -0,0 +1,4 @@
+"""
+Benchmarks de desempenho da carga e das consultas.
+Execute a partir da raiz do projeto, por exemplo: python -m benchmarks.bench_copy
+"""
@@ -0,0 +1,101 @@
+"""
+Compara a latência das consultas de top 3 produtos por UF e ano do dashboard
+no PostgreSQL e no DuckDB (sobre o cache em Parquet ou os CSVs locais)
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import parquet_cache
+import query_backend
+import send_data
+
+# Mesma consulta de get_top_exportacoes/get_top_importacoes do dashboard
+TOP3_QUERY = """
+SELECT no_ncm_por as produto,
+       SUM("KG_LIQUIDO") as quantidade_total
+FROM {table}
+WHERE {where_estado}
+  AND "CO_ANO" = {ano}
+  AND no_ncm_por IS NOT NULL
+GROUP BY no_ncm_por
+ORDER BY quantidade_total DESC
+LIMIT 3
+"""
+
+
+def build_queries(backend, anos):
+    estados = backend.query(
+        'SELECT DISTINCT "SG_UF_NCM" FROM export_data WHERE "SG_UF_NCM" IS NOT NULL ORDER BY 1'
+    )['SG_UF_NCM'].tolist()
+    queries = []
+    for table in ['export_data', 'import_data']:
+        for estado in ['Todos'] + estados:
+            where_estado = f"\"SG_UF_NCM\" = '{estado}'" if estado != "Todos" else "1=1"
+            for ano in anos:
+                queries.append(TOP3_QUERY.format(table=table, where_estado=where_estado, ano=ano))
+    return queries
+
+
+def run(backend, queries, repeat):
+    latencies = []
+    results = []
+    for _ in range(repeat):
+        results = []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(backend.query(query))
+            latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000, results
+
+
+def same_results(a, b):
+    """Compara os produtos e quantidades (ignorando empates na ordem e tipos numéricos)"""
+    for left, right in zip(a, b):
+        left = sorted(zip(left['produto'], left['quantidade_total'].astype(float)))
+        right = sorted(zip(right['produto'], right['quantidade_total'].astype(float)))
+        if left != right:
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos backends de consulta do dashboard.")
+    parser.add_argument('--data-dir', default=query_backend.DATA_DIR, help="diretório dos CSVs e do NCM.csv")
+    parser.add_argument('--cache-dir', default=parquet_cache.CACHE_DIR, help="diretório do cache em Parquet")
+    parser.add_argument('--anos', type=int, nargs='+', default=[2020, 2021])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-postgres', action='store_true', help="medir apenas o DuckDB")
+    args = parser.parse_args()
+
+    backends = []
+    if not args.no_postgres:
+        start = time.perf_counter()
+        backends.append((query_backend.PostgresBackend(send_data.DB_CONFIG), time.perf_counter() - start))
+    start = time.perf_counter()
+    duckdb_backend = query_backend.DuckDBBackend(args.data_dir, args.cache_dir)
+    backends.append((duckdb_backend, time.perf_counter() - start))
+
+    queries = build_queries(backends[0][0], args.anos)
+    print(f"{len(queries)} consultas, {args.repeat} repetições")
+    print(f"{'backend':18} {'início':>9} {'mediana':>9} {'p95':>9} {'total':>9}")
+
+    reference = None
+    for backend, startup in backends:
+        label = backend.name
+        if backend is duckdb_backend:
+            label += f" ({', '.join(sorted(set(backend.sources.values())))})"
+        latencies, results = run(backend, queries, args.repeat)
+        print(f"{label:18} {startup:8.2f}s {np.median(latencies):7.1f}ms {np.percentile(latencies, 95):7.1f}ms "
+              f"{latencies.sum() / 1000 / args.repeat:8.2f}s")
+        if reference is None:
+            reference = results
+        elif not same_results(reference, results):
+            print("  aviso: os resultados diferem dos do primeiro backend")
+        backend.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Compara o COPY em formato texto (to_csv) com o COPY binário (binary_copy)
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+import binary_copy
+import send_data
+
+
+def make_dataframe(rows, seed=0):
+    """Gera um DataFrame com o layout dos arquivos EXP, incluindo alguns valores nulos"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'CO_ANO': rng.integers(2020, 2022, rows),
+        'CO_MES': rng.integers(1, 13, rows),
+        'CO_NCM': rng.integers(1_000_000, 99_999_999, rows),
+        'CO_UNID': rng.integers(1, 20, rows),
+        'CO_PAIS': rng.integers(1, 999, rows),
+        'SG_UF_NCM': rng.choice(['SP', 'RJ', 'MG', 'PR', 'SC', 'RS', 'BA', 'ND'], rows),
+        'CO_VIA': rng.integers(1, 15, rows),
+        'CO_URF': rng.integers(100_000, 999_999, rows),
+        'QT_ESTAT': rng.integers(0, 10**9, rows),
+        'KG_LIQUIDO': rng.integers(0, 10**9, rows).astype('float64'),
+        'VL_FOB': rng.integers(0, 10**10, rows),
+    })
+    # Valores inválidos viram NaN em pd.to_numeric(errors='coerce')
+    df.loc[::1000, 'KG_LIQUIDO'] = np.nan
+    return df
+
+
+def encode_text(df):
+    output = send_data.StringIO()
+    df.to_csv(output, sep='\t', header=False, index=False, quoting=send_data.csv.QUOTE_NONE, escapechar='\\')
+    output.seek(0)
+    return output
+
+
+def best_of(repeat, func):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do COPY texto x binário.")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-db', action='store_true', help="medir apenas a codificação, sem PostgreSQL")
+    args = parser.parse_args()
+
+    df = make_dataframe(args.rows)
+    column_types = {col: 'bigint' for col in df.columns}
+    column_types.update({'SG_UF_NCM': 'character', 'KG_LIQUIDO': 'double precision'})
+
+    print(f"{args.rows} linhas, melhor de {args.repeat} execuções")
+    text_encode = best_of(args.repeat, lambda: encode_text(df))
+    binary_encode = best_of(args.repeat, lambda: binary_copy.encode_dataframe(df, column_types))
+    print(f"Codificação  texto: {text_encode:7.3f}s   binário: {binary_encode:7.3f}s   "
+          f"({text_encode / binary_encode:.1f}x)")
+
+    if args.no_db:
+        return
+
+    conn = psycopg2.connect(**send_data.DB_CONFIG)
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TEMPORARY TABLE bench_copy (
+            "CO_ANO" BIGINT, "CO_MES" BIGINT, "CO_NCM" BIGINT, "CO_UNID" BIGINT, "CO_PAIS" BIGINT,
+            "SG_UF_NCM" CHAR(2), "CO_VIA" BIGINT, "CO_URF" BIGINT, "QT_ESTAT" BIGINT,
+            "KG_LIQUIDO" DOUBLE PRECISION, "VL_FOB" BIGINT
+        )
+    """)
+
+    def copy_with(copy_format):
+        def run():
+            cursor.execute("TRUNCATE bench_copy")
+            send_data.COPY_FORMAT = copy_format
+            send_data.copy_dataframe(cursor, df, 'bench_copy')
+        return run
+
+    text_total = best_of(args.repeat, copy_with('text'))
+    cursor.execute("SELECT md5(string_agg(t::text, ',' ORDER BY t::text)) FROM bench_copy t")
+    text_checksum = cursor.fetchone()[0]
+    binary_total = best_of(args.repeat, copy_with('binary'))
+    cursor.execute("SELECT md5(string_agg(t::text, ',' ORDER BY t::text)) FROM bench_copy t")
+    binary_checksum = cursor.fetchone()[0]
+    conn.rollback()
+    conn.close()
+
+    print(f"COPY completo texto: {text_total:7.3f}s   binário: {binary_total:7.3f}s   "
+          f"({text_total / binary_total:.1f}x)")
+    print("Conteúdo idêntico nos dois formatos." if text_checksum == binary_checksum
+          else "ATENÇÃO: o conteúdo difere entre os formatos!")
+
+
+if __name__ == "__main__":
+    main()
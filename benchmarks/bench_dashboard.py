@@ -0,0 +1,114 @@
+"""
+Mede o tempo de montagem de uma página do dashboard (as consultas das três abas
+para um estado) com vários usuários simultâneos, sem o cache do Streamlit:
+- serial: uma única conexão compartilhada e as consultas de cada página uma após
+  a outra (como antes do pool de conexões);
+- pool: pool de conexões e as consultas de cada página em paralelo;
+- cubo: rankings calculados no cubo em memória (olap_cache.py), o padrão do dashboard.
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+
+import dashboard_queries
+import olap_cache
+import query_backend
+import send_data
+
+# Abas do dashboard (mesmas de dashboard.TAB_VIEWS)
+TAB_VIEWS = [('E', [2020, 2021], None), ('I', [2020, 2021], None), ('E', [2021], list(range(1, 13)))]
+
+
+def build_page_queries(estado, rollup_flows):
+    return [
+        dashboard_queries.build_top_produtos_query(
+            fluxo, anos, meses, estado=estado, use_rollup=dashboard_queries.can_use_rollup(rollup_flows, fluxo)
+        )
+        for fluxo, anos, meses in TAB_VIEWS
+    ]
+
+
+def render_serial(backend, queries):
+    return [backend.query(query, params) for query, params in queries]
+
+
+def render_pool(backend, queries):
+    return query_backend.run_concurrently(backend, queries)
+
+
+def render_cube(cube, queries):
+    # As consultas não são usadas: o cubo responde às mesmas abas sem acessar o banco
+    estado = queries[0][1].get('estado', dashboard_queries.TODOS)
+    return [cube.top_k(fluxo, anos, meses, estado=estado) for fluxo, anos, meses in TAB_VIEWS]
+
+
+def simulate(backend, render, estados, rollup_flows, users, pages, seed=0):
+    """Cada usuário (uma thread) monta `pages` páginas de estados sorteados; retorna os tempos em ms"""
+    latencies = []
+    lock = threading.Lock()
+
+    def user(index):
+        rng = np.random.default_rng(seed + index)
+        for _ in range(pages):
+            queries = build_page_queries(str(rng.choice(estados)), rollup_flows)
+            start = time.perf_counter()
+            render(backend, queries)
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.array(latencies), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de páginas do dashboard com usuários simultâneos.")
+    parser.add_argument('--users', type=int, default=20, help="usuários simultâneos (padrão: 20)")
+    parser.add_argument('--pages', type=int, default=5, help="páginas montadas por usuário (padrão: 5)")
+    parser.add_argument('--pool-size', type=int, default=query_backend.POOL_SIZE)
+    parser.add_argument('--no-rollup', action='store_true', help="consultar as tabelas de dados, sem o resumo")
+    args = parser.parse_args()
+
+    modes = [
+        ('serial', 1, render_serial),
+        (f'pool ({args.pool_size})', args.pool_size, render_pool),
+    ]
+
+    print(f"{args.users} usuários, {args.pages} páginas cada, {len(TAB_VIEWS)} consultas por página")
+    print(f"{'modo':12} {'mediana':>10} {'p95':>10} {'máximo':>10} {'páginas/s':>10}")
+    for label, pool_size, render in modes:
+        backend = query_backend.PostgresBackend(send_data.DB_CONFIG, pool_size=pool_size)
+        try:
+            rollup_flows = [] if args.no_rollup else dashboard_queries.get_rollup_flows(backend)
+            estados = [dashboard_queries.TODOS] + backend.query(
+                dashboard_queries.build_estados_query(bool(rollup_flows))
+            )['SG_UF_NCM'].tolist()
+            latencies, seconds = simulate(backend, render, estados, rollup_flows, args.users, args.pages)
+        finally:
+            backend.close()
+        print(f"{label:12} {np.median(latencies):8.0f}ms {np.percentile(latencies, 95):8.0f}ms "
+              f"{latencies.max():8.0f}ms {len(latencies) / seconds:10.1f}")
+
+    backend = query_backend.PostgresBackend(send_data.DB_CONFIG, pool_size=args.pool_size)
+    try:
+        start = time.perf_counter()
+        cube = olap_cache.load_cube(backend, [2020, 2021], rollup_flows)
+        cube.precompute(TAB_VIEWS)
+        load_seconds = time.perf_counter() - start
+    finally:
+        backend.close()
+    latencies, seconds = simulate(cube, render_cube, estados, rollup_flows, args.users, args.pages)
+    print(f"{'cubo':12} {np.median(latencies):8.1f}ms {np.percentile(latencies, 95):8.1f}ms "
+          f"{latencies.max():8.1f}ms {len(latencies) / seconds:10.1f}  (carga do cubo: {load_seconds:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
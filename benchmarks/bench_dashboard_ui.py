@@ -0,0 +1,86 @@
+"""
+Mede o tempo até a página do dashboard ficar interativa (execução completa do
+script do Streamlit, com consultas, gráficos e tabelas) depois de cada
+interação, usando o AppTest do Streamlit, sem navegador:
+- primeira execução (caches vazios, inclui a carga do cubo em memória);
+- troca do estado no filtro da barra lateral;
+- troca da visualização (no seletor de visualizações do dashboard).
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+# Script do dashboard, na raiz do repositório
+DASHBOARD_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dashboard.py')
+
+# Visualizações percorridas a cada estado (rótulos de dashboard.VIEWS)
+VIEW_LABELS = ["Exportações 2020-2021", "Importações 2020-2021", "Exportações Mensais 2021"]
+
+
+def timed_run(at, timeout):
+    start = time.perf_counter()
+    at.run(timeout=timeout)
+    elapsed = (time.perf_counter() - start) * 1000
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return elapsed
+
+
+def get_view_selector(at):
+    """Seletor de visualizações do dashboard (None na versão com st.tabs)"""
+    for widget in at.radio:
+        if widget.key == 'visao':
+            return widget
+    return None
+
+
+def summarize(label, latencies):
+    latencies = np.array(latencies)
+    print(f"{label:22} {len(latencies):6d} {np.median(latencies):8.0f}ms {np.percentile(latencies, 95):8.0f}ms "
+          f"{latencies.max():8.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo até a página do dashboard ficar interativa.")
+    parser.add_argument('--states', type=int, default=10, help="estados percorridos (padrão: 10)")
+    parser.add_argument('--timeout', type=float, default=300, help="tempo máximo por execução, em segundos")
+    args = parser.parse_args()
+
+    at = AppTest.from_file(DASHBOARD_PATH, default_timeout=args.timeout)
+    first = timed_run(at, args.timeout)
+
+    selectbox = at.sidebar.selectbox[0]
+    estados = [estado for estado in selectbox.options if estado != selectbox.value][:args.states]
+
+    state_latencies = []
+    view_latencies = []
+    for estado in estados:
+        at.sidebar.selectbox[0].select(estado)
+        state_latencies.append(timed_run(at, args.timeout))
+
+        selector = get_view_selector(at)
+        if selector is None:
+            continue
+        current = selector.value
+        for label in VIEW_LABELS:
+            if label == current:
+                continue
+            get_view_selector(at).set_value(label)
+            view_latencies.append(timed_run(at, args.timeout))
+        # A próxima troca de estado começa sempre na primeira visualização
+        get_view_selector(at).set_value(VIEW_LABELS[0])
+        timed_run(at, args.timeout)
+
+    print(f"primeira execução: {first:.0f}ms")
+    print(f"{'interação':22} {'vezes':>6} {'mediana':>10} {'p95':>10} {'máximo':>10}")
+    summarize('troca de estado', state_latencies)
+    if view_latencies:
+        summarize('troca de visualização', view_latencies)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark e verificação do download_data.py contra um servidor local
+(benchmarks/local_server.py), com arquivos sintéticos no layout do site:
+- serial: um arquivo por vez com blocos de 1 KB (o download_file anterior);
+- paralelo: download_all com DOWNLOAD_WORKERS arquivos por vez e blocos de 1 MB;
+- sem alterações: nova execução, respondida com 304 (nenhum byte transferido);
+- retomada: arquivos interrompidos na metade continuam do .part com Range;
+- revisão: apenas o arquivo alterado no servidor é baixado de novo.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import requests
+
+import download_data
+from benchmarks import local_server
+
+
+def make_site(directory, years, size_mb, seed=0):
+    """Cria os arquivos EXP/IMP de cada ano e o NCM.csv com conteúdo aleatório"""
+    rng = np.random.default_rng(seed)
+    for url, name in download_data.build_file_urls(years, 'http://site'):
+        path = os.path.join(directory, url[len('http://site/'):])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = int(size_mb * 1024 * 1024) if name != 'NCM.csv' else 1024 * 1024
+        with open(path, 'wb') as file:
+            file.write(rng.integers(0, 256, size, dtype=np.uint8).tobytes())
+
+
+def download_serial(files, output_directory):
+    """Mesmo laço do download_file anterior: um arquivo por vez, blocos de 1 KB"""
+    for url, name in files:
+        response = requests.get(url, stream=True)
+        with open(os.path.join(output_directory, name), 'wb') as file:
+            for data in response.iter_content(1024):
+                file.write(data)
+
+
+def sha256(path):
+    return download_data.hash_file(path).hexdigest()
+
+
+def check_files(site_dir, output_directory, files):
+    for url, name in files:
+        source = os.path.join(site_dir, url.split('/', 3)[3])
+        if sha256(source) != sha256(os.path.join(output_directory, name)):
+            raise AssertionError(f"{name} diferente do arquivo do servidor")
+
+
+def timed(label, function, total_bytes=None):
+    start = time.perf_counter()
+    results = function()
+    elapsed = time.perf_counter() - start
+    rate = f"{total_bytes / elapsed / 2**20:8.1f} MB/s" if total_bytes else ''
+    counts = {}
+    for status in (results or {}).values():
+        counts[status] = counts.get(status, 0) + 1
+    summary = ', '.join(f"{count} {status}" for status, count in sorted(counts.items()))
+    print(f"{label:16} {elapsed:8.2f}s {rate:>12}  {summary}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do download_data.py contra um servidor local.")
+    parser.add_argument('--years', nargs='+', default=['2019-2021'])
+    parser.add_argument('--size-mb', type=float, default=50, help="tamanho de cada arquivo EXP/IMP (padrão: 50)")
+    parser.add_argument('--rate-limit', type=float, default=20,
+                        help="velocidade por conexão do servidor, em MB/s (padrão: 20; 0 = sem limite)")
+    parser.add_argument('--workers', type=int, default=download_data.DOWNLOAD_WORKERS)
+    args = parser.parse_args()
+
+    years = download_data.parse_years(args.years)
+    workdir = tempfile.mkdtemp(prefix='bench_download_')
+    site_dir = os.path.join(workdir, 'site')
+    try:
+        make_site(site_dir, years, args.size_mb)
+        rate_limit = args.rate_limit * 2**20 if args.rate_limit else None
+        with local_server.serve(site_dir, rate_limit=rate_limit) as base_url:
+            files = download_data.build_file_urls(years, base_url)
+            total_bytes = sum(
+                os.path.getsize(os.path.join(site_dir, url[len(base_url) + 1:])) for url, _ in files
+            )
+            limit = f"{args.rate_limit:g} MB/s por conexão" if args.rate_limit else "sem limite de velocidade"
+            print(f"{len(files)} arquivos, {total_bytes / 2**20:.0f} MB, {limit}, {args.workers} downloads em paralelo")
+
+            serial_dir = os.path.join(workdir, 'serial')
+            os.makedirs(serial_dir)
+            timed('serial (1 KB)', lambda: download_serial(files, serial_dir), total_bytes)
+
+            output = os.path.join(workdir, 'output')
+
+            def run():
+                return download_data.download_all(years, output, base_url, args.workers)
+
+            timed('paralelo (1 MB)', run, total_bytes)
+            check_files(site_dir, output, files)
+            timed('sem alterações', run)
+
+            # Interrompe cada arquivo na metade: o .part fica com a primeira metade
+            metadata = download_data.DownloadMetadata(output)
+            for _, name in files:
+                path = os.path.join(output, name)
+                entry = metadata.get(name)
+                with open(path, 'rb') as source, open(path + download_data.PART_SUFFIX, 'wb') as part:
+                    part.write(source.read(os.path.getsize(path) // 2))
+                os.remove(path)
+                metadata.update(name, {**entry, 'part_validator': entry['etag']})
+            timed('retomada', run, total_bytes // 2)
+            check_files(site_dir, output, files)
+
+            # Revisão de um arquivo no servidor
+            url, name = files[0]
+            revised = os.path.join(site_dir, url[len(base_url) + 1:])
+            with open(revised, 'ab') as file:
+                file.write(b'revisado\n')
+            future = time.time() + 5
+            os.utime(revised, (future, future))
+            timed('revisão', run)
+            check_files(site_dir, output, files)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Compara o pico de memória e o tempo de leitura de um arquivo EXP/IMP:
+leitura com tipos inferidos pelo pandas x csv_reader com tipos explícitos
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+import csv_reader
+
+# Cada modo roda em um processo separado, para que o pico de memória de um não afete o outro
+MODES = ['inferido', 'tipado', 'pyarrow']
+
+
+def read(file_path, mode):
+    if mode == 'inferido':
+        # Leitura anterior do send_data.read_csv
+        return pd.read_csv(file_path, sep=';', quotechar='"')
+    return csv_reader.read_csv(file_path, engine='pyarrow' if mode == 'pyarrow' else 'c')
+
+
+def run_mode(file_path, mode):
+    baseline = csv_reader.peak_rss_mb()
+    start = time.perf_counter()
+    df = read(file_path, mode)
+    seconds = time.perf_counter() - start
+    print(json.dumps({
+        'mode': mode,
+        'rows': len(df),
+        'seconds': seconds,
+        'dataframe_mb': df.memory_usage(deep=True).sum() / 1024 ** 2,
+        'peak_rss_mb': csv_reader.peak_rss_mb(),
+        'baseline_rss_mb': baseline,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de memória da leitura do CSV.")
+    parser.add_argument('file', help="arquivo EXP_*.csv ou IMP_*.csv (de preferência de um ano completo)")
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.file, args.mode)
+        return
+
+    print(f"{'modo':10} {'linhas':>10} {'tempo':>8} {'DataFrame':>11} {'pico RSS':>10}")
+    for mode in MODES:
+        if mode == 'pyarrow' and csv_reader.pa_csv is None:
+            print(f"{mode:10} (pyarrow não instalado)")
+            continue
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_reader', args.file, '--mode', mode],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:10} {result['rows']:>10} {result['seconds']:>7.2f}s {result['dataframe_mb']:>8.1f} MB "
+              f"{result['peak_rss_mb']:>7.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
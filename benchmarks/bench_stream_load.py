@@ -0,0 +1,127 @@
+"""
+Compara a carga em duas etapas (download_data.py grava o arquivo em disco e o
+send_data.py o lê em blocos) com a carga em um único fluxo (stream_load.py),
+servindo o arquivo por um servidor local (benchmarks/local_server.py) em versões
+.csv, .zip e .gz. Cada carga roda em um processo próprio, em um banco de dados
+descartável, e informa o tempo total, o pico de memória, os bytes gravados em
+disco e a contagem/soma dos registros carregados (que devem ser iguais em todas).
+
+Uso: python -m benchmarks.bench_stream_load src/ncm_data/EXP_2021.csv [--rate-limit 20]
+"""
+
+import argparse
+import gzip
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+
+import psycopg2
+
+import csv_reader
+import data_version
+import download_data
+import send_data
+import stream_load
+from benchmarks import local_server, scratch_db
+
+# Banco de dados criado (e removido) para cada carga
+BENCH_DATABASE = 'bench_stream_load'
+
+
+def make_site(directory, csv_path):
+    """Copia o CSV para o diretório servido e cria as versões .zip e .gz"""
+    os.makedirs(directory)
+    name = os.path.basename(csv_path)
+    stem = os.path.splitext(name)[0]
+    shutil.copy(csv_path, os.path.join(directory, name))
+    with zipfile.ZipFile(os.path.join(directory, stem + '.zip'), 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.write(csv_path, name)
+    with open(csv_path, 'rb') as source, gzip.open(os.path.join(directory, stem + '.csv.gz'), 'wb') as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    return [name, stem + '.zip', stem + '.csv.gz']
+
+
+def directory_size(directory):
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names
+    )
+
+
+def run_load(mode, url, data_type, workdir):
+    """Executa uma carga (no processo filho) e retorna as medições"""
+    send_data.DB_CONFIG = scratch_db.get_config(BENCH_DATABASE)
+    conn = psycopg2.connect(**send_data.DB_CONFIG)
+    send_data.create_manifest_table(conn)
+    data_version.create_data_version_table(conn)
+
+    output = os.path.join(workdir, 'output')
+    start = time.perf_counter()
+    if mode == 'disco':
+        name = os.path.basename(url)
+        download_data.download_files([(url, name)], output)
+        send_data.insert_data_streaming(conn, os.path.join(output, name), data_type)
+    else:
+        stream_load.stream_load(conn, url, data_type, tee_directory=output if mode == 'fluxo + cópia' else None)
+    elapsed = time.perf_counter() - start
+
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT count(*), sum("VL_FOB") FROM {send_data.get_table_name(data_type)}')
+    rows, total = cursor.fetchone()
+    conn.close()
+    disk = directory_size(output) if os.path.isdir(output) else 0
+    shutil.rmtree(output, ignore_errors=True)
+    return {'elapsed': elapsed, 'peak_rss': csv_reader.peak_rss_mb(), 'disk': disk, 'rows': rows, 'sum': total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga em duas etapas x carga em fluxo (stream_load.py).")
+    parser.add_argument('file', help="arquivo EXP/IMP usado no teste")
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help="velocidade do servidor, em MB/s (padrão: 0 = sem limite)")
+    args = parser.parse_args()
+
+    data_type = send_data.infer_data_type(args.file)
+    if data_type is None:
+        parser.error("o nome do arquivo deve começar com EXP_ ou IMP_")
+
+    workdir = tempfile.mkdtemp(prefix='bench_stream_load_')
+    site_dir = os.path.join(workdir, 'site')
+    # Processos novos (spawn), para que o pico de memória de uma carga não afete a outra
+    context = multiprocessing.get_context('spawn')
+    try:
+        csv_name, zip_name, gz_name = make_site(site_dir, args.file)
+        sizes = {name: os.path.getsize(os.path.join(site_dir, name)) for name in (csv_name, zip_name, gz_name)}
+        print(', '.join(f"{name}: {size / 2**20:.1f} MB" for name, size in sizes.items()))
+
+        rate_limit = args.rate_limit * 2**20 if args.rate_limit else None
+        with local_server.serve(site_dir, rate_limit=rate_limit) as base_url:
+            runs = [
+                ('disco', csv_name),
+                ('fluxo', csv_name),
+                ('fluxo + cópia', csv_name),
+                ('fluxo', zip_name),
+                ('fluxo', gz_name),
+            ]
+            print(f"{'carga':16} {'arquivo':18} {'tempo':>9} {'pico RSS':>10} {'disco':>10} {'registros':>10}")
+            results = []
+            for mode, name in runs:
+                scratch_db.create_database(BENCH_DATABASE)
+                with context.Pool(1) as pool:
+                    result = pool.apply(run_load, (mode, f"{base_url}/{name}", data_type, workdir))
+                results.append(result)
+                print(f"{mode:16} {name:18} {result['elapsed']:8.2f}s {result['peak_rss']:8.0f}MB "
+                      f"{result['disk'] / 2**20:8.1f}MB {result['rows']:10d}")
+
+        if len({(result['rows'], result['sum']) for result in results}) != 1:
+            raise AssertionError("As cargas não resultaram nos mesmos registros")
+        print("Mesma contagem e soma de VL_FOB em todas as cargas.")
+    finally:
+        scratch_db.drop_database(BENCH_DATABASE)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+"""
+Conjunto de benchmarks da carga, do enriquecimento NCM e das consultas do
+dashboard sobre dados sintéticos (benchmarks/synthetic_data.py), em um banco de
+dados descartável. Cada etapa roda em um processo próprio, na ordem abaixo (cada
+uma depende do estado deixado pela anterior), e informa o tempo e o pico de
+memória do processo:
+- read_csv: send_data.read_csv de cada arquivo EXP/IMP;
+- insert_data: send_data.insert_data de cada arquivo em tabelas vazias;
+- check_existing_data: send_data.check_existing_data de cada arquivo já carregado
+  (a verificação em Python, que lê a tabela inteira: evite em escalas grandes);
+- update_table_with_ncm: ncm_data.update_table_with_ncm nas duas tabelas;
+- rollup: rollup.rebuild dos dois fluxos;
+- get_top_exportacoes, get_top_importacoes e get_top_exportacoes_mes: a consulta
+  de cada visualização do dashboard para alguns estados, nas tabelas de dados e
+  (com o sufixo [resumo]) na tabela de resumo.
+O resultado é gravado em um relatório JSON, que pode ser comparado com o de uma
+execução anterior: o código de saída é 1 se alguma etapa ficar mais lenta (ou usar
+mais memória) que o limite.
+
+Uso: python -m benchmarks.bench_suite --rows 1000000 --output atual.json [--baseline anterior.json]
+     python -m benchmarks.bench_suite --compare anterior.json atual.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import psycopg2
+
+import csv_reader
+import dashboard_queries
+import data_version
+import ncm_data
+import query_backend
+import rollup
+import send_data
+from benchmarks import scratch_db, synthetic_data
+
+# Banco de dados criado para os benchmarks e removido ao final
+BENCH_DATABASE = 'bench_suite'
+
+# Consultas do dashboard: função do dashboard.py, fluxo e, na visualização mensal, os meses
+DASHBOARD_QUERIES = {
+    'get_top_exportacoes': ('E', None),
+    'get_top_importacoes': ('I', None),
+    'get_top_exportacoes_mes': ('E', list(range(1, 13))),
+}
+
+# Etapas, na ordem de execução
+STAGES = (
+    ['read_csv', 'insert_data', 'check_existing_data', 'update_table_with_ncm', 'rollup']
+    + list(DASHBOARD_QUERIES) + [f'{name}[resumo]' for name in DASHBOARD_QUERIES]
+)
+
+# Estados consultados em cada consulta do dashboard, além de "Todos" (os de mais registros)
+QUERY_STATES = 5
+
+# Execuções de cada consulta por estado (vale a mais rápida)
+QUERY_REPEAT = 5
+
+# Execuções do conjunto inteiro, cada uma em um banco novo; em cada etapa vale a
+# execução de tempo mediano, menos sujeita ao ruído da máquina que uma execução isolada
+RUNS = 3
+
+# Aumento relativo tolerado antes de uma etapa ser considerada uma regressão
+TIME_THRESHOLD = 0.15
+RSS_THRESHOLD = 0.10
+
+# Diferenças absolutas abaixo destas são ignoradas (ruído de medição)
+TIME_SLACK_SECONDS = 0.02
+RSS_SLACK_MB = 10
+
+# Versão do formato do relatório
+REPORT_VERSION = 1
+
+
+def find_trade_files(data_dir):
+    """Arquivos EXP/IMP do diretório, com o fluxo de cada um"""
+    files = []
+    for path in sorted(glob.glob(os.path.join(data_dir, '*.csv'))):
+        data_type = send_data.infer_data_type(path)
+        if data_type:
+            files.append((path, data_type))
+    return files
+
+
+def count_file_rows(path):
+    """Quantidade de linhas de dados do arquivo (sem o cabeçalho)"""
+    with open(path, 'rb') as file:
+        return sum(block.count(b'\n') for block in iter(lambda: file.read(1024 * 1024), b'')) - 1
+
+
+def get_years(files):
+    return sorted({int(os.path.splitext(os.path.basename(path))[0].split('_')[1]) for path, _ in files})
+
+
+def stage_read_csv(conn, files, repeat):
+    rows = 0
+    seconds = 0.0
+    for path, _ in files:
+        start = time.perf_counter()
+        df = send_data.read_csv(path)
+        seconds += time.perf_counter() - start
+        rows += len(df)
+        del df
+    return {'seconds': seconds, 'rows': rows}
+
+
+def stage_insert_data(conn, files, repeat):
+    data_version.create_data_version_table(conn)
+    rows = 0
+    seconds = 0.0
+    created = set()
+    for path, data_type in files:
+        df = send_data.read_csv(path)
+        if data_type not in created:
+            send_data.create_table(conn, df, data_type)
+            created.add(data_type)
+        start = time.perf_counter()
+        inserted = send_data.insert_data(conn, df, data_type)
+        seconds += time.perf_counter() - start
+        if inserted is None:
+            raise RuntimeError(f"Falha ao inserir {path}")
+        rows += inserted
+        del df
+    return {'seconds': seconds, 'rows': rows}
+
+
+def stage_check_existing_data(conn, files, repeat):
+    rows = 0
+    seconds = 0.0
+    for path, data_type in files:
+        df = send_data.read_csv(path)
+        start = time.perf_counter()
+        send_data.check_existing_data(conn, df, data_type)
+        seconds += time.perf_counter() - start
+        rows += len(df)
+        del df
+    return {'seconds': seconds, 'rows': rows}
+
+
+def stage_update_table_with_ncm(conn, files, repeat):
+    ncm_mapping = ncm_data.read_ncm_mapping(os.path.join(os.path.dirname(files[0][0]), 'NCM.csv'))
+    ncm_data.create_ncm_tables(conn)
+    ncm_data.load_ncm_dimension(conn, ncm_mapping)
+    start = time.perf_counter()
+    for table_name in rollup.FLOW_TABLES.values():
+        ncm_data.update_table_with_ncm(conn, table_name)
+    seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'rows': count_rows(conn, 'WHERE no_ncm_por IS NOT NULL')}
+
+
+def stage_rollup(conn, files, repeat):
+    start = time.perf_counter()
+    for flow in rollup.FLOW_TABLES:
+        rollup.rebuild(conn, flow)
+    return {'seconds': time.perf_counter() - start, 'rows': count_rows(conn)}
+
+
+def count_rows(conn, where=''):
+    with conn.cursor() as cursor:
+        total = 0
+        for table_name in rollup.FLOW_TABLES.values():
+            cursor.execute(f'SELECT count(*) FROM {table_name} {where}')
+            total += cursor.fetchone()[0]
+    return total
+
+
+def stage_dashboard_query(name, use_rollup):
+    """Etapa que mede a consulta de uma visualização do dashboard"""
+    fluxo, meses = DASHBOARD_QUERIES[name]
+
+    def run(conn, files, repeat):
+        years = get_years(files)
+        anos = years[-1:] if meses else years
+        with conn.cursor() as cursor:
+            # Estatísticas atualizadas, para que o plano não dependa do autovacuum
+            cursor.execute("ANALYZE")
+            cursor.execute(
+                'SELECT "SG_UF_NCM" FROM export_data GROUP BY 1 ORDER BY count(*) DESC LIMIT %s', (QUERY_STATES,)
+            )
+            estados = [dashboard_queries.TODOS] + [row[0] for row in cursor.fetchall()]
+        conn.commit()
+
+        backend = query_backend.get_backend('postgres', send_data.DB_CONFIG)
+        latencies = []
+        for estado in estados:
+            # A primeira execução (não medida) traz as páginas da tabela para o cache
+            dashboard_queries.top_produtos(backend, fluxo, anos, meses, estado=estado, use_rollup=use_rollup)
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                dashboard_queries.top_produtos(backend, fluxo, anos, meses, estado=estado, use_rollup=use_rollup)
+                times.append(time.perf_counter() - start)
+            latencies.append(min(times))
+        backend.pool.closeall()
+        return {
+            'seconds': float(np.median(latencies)),
+            'p95_seconds': float(np.percentile(latencies, 95)),
+            'queries': len(estados) * repeat,
+        }
+    return run
+
+
+def get_stage(name):
+    if name.endswith('[resumo]'):
+        return stage_dashboard_query(name[:-len('[resumo]')], use_rollup=True)
+    if name in DASHBOARD_QUERIES:
+        return stage_dashboard_query(name, use_rollup=False)
+    return globals()[f'stage_{name}']
+
+
+def run_stage(name, data_dir, database, repeat):
+    """Executa uma etapa neste processo e imprime o resultado (JSON) na última linha"""
+    # As etapas medem a leitura do CSV, não a do cache em Parquet
+    send_data.USE_PARQUET_CACHE = False
+    send_data.DB_CONFIG = scratch_db.get_config(database)
+    files = find_trade_files(data_dir)
+    conn = psycopg2.connect(**send_data.DB_CONFIG)
+    try:
+        result = get_stage(name)(conn, files, repeat)
+    finally:
+        conn.close()
+    if result.get('rows') and result['seconds']:
+        result['rows_per_second'] = result['rows'] / result['seconds']
+    result['peak_rss_mb'] = csv_reader.peak_rss_mb()
+    print(json.dumps(result))
+
+
+def run_stages(stages, data_dir, database, repeat):
+    """Executa cada etapa em um processo novo, em um banco vazio; retorna {etapa: resultado}"""
+    scratch_db.create_database(database)
+    results = {}
+    for name in stages:
+        process = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_suite', '--stage', name, '--data-dir', data_dir,
+             '--database', database, '--repeat', str(repeat)],
+            capture_output=True, text=True
+        )
+        if process.returncode != 0:
+            print(process.stdout[-2000:], process.stderr[-2000:], sep='\n')
+            raise RuntimeError(f"A etapa {name} falhou")
+        results[name] = json.loads(process.stdout.strip().splitlines()[-1])
+        print_stage(name, results[name])
+    return results
+
+
+def merge_runs(runs):
+    """Em cada etapa, o resultado da execução de tempo mediano, com os tempos de todas as execuções"""
+    merged = {}
+    for name in runs[0]:
+        results = sorted((run[name] for run in runs), key=lambda result: result['seconds'])
+        merged[name] = {
+            **results[len(results) // 2],
+            'peak_rss_mb': float(np.median([result['peak_rss_mb'] for result in results])),
+            'runs': [run[name]['seconds'] for run in runs],
+        }
+    return merged
+
+
+def print_stage(name, result):
+    rate = f"{result['rows_per_second']:>12,.0f} linhas/s" if 'rows_per_second' in result else ' ' * 21
+    print(f"{name:32} {result['seconds']:9.3f}s {rate} {result['peak_rss_mb']:8.0f} MB", flush=True)
+
+
+def get_environment(conn_config):
+    conn = psycopg2.connect(**conn_config)
+    try:
+        server_version = conn.info.server_version
+    finally:
+        conn.close()
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'postgres': server_version,
+        'cpus': os.cpu_count(),
+        'machine': platform.machine(),
+        'git_commit': commit,
+    }
+
+
+def compare_reports(baseline, current, time_threshold=TIME_THRESHOLD, rss_threshold=RSS_THRESHOLD):
+    """
+    Compara as etapas presentes nos dois relatórios. Retorna uma lista de
+    (etapa, métrica, valor anterior, valor atual, variação, regressão?)
+    """
+    comparisons = []
+    for name, result in current['stages'].items():
+        previous = baseline['stages'].get(name)
+        if previous is None:
+            continue
+        for metric, threshold, slack in [
+            ('seconds', time_threshold, TIME_SLACK_SECONDS), ('peak_rss_mb', rss_threshold, RSS_SLACK_MB)
+        ]:
+            old, new = previous[metric], result[metric]
+            change = new / old - 1 if old else 0.0
+            regression = change > threshold and new - old > slack
+            comparisons.append((name, metric, old, new, change, regression))
+    return comparisons
+
+
+def print_comparison(baseline, current, time_threshold=TIME_THRESHOLD, rss_threshold=RSS_THRESHOLD):
+    """Imprime a comparação e retorna a quantidade de regressões"""
+    if baseline.get('rows') != current.get('rows'):
+        print(f"Atenção: os relatórios têm quantidades de registros diferentes "
+              f"({baseline.get('rows')} x {current.get('rows')}); a comparação não é direta.")
+    print(f"{'etapa':32} {'métrica':12} {'anterior':>10} {'atual':>10} {'variação':>9}")
+    comparisons = compare_reports(baseline, current, time_threshold, rss_threshold)
+    for name, metric, old, new, change, regression in comparisons:
+        flag = '  REGRESSÃO' if regression else ''
+        print(f"{name:32} {metric:12} {old:10.3f} {new:10.3f} {change:+8.1%}{flag}")
+    regressions = sum(1 for *_, regression in comparisons if regression)
+    print(f"{regressions} regressões (limites: tempo +{time_threshold:.0%}, memória +{rss_threshold:.0%}).")
+    return regressions
+
+
+def load_report(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks da carga, do enriquecimento e das consultas.")
+    parser.add_argument('--rows', type=int, default=1_000_000, help="total de registros EXP + IMP (padrão: 1000000)")
+    parser.add_argument('--years', type=int, nargs='+', default=[2020, 2021])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', help="diretório dos dados sintéticos (gerados se ainda não existirem; "
+                                           "padrão: um diretório temporário)")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, metavar='ETAPA',
+                        help=f"etapas a executar (padrão: todas; {', '.join(STAGES)})")
+    parser.add_argument('--skip', nargs='+', choices=STAGES, default=[], metavar='ETAPA', help="etapas a não executar")
+    parser.add_argument('--runs', type=int, default=RUNS, help=f"execuções do conjunto (padrão: {RUNS})")
+    parser.add_argument('--repeat', type=int, default=QUERY_REPEAT, help="execuções de cada consulta por estado")
+    parser.add_argument('--output', default='bench_report.json', help="relatório JSON (padrão: bench_report.json)")
+    parser.add_argument('--baseline', help="relatório anterior para comparação")
+    parser.add_argument('--time-threshold', type=float, default=TIME_THRESHOLD)
+    parser.add_argument('--rss-threshold', type=float, default=RSS_THRESHOLD)
+    parser.add_argument('--compare', nargs=2, metavar=('ANTERIOR', 'ATUAL'), help="apenas comparar dois relatórios")
+    parser.add_argument('--stage', help=argparse.SUPPRESS)
+    parser.add_argument('--database', default=BENCH_DATABASE, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        run_stage(args.stage, args.data_dir, args.database, args.repeat)
+        return
+
+    if args.compare:
+        baseline, current = (load_report(path) for path in args.compare)
+        sys.exit(1 if print_comparison(baseline, current, args.time_threshold, args.rss_threshold) else 0)
+
+    stages = [name for name in args.stages if name not in args.skip]
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='bench_suite_')
+    try:
+        names = synthetic_data.get_file_names(args.years)
+        if not all(os.path.exists(os.path.join(data_dir, name)) for name in names):
+            print(f"Gerando {args.rows:,} registros em {data_dir}...", flush=True)
+            synthetic_data.generate(data_dir, args.rows, args.years, args.seed)
+        rows = sum(count_file_rows(path) for path, _ in find_trade_files(data_dir))
+
+        try:
+            runs = []
+            for run in range(1, args.runs + 1):
+                print(f"Execução {run} de {args.runs}", flush=True)
+                runs.append(run_stages(stages, data_dir, args.database, args.repeat))
+            report = {
+                'version': REPORT_VERSION,
+                'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'rows': rows,
+                'years': get_years(find_trade_files(data_dir)),
+                'runs': args.runs,
+                'environment': get_environment(scratch_db.get_config(args.database)),
+                'stages': merge_runs(runs),
+            }
+        finally:
+            scratch_db.drop_database(args.database)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Relatório gravado em {args.output}")
+
+    if args.baseline:
+        regressions = print_comparison(load_report(args.baseline), report, args.time_threshold, args.rss_threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
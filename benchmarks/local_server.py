@@ -0,0 +1,168 @@
+"""
+Servidor HTTP local que substitui o site da balança comercial nos testes e
+benchmarks do download_data.py: serve um diretório com suporte a Range, If-Range,
+ETag/If-None-Match e Last-Modified/If-Modified-Since (o http.server padrão não
+trata Range nem ETag).
+
+Uso: python -m benchmarks.local_server DIRETÓRIO [--port 8000] [--rate-limit 50]
+e COMEXSTAT_BASE_URL=http://localhost:8000 python download_data.py --years 2020-2021
+"""
+
+import argparse
+import email.utils
+import hashlib
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# Bytes enviados por vez
+SEND_CHUNK_SIZE = 256 * 1024
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """SimpleHTTPRequestHandler com respostas parciais e condicionais para arquivos"""
+
+    # Limite de velocidade por conexão, em bytes/s (None = sem limite)
+    rate_limit = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def get_etag(self, stat):
+        return '"' + hashlib.md5(f"{stat.st_size}-{stat.st_mtime_ns}".encode()).hexdigest() + '"'
+
+    def do_HEAD(self):
+        self.send_file(head=True)
+
+    def do_GET(self):
+        try:
+            self.send_file(head=False)
+        except (BrokenPipeError, ConnectionResetError):
+            # Cliente interrompido no meio do arquivo (ex.: teste de retomada)
+            pass
+
+    def send_file(self, head):
+        path = self.translate_path(self.path)
+        if os.path.isfile(os.path.join(path, 'index.html')):
+            # Página de listagem (ex.: base-de-dados-bruta/index.html), também com ETag
+            path = os.path.join(path, 'index.html')
+        if not os.path.isfile(path):
+            # Diretórios (listagens) e arquivos ausentes: comportamento padrão
+            return super().do_HEAD() if head else super().do_GET()
+
+        stat = os.stat(path)
+        etag = self.get_etag(stat)
+        last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+        if self.not_modified(etag, stat.st_mtime):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+            return
+
+        size = stat.st_size
+        start, end = 0, size - 1
+        byte_range = self.get_range(size, etag, last_modified)
+        if byte_range == 'invalid':
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if byte_range:
+            start, end = byte_range
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        self.end_headers()
+        if head:
+            return
+
+        with open(path, 'rb') as file:
+            file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = file.read(min(SEND_CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                self.wfile.write(data)
+                remaining -= len(data)
+                if self.rate_limit:
+                    time.sleep(len(data) / self.rate_limit)
+
+    def not_modified(self, etag, mtime):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(mtime) <= since
+        return False
+
+    def get_range(self, size, etag, last_modified):
+        """(início, fim) do cabeçalho Range, None para o arquivo inteiro ou 'invalid'"""
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', self.headers.get('Range', '').strip())
+        if not match or match.groups() == ('', ''):
+            return None
+        # If-Range de outra versão do arquivo: envia o arquivo inteiro
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range not in (etag, last_modified):
+            return None
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        else:
+            start, end = max(size - int(last), 0), size - 1
+        if start >= size or start > end:
+            return 'invalid'
+        return start, end
+
+
+@contextmanager
+def serve(directory, port=0, rate_limit=None):
+    """Serve `directory` em uma thread durante o bloco; retorna a URL base"""
+    handler = type('Handler', (RangeRequestHandler,), {'rate_limit': rate_limit})
+    server = ThreadingHTTPServer(('127.0.0.1', port), partial(handler, directory=directory))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor HTTP local com Range e ETag.")
+    parser.add_argument('directory')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--rate-limit', type=float, default=None, help="limite por conexão, em MB/s")
+    args = parser.parse_args()
+
+    rate_limit = args.rate_limit * 1024 * 1024 if args.rate_limit else None
+    with serve(args.directory, args.port, rate_limit) as url:
+        print(f"Servindo {os.path.abspath(args.directory)} em {url} (Ctrl+C para encerrar)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""
+Banco de dados descartável para os benchmarks, criado no mesmo servidor de
+send_data.DB_CONFIG, para que as cargas de teste não alterem as tabelas reais.
+"""
+
+import psycopg2
+from psycopg2 import sql
+
+import send_data
+
+
+def get_config(name, db_config=None):
+    """Configuração de conexão com o banco `name`"""
+    return {**(db_config or send_data.DB_CONFIG), 'database': name}
+
+
+def execute_autocommit(query, db_config=None):
+    # CREATE/DROP DATABASE não podem rodar dentro de uma transação
+    conn = psycopg2.connect(**(db_config or send_data.DB_CONFIG))
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(query)
+    finally:
+        conn.close()
+
+
+def create_database(name, db_config=None):
+    """Cria o banco `name` vazio (removendo o anterior, se existir); retorna a configuração de conexão"""
+    drop_database(name, db_config)
+    execute_autocommit(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(name)), db_config)
+    return get_config(name, db_config)
+
+
+def drop_database(name, db_config=None):
+    execute_autocommit(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(name)), db_config)
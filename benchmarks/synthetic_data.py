@@ -0,0 +1,216 @@
+"""
+Gera arquivos EXP_AAAA.csv, IMP_AAAA.csv e NCM.csv sintéticos, no mesmo layout
+dos arquivos do ministério (separador `;`, todos os campos entre aspas, NCM.csv
+em Latin-1), para os benchmarks rodarem em qualquer escala sem baixar os dados:
+- os códigos NCM, países e URFs seguem uma distribuição de Zipf (poucos códigos
+  concentram a maior parte dos registros, como nos dados reais);
+- as UFs e as vias de transporte seguem uma participação aproximada da real;
+- cada NCM tem a sua unidade estatística (CO_UNID), a mesma do NCM.csv;
+- não há registros repetidos na chave única (send_data.KEY_COLUMNS) de cada mês.
+
+Uso: python -m benchmarks.synthetic_data DIRETÓRIO --rows 1000000 [--years 2020 2021]
+"""
+
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# Quantidade de códigos NCM, países e URFs distintos
+NCM_CODES = 10_000
+COUNTRY_CODES = 230
+URF_CODES = 250
+
+# Expoente da distribuição de Zipf da popularidade dos códigos (com 0.8, o NCM mais
+# comum tem cerca de 3% dos registros e os 100 mais comuns, cerca de um terço)
+ZIPF_EXPONENT = 0.8
+
+# Participação aproximada de cada UF nos registros (ND = não declarada)
+UF_WEIGHTS = {
+    'SP': 22, 'MG': 10, 'RJ': 9, 'PR': 8, 'RS': 8, 'SC': 7, 'MT': 4, 'GO': 4, 'BA': 4, 'PA': 3,
+    'ES': 3, 'AM': 3, 'MS': 2, 'PE': 2, 'CE': 1.5, 'MA': 1.5, 'DF': 1, 'RN': 0.8, 'PB': 0.7,
+    'AL': 0.6, 'SE': 0.5, 'PI': 0.5, 'TO': 0.5, 'RO': 0.5, 'AP': 0.2, 'AC': 0.2, 'RR': 0.2, 'ND': 0.5,
+}
+
+# Participação aproximada de cada via de transporte (1 = marítima, 4 = aérea, 7 = rodoviária...)
+VIA_WEIGHTS = {1: 45, 4: 20, 7: 25, 5: 3, 6: 2, 2: 1, 3: 1, 9: 1, 10: 1, 11: 0.5, 13: 0.3, 99: 0.2}
+
+# Unidades estatísticas (CO_UNID); 10 = quilograma líquido, a mais comum
+UNIT_CODES = np.array([10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21])
+UNIT_WEIGHTS = np.array([55, 12, 10, 4, 4, 3, 3, 2, 2, 2, 2, 1], dtype='float64')
+
+# Palavras usadas nas descrições dos produtos (com acentos, para exercitar o Latin-1)
+DESCRIPTION_WORDS = [
+    'Óleos', 'de', 'petróleo', 'minérios', 'ferro', 'soja', 'grãos', 'açúcar', 'café', 'não',
+    'torrado', 'carnes', 'bovinas', 'congeladas', 'peças', 'para', 'veículos', 'automóveis',
+    'máquinas', 'aparelhos', 'elétricos', 'produtos', 'químicos', 'orgânicos', 'fios', 'algodão',
+    'tecidos', 'madeira', 'celulose', 'papel', 'cartão', 'plásticos', 'borracha', 'alumínio',
+    'cobre', 'vidro', 'calçados', 'couros', 'frutas', 'suco', 'laranja', 'milho', 'trigo',
+    'fertilizantes', 'medicamentos', 'instrumentos', 'ópticos', 'outros', 'exceto', 'em', 'bruto',
+]
+
+# Colunas do NCM.csv, na ordem do arquivo do ministério
+NCM_COLUMNS = [
+    'CO_NCM', 'CO_UNID', 'CO_SH6', 'CO_PPE', 'CO_PPI', 'CO_FAT_AGREG', 'CO_CUCI_ITEM', 'CO_CGCE_N3',
+    'CO_SIIT', 'CO_ISIC_CLASSE', 'CO_EXP_SUBSET', 'NO_NCM_POR', 'NO_NCM_ESP', 'NO_NCM_ING',
+]
+
+# Colunas dos arquivos EXP/IMP, na ordem do arquivo do ministério
+TRADE_COLUMNS = [
+    'CO_ANO', 'CO_MES', 'CO_NCM', 'CO_UNID', 'CO_PAIS', 'SG_UF_NCM', 'CO_VIA', 'CO_URF',
+    'QT_ESTAT', 'KG_LIQUIDO', 'VL_FOB',
+]
+
+# Prefixo dos arquivos de cada fluxo
+FLOW_PREFIXES = ['EXP', 'IMP']
+
+
+def zipf_weights(size, exponent=ZIPF_EXPONENT):
+    """Probabilidades 1/posição^expoente, normalizadas"""
+    weights = 1.0 / np.arange(1, size + 1) ** exponent
+    return weights / weights.sum()
+
+
+def normalize(weights):
+    weights = np.asarray(weights, dtype='float64')
+    return weights / weights.sum()
+
+
+class Catalog:
+    """Códigos NCM (com unidade e descrição), países e URFs, com a popularidade de cada um"""
+
+    def __init__(self, seed=0):
+        rng = np.random.default_rng(seed)
+        # Capítulos 01 a 97 (o 77 é reservado); as posições seguintes são aleatórias
+        chapters = np.setdiff1d(np.arange(1, 98), [77])
+        codes = set()
+        while len(codes) < NCM_CODES:
+            chapter = rng.choice(chapters, NCM_CODES)
+            codes.update((chapter * 1_000_000 + rng.integers(1, 1_000_000, NCM_CODES)).tolist())
+        self.ncm_codes = rng.permutation(np.array(sorted(codes)[:NCM_CODES], dtype='int32'))
+        self.ncm_units = rng.choice(UNIT_CODES, NCM_CODES, p=normalize(UNIT_WEIGHTS)).astype('int8')
+        self.ncm_weights = zipf_weights(NCM_CODES)
+        self.ncm_descriptions = [
+            ' '.join(rng.choice(DESCRIPTION_WORDS, rng.integers(4, 16))).capitalize() for _ in range(NCM_CODES)
+        ]
+
+        self.countries = rng.choice(np.arange(1, 1000), COUNTRY_CODES, replace=False).astype('int16')
+        self.country_weights = zipf_weights(COUNTRY_CODES)
+        self.urfs = rng.choice(np.arange(100_000, 1_000_000), URF_CODES, replace=False).astype('int32')
+        self.urf_weights = zipf_weights(URF_CODES)
+        self.ufs = np.array(list(UF_WEIGHTS))
+        self.uf_weights = normalize(list(UF_WEIGHTS.values()))
+        self.vias = np.array(list(VIA_WEIGHTS), dtype='int8')
+        self.via_weights = normalize(list(VIA_WEIGHTS.values()))
+
+    def write_ncm(self, file_path):
+        """Grava o NCM.csv com todas as colunas do arquivo original, em Latin-1"""
+        codes = pd.Series(self.ncm_codes).astype(str).str.zfill(8)
+        df = pd.DataFrame({column: '' for column in NCM_COLUMNS}, index=range(NCM_CODES))
+        df['CO_NCM'] = codes
+        df['CO_UNID'] = self.ncm_units
+        df['CO_SH6'] = codes.str[:6]
+        df['NO_NCM_POR'] = self.ncm_descriptions
+        df['NO_NCM_ESP'] = self.ncm_descriptions
+        df['NO_NCM_ING'] = self.ncm_descriptions
+        df.to_csv(file_path, sep=';', index=False, quoting=csv.QUOTE_ALL, encoding='latin-1')
+
+    def sample_month(self, rng, year, month, rows):
+        """`rows` registros de um mês, sem repetição na chave única"""
+        parts = []
+        seen = np.array([], dtype='int64')
+        missing = rows
+        while missing > 0:
+            # Um pouco a mais que o necessário, para compensar as chaves repetidas
+            size = int(missing * 1.1) + 100
+            ncm = rng.choice(NCM_CODES, size, p=self.ncm_weights)
+            uf = rng.choice(len(self.ufs), size, p=self.uf_weights)
+            country = rng.choice(COUNTRY_CODES, size, p=self.country_weights)
+            via = rng.choice(len(self.vias), size, p=self.via_weights)
+            urf = rng.choice(URF_CODES, size, p=self.urf_weights)
+
+            # Chave única codificada em um inteiro (a unidade é determinada pelo NCM)
+            key = (((ncm.astype('int64') * 32 + uf) * 256 + country) * 16 + via) * 256 + urf
+            key, first = np.unique(key, return_index=True)
+            new = ~np.isin(key, seen)
+            first = np.sort(first[new])[:missing]
+            seen = np.concatenate([seen, key[new]])
+
+            parts.append((ncm[first], uf[first], country[first], via[first], urf[first]))
+            missing -= len(first)
+
+        ncm, uf, country, via, urf = (np.concatenate(columns) for columns in zip(*parts))
+        rows = len(ncm)
+        kg = np.rint(rng.lognormal(7, 2.5, rows)).astype('int64') + 1
+        # Preço por kg, maior para os produtos menos comuns
+        price = rng.lognormal(1.5, 1.2, rows) * (1 + ncm / NCM_CODES)
+        units = self.ncm_units[ncm]
+        quantity = np.where(units == 10, kg, np.rint(kg * rng.lognormal(0, 1, rows)).astype('int64'))
+        return pd.DataFrame({
+            'CO_ANO': year,
+            'CO_MES': month,
+            'CO_NCM': self.ncm_codes[ncm],
+            'CO_UNID': units,
+            'CO_PAIS': self.countries[country],
+            'SG_UF_NCM': self.ufs[uf],
+            'CO_VIA': self.vias[via],
+            'CO_URF': self.urfs[urf],
+            'QT_ESTAT': quantity,
+            'KG_LIQUIDO': kg,
+            'VL_FOB': np.rint(kg * price).astype('int64') + 1,
+        }, columns=TRADE_COLUMNS)
+
+
+def get_file_names(years):
+    """Nomes dos arquivos gerados para os anos informados (EXP/IMP de cada ano e o NCM.csv)"""
+    return [f"{prefix}_{year}.csv" for prefix in FLOW_PREFIXES for year in years] + ['NCM.csv']
+
+
+def generate(output_directory, rows, years=(2020, 2021), seed=0):
+    """
+    Gera `rows` registros no total, divididos igualmente entre os fluxos, anos e meses,
+    um mês por vez (a memória depende do tamanho de um mês, não do total).
+    Retorna {nome do arquivo: quantidade de registros}.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    catalog = Catalog(seed)
+    catalog.write_ncm(os.path.join(output_directory, 'NCM.csv'))
+
+    counts = {'NCM.csv': NCM_CODES}
+    files = len(FLOW_PREFIXES) * len(years)
+    for index, (prefix, year) in enumerate((prefix, year) for prefix in FLOW_PREFIXES for year in years):
+        rng = np.random.default_rng([seed, index])
+        file_rows = rows // files + (1 if index < rows % files else 0)
+        name = f"{prefix}_{year}.csv"
+        with open(os.path.join(output_directory, name), 'w', newline='') as file:
+            file.write(';'.join(f'"{column}"' for column in TRADE_COLUMNS) + '\n')
+            for month in range(1, 13):
+                month_rows = file_rows // 12 + (1 if month <= file_rows % 12 else 0)
+                df = catalog.sample_month(rng, year, month, month_rows)
+                df.to_csv(file, sep=';', index=False, header=False, quoting=csv.QUOTE_ALL)
+        counts[name] = file_rows
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera arquivos EXP/IMP e NCM.csv sintéticos.")
+    parser.add_argument('directory', help="diretório de saída")
+    parser.add_argument('--rows', type=int, default=1_000_000, help="total de registros EXP + IMP (padrão: 1000000)")
+    parser.add_argument('--years', type=int, nargs='+', default=[2020, 2021])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = generate(args.directory, args.rows, args.years, args.seed)
+    elapsed = time.perf_counter() - start
+    for name, rows in counts.items():
+        size = os.path.getsize(os.path.join(args.directory, name))
+        print(f"{name:14} {rows:>12,} registros {size / 2**20:10.1f} MB")
+    print(f"Gerado em {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Codificação de DataFrames no formato binário do COPY do PostgreSQL
+"""
+
+import numpy as np
+import pandas as pd
+
+# Cabeçalho do formato binário: assinatura, flags e tamanho da extensão do cabeçalho
+HEADER = b'PGCOPY\n\xff\r\n\x00' + np.array([0, 0], dtype='>i4').tobytes()
+
+# Marcador de fim dos dados (contagem de campos igual a -1)
+TRAILER = np.array([-1], dtype='>i2').tobytes()
+
+# Tipos do PostgreSQL suportados e a representação binária de cada um
+BINARY_TYPES = {
+    'smallint': '>i2',
+    'integer': '>i4',
+    'bigint': '>i8',
+    'real': '>f4',
+    'double precision': '>f8',
+    'character': 'text',
+    'character varying': 'text',
+    'text': 'text',
+}
+
+# Quantidade de linhas codificadas por vez, para limitar a memória dos índices auxiliares
+ENCODE_BATCH_ROWS = 65536
+
+
+def get_column_types(cursor, table_name):
+    """Retorna um dicionário coluna -> tipo do PostgreSQL (sem modificadores de tamanho)"""
+    cursor.execute("""
+        SELECT attname, format_type(atttypid, NULL)
+        FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+    """, (table_name,))
+    return dict(cursor.fetchall())
+
+
+def supports_binary(df, column_types):
+    """
+    Verifica se todas as colunas do DataFrame têm tipo suportado na tabela de destino
+    e valores representáveis nele (ver fits_type); caso contrário, o COPY em texto é
+    usado e o PostgreSQL rejeita os valores inválidos, como faria sem o formato binário
+    """
+    return all(fits_type(df[col], column_types.get(col)) for col in df.columns)
+
+
+def fits_type(series, pg_type):
+    """
+    Verifica se a coluna pode ser codificada em `pg_type` sem perda: colunas numéricas
+    para tipos numéricos e, nos tipos inteiros, valores dentro dos limites do tipo e
+    sem parte fracionária (colunas float)
+    """
+    fmt = BINARY_TYPES.get(pg_type)
+    if fmt is None:
+        return False
+    if fmt == 'text':
+        return True
+    if series.dtype.kind not in 'iuf':
+        return False
+    if fmt.startswith('>f'):
+        return True
+
+    values = series.dropna()
+    if values.empty:
+        return True
+    if series.dtype.kind == 'f':
+        floats = values.to_numpy(dtype='float64')
+        if not (np.isfinite(floats).all() and (floats == np.floor(floats)).all()):
+            return False
+    limits = np.iinfo(fmt)
+    return limits.min <= values.min() and values.max() <= limits.max
+
+
+def encode_column(series, pg_type, encoding='utf-8'):
+    """
+    Codifica uma coluna. Retorna (tamanhos, dados, inícios):
+    - tamanhos: tamanho de cada campo em int32 (-1 para NULL);
+    - dados: matriz (linhas x largura) para tipos de largura fixa, ou os bytes de
+      todos os textos concatenados;
+    - inícios: posição de cada texto em `dados` (None para largura fixa).
+    Os NaN produzidos por pd.to_numeric(errors='coerce') viram NULL.
+    Textos são codificados em `encoding`, que deve ser o client_encoding da conexão.
+    Valores que não cabem no tipo (ver fits_type) geram ValueError.
+    """
+    fmt = BINARY_TYPES[pg_type]
+    if not fits_type(series, pg_type):
+        raise ValueError(f"Coluna {series.name} com valores não representáveis como {pg_type}")
+    mask = series.isna().to_numpy()
+
+    if fmt != 'text':
+        width = np.dtype(fmt).itemsize
+        if fmt.startswith('>f'):
+            values = series.to_numpy(dtype='float64', na_value=np.nan)
+        else:
+            values = series.to_numpy(dtype='float64' if series.dtype.kind == 'f' else 'int64', na_value=0)
+        data = values.astype(fmt).view(np.uint8).reshape(len(series), width)
+        sizes = np.where(mask, -1, width).astype(np.int32)
+        return sizes, data, None
+
+    # Colunas de texto: cada valor distinto é codificado uma única vez
+    # (UF e unidades têm poucos valores distintos)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        uniques = series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series)
+    encoded = [str(value).encode(encoding) for value in uniques]
+    unique_sizes = np.array([len(value) for value in encoded], dtype=np.int32)
+    unique_starts = np.cumsum(unique_sizes, dtype=np.int64) - unique_sizes
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+    sizes = np.where(mask, -1, unique_sizes[codes] if len(encoded) else -1).astype(np.int32)
+    starts = np.where(mask, 0, unique_starts[codes] if len(encoded) else 0)
+    return sizes, data, starts
+
+
+def _encode_layout(columns, layout, rows):
+    """
+    Codifica as linhas `rows`, que têm o mesmo layout (mesmos tamanhos de campo),
+    como um único array estruturado
+    """
+    fields = [('count', '>i2')]
+    for j, size in enumerate(layout):
+        fields += [(f'len{j}', '>i4'), (f'val{j}', np.uint8, (max(int(size), 0),))]
+    records = np.empty(len(rows), dtype=np.dtype(fields))
+    records['count'] = len(columns)
+    for j, ((sizes, data, starts), size) in enumerate(zip(columns, layout)):
+        records[f'len{j}'] = size
+        if size <= 0:
+            continue
+        if starts is None:
+            records[f'val{j}'] = data[rows]
+        else:
+            records[f'val{j}'] = data[starts[rows][:, None] + np.arange(size)]
+    return records.tobytes()
+
+
+def encode_rows(df, column_types, encoding='utf-8'):
+    """
+    Codifica as linhas do DataFrame (sem cabeçalho e sem marcador de fim).
+    As linhas são agrupadas por layout (posição dos NULL e tamanho dos textos) e
+    cada grupo é codificado de forma vetorizada; a ordem das linhas não é mantida,
+    o que não faz diferença para o COPY.
+    """
+    parts = []
+    for start in range(0, len(df), ENCODE_BATCH_ROWS):
+        batch = df.iloc[start:start + ENCODE_BATCH_ROWS]
+        columns = [encode_column(batch[col], column_types[col], encoding) for col in batch.columns]
+
+        # Cada layout distinto recebe um identificador inteiro (base mista sobre os tamanhos de cada coluna)
+        key = np.zeros(len(batch), dtype=np.int64)
+        for sizes, _, _ in columns:
+            codes, uniques = pd.factorize(sizes)
+            key = key * len(uniques) + codes
+
+        layout_ids, first_rows, inverse = np.unique(key, return_index=True, return_inverse=True)
+        if len(layout_ids) == 1:
+            parts.append(_encode_layout(columns, [sizes[0] for sizes, _, _ in columns], np.arange(len(batch))))
+            continue
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(layout_ids) + 1))
+        for i, row in enumerate(first_rows):
+            layout = [sizes[row] for sizes, _, _ in columns]
+            parts.append(_encode_layout(columns, layout, order[bounds[i]:bounds[i + 1]]))
+    return b''.join(parts)
+
+
+def encode_dataframe(df, column_types, encoding='utf-8'):
+    """Codifica o DataFrame completo no formato binário do COPY"""
+    return HEADER + encode_rows(df, column_types, encoding) + TRAILER
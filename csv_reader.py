@@ -0,0 +1,263 @@
+"""
+Leitura dos arquivos CSV do ministério (EXP_*.csv, IMP_*.csv e NCM.csv)
+"""
+
+import csv
+import os
+
+import chardet
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pa_csv = None
+
+# Usado pelos benchmarks (csv_reader.peak_rss_mb)
+from instrumentation import peak_rss_mb  # noqa: F401
+
+# Tipos das colunas dos arquivos EXP/IMP. Cada código tem um número fixo de dígitos no
+# layout do ministério (CO_MES, CO_UNID e CO_VIA: 2; CO_PAIS: 3; CO_URF: 7; CO_NCM: 8),
+# então o menor tipo que comporta esse número de dígitos é suficiente. Não há colunas
+# decimais: valores e pesos são inteiros e passam de 2^31, por isso ficam em int64.
+# Colunas com campos vazios ou inválidos passam para o tipo inteiro com suporte a nulos
+# (ex.: Int16), o mesmo tratamento de pd.to_numeric(errors='coerce').
+TRADE_DTYPES = {
+    'CO_ANO': 'int16',
+    'CO_MES': 'int8',
+    'CO_NCM': 'int32',
+    'CO_UNID': 'int8',
+    'CO_PAIS': 'int16',
+    'SG_UF_NCM': 'category',
+    'CO_VIA': 'int8',
+    'CO_URF': 'int32',
+    'QT_ESTAT': 'int64',
+    'KG_LIQUIDO': 'int64',
+    'VL_FOB': 'int64',
+    'VL_FRETE': 'int64',
+    'VL_SEGURO': 'int64',
+}
+
+# Tipos das colunas do NCM.csv; CO_NCM é texto para preservar os zeros à esquerda
+NCM_DTYPES = {
+    'CO_NCM': str,
+    'NO_NCM_POR': str,
+}
+
+# Quantidade de bytes lida de cada trecho do arquivo para detectar a codificação
+ENCODING_SAMPLE_SIZE = 256 * 1024
+
+# Quantidade de trechos amostrados (início, meio e fim do arquivo)
+ENCODING_SAMPLE_PARTS = 4
+
+# Codificações já detectadas, por arquivo (caminho, tamanho, data de modificação)
+_encoding_cache = {}
+
+
+def detect_encoding(file_path, sample_size=ENCODING_SAMPLE_SIZE, parts=ENCODING_SAMPLE_PARTS):
+    """
+    Detecta a codificação a partir de trechos espalhados pelo arquivo, sem lê-lo inteiro.
+    O resultado fica em cache enquanto o arquivo não for modificado.
+    """
+    stat = os.stat(file_path)
+    key = (os.path.realpath(file_path), stat.st_size, stat.st_mtime_ns)
+    if key in _encoding_cache:
+        return _encoding_cache[key]
+
+    detector = chardet.UniversalDetector()
+    with open(file_path, 'rb') as f:
+        step = max(stat.st_size // parts, sample_size)
+        for offset in range(0, stat.st_size, step):
+            f.seek(offset)
+            detector.feed(f.read(sample_size))
+            if detector.done:
+                break
+    detector.close()
+
+    encoding = get_detected_encoding(detector)
+    _encoding_cache[key] = encoding
+    return encoding
+
+
+def detect_encoding_bytes(sample):
+    """Detecta a codificação a partir de um trecho já lido (ex.: o início de um download)"""
+    detector = chardet.UniversalDetector()
+    detector.feed(sample)
+    detector.close()
+    return get_detected_encoding(detector)
+
+
+def get_detected_encoding(detector):
+    encoding = detector.result['encoding']
+    # Uma amostra só com ASCII não diz nada sobre o resto do arquivo; os arquivos
+    # do ministério são publicados em Latin-1, que decodifica qualquer byte
+    if encoding is None or encoding.lower() == 'ascii':
+        encoding = 'latin-1'
+    return encoding
+
+
+def get_dtypes(dtype, usecols=None):
+    """Filtra o mapa de tipos para as colunas lidas (None = TRADE_DTYPES)"""
+    dtype = TRADE_DTYPES if dtype is None else dtype
+    if usecols is None:
+        return dict(dtype)
+    return {col: col_type for col, col_type in dtype.items() if col in usecols}
+
+
+def is_integer_type(col_type):
+    return isinstance(col_type, str) and col_type.startswith('int')
+
+
+def coerce_integer_columns(df, dtypes):
+    """
+    Converte as colunas inteiras lidas sem tipo explícito: campos vazios ou inválidos
+    viram nulos e a coluna usa o tipo inteiro com suporte a nulos correspondente.
+    """
+    for col, col_type in dtypes.items():
+        if col not in df.columns or not is_integer_type(col_type) or df[col].dtype == col_type:
+            continue
+        values = pd.to_numeric(df[col], errors='coerce')
+        if values.isna().any():
+            df[col] = values.astype(col_type.capitalize())
+        else:
+            df[col] = values.astype(col_type)
+    return df
+
+
+def get_fallback_dtypes(dtypes):
+    """Mapa de tipos sem as colunas inteiras, usado quando a leitura direta falha"""
+    return {col: col_type for col, col_type in dtypes.items() if not is_integer_type(col_type)}
+
+
+def read_csv(file_path, dtype=None, usecols=None, engine='c', nrows=None, encoding=None):
+    """
+    Lê o arquivo inteiro com os tipos de `dtype` (padrão: TRADE_DTYPES), apenas
+    com as colunas de `usecols`. engine='pyarrow' usa o leitor de CSV do pyarrow.
+    """
+    encoding = encoding or detect_encoding(file_path)
+    dtypes = get_dtypes(dtype, usecols)
+
+    if engine == 'pyarrow' and nrows is None:
+        require_pyarrow()
+        try:
+            table = _open_arrow(file_path, dtypes, usecols, encoding, block_size=None, incremental=False)
+            # self_destruct libera cada coluna do Arrow assim que é convertida,
+            # evitando manter as duas cópias dos dados em memória
+            return coerce_integer_columns(table.to_pandas(self_destruct=True, split_blocks=True), dtypes)
+        except pa.ArrowInvalid:
+            # Valores inválidos: a leitura pelo pandas converte-os em nulos
+            pass
+
+    options = dict(sep=';', quotechar='"', quoting=csv.QUOTE_MINIMAL, usecols=usecols, nrows=nrows,
+                   encoding=encoding)
+    try:
+        return pd.read_csv(file_path, dtype=dtypes, **options)
+    except ValueError:
+        # Campos vazios ou inválidos em colunas inteiras
+        df = pd.read_csv(file_path, dtype=get_fallback_dtypes(dtypes), **options)
+        return coerce_integer_columns(df, dtypes)
+
+
+def read_csv_chunks(file_path, chunksize, dtype=None, usecols=None, engine='c', encoding=None):
+    """
+    Lê o arquivo em blocos de `chunksize` linhas. Com engine='pyarrow', os blocos
+    são os lotes do leitor incremental do pyarrow e têm tamanho aproximado.
+    """
+    encoding = encoding or detect_encoding(file_path)
+    dtypes = get_dtypes(dtype, usecols)
+
+    rows = 0
+    if engine == 'pyarrow':
+        require_pyarrow()
+        try:
+            reader = _open_arrow(file_path, dtypes, usecols, encoding, block_size=max(chunksize * 64, 1 << 20),
+                                 incremental=True)
+            for batch in reader:
+                rows += batch.num_rows
+                yield coerce_integer_columns(batch.to_pandas(), dtypes)
+            return
+        except pa.ArrowInvalid:
+            # Valores inválidos: o restante do arquivo é lido pelo pandas
+            pass
+
+    # As linhas já entregues são puladas quando a leitura recomeça após uma falha
+    options = dict(sep=';', quotechar='"', quoting=csv.QUOTE_MINIMAL, usecols=usecols, chunksize=chunksize,
+                   encoding=encoding)
+    try:
+        with pd.read_csv(file_path, dtype=dtypes, skiprows=range(1, rows + 1), **options) as reader:
+            for chunk in reader:
+                rows += len(chunk)
+                yield chunk
+        return
+    except ValueError:
+        # Campos vazios ou inválidos em colunas inteiras: o restante do arquivo é
+        # lido novamente sem os tipos inteiros, a partir da primeira linha ainda não entregue
+        pass
+
+    with pd.read_csv(file_path, dtype=get_fallback_dtypes(dtypes), skiprows=range(1, rows + 1), **options) as reader:
+        for chunk in reader:
+            yield coerce_integer_columns(chunk, dtypes)
+
+
+def read_csv_stream(stream, chunksize, dtype=None, usecols=None, encoding='latin-1'):
+    """
+    Lê em blocos de `chunksize` linhas um arquivo recebido como fluxo de bytes (ex.:
+    a resposta HTTP descompactada), que não pode ser relido. As colunas inteiras são
+    lidas sem tipo explícito e convertidas em cada bloco, com o mesmo resultado da
+    leitura de contingência de read_csv_chunks.
+    """
+    dtypes = get_dtypes(dtype, usecols)
+    options = dict(sep=';', quotechar='"', quoting=csv.QUOTE_MINIMAL, usecols=usecols, chunksize=chunksize,
+                   encoding=encoding)
+    with pd.read_csv(stream, dtype=get_fallback_dtypes(dtypes), **options) as reader:
+        for chunk in reader:
+            yield coerce_integer_columns(chunk, dtypes)
+
+
+def read_csv_bytes(data, columns, dtype=None, encoding='latin-1'):
+    """Lê um trecho do arquivo (sem cabeçalho) já carregado em memória"""
+    dtypes = get_dtypes(dtype, columns)
+    options = dict(sep=';', quotechar='"', quoting=csv.QUOTE_MINIMAL, header=None, names=columns,
+                   encoding=encoding)
+    try:
+        return pd.read_csv(data, dtype=dtypes, **options)
+    except ValueError:
+        data.seek(0)
+        return coerce_integer_columns(pd.read_csv(data, dtype=get_fallback_dtypes(dtypes), **options), dtypes)
+
+
+def read_header(file_path, encoding=None):
+    """Retorna a lista de colunas do arquivo"""
+    encoding = encoding or detect_encoding(file_path)
+    return pd.read_csv(file_path, sep=';', quotechar='"', nrows=0, encoding=encoding).columns.tolist()
+
+
+def require_pyarrow():
+    # Verificado antes dos blocos try, que capturam pa.ArrowInvalid
+    if pa_csv is None:
+        raise ImportError("O leitor 'pyarrow' exige o pacote pyarrow instalado")
+
+
+def _open_arrow(file_path, dtypes, usecols, encoding, block_size, incremental):
+    """Abre o arquivo com o leitor de CSV do pyarrow (inteiro ou em lotes)"""
+    column_types = {}
+    for col, col_type in dtypes.items():
+        if is_integer_type(col_type):
+            column_types[col] = getattr(pa, col_type)()
+        elif col_type == 'category':
+            column_types[col] = pa.dictionary(pa.int32(), pa.string())
+        else:
+            column_types[col] = pa.string()
+
+    read_options = pa_csv.ReadOptions(encoding=encoding)
+    if block_size:
+        # Cada linha dos arquivos EXP/IMP tem cerca de 60 bytes
+        read_options.block_size = block_size
+    parse_options = pa_csv.ParseOptions(delimiter=';', quote_char='"')
+    convert_options = pa_csv.ConvertOptions(column_types=column_types, include_columns=usecols)
+
+    open_func = pa_csv.open_csv if incremental else pa_csv.read_csv
+    return open_func(file_path, read_options=read_options, parse_options=parse_options,
+                     convert_options=convert_options)
@@ -1,10 +1,18 @@
+import os
+import threading
+import time
+
 import streamlit as st
 import pandas as pd
-import psycopg2
 import altair as alt
 import plotly.express as px
 import plotly.graph_objects as go
-from psycopg2 import sql
+
+import dashboard_queries
+import data_version
+import instrumentation
+import olap_cache
+import query_backend
 
 # Configurações do PostgreSQL (mesmas usadas no send_data.py)
 DB_CONFIG = {
@@ -14,261 +22,377 @@ DB_CONFIG = {
     'password': 'admin'
 }
 
-# Função para conectar ao banco de dados
+# Anos e meses exibidos no dashboard
+ANOS = [2020, 2021]
+MESES = list(range(1, 13))
+
+# True carrega o ranking de todos os estados em uma única consulta por aba (a troca de
+# estado deixa de gerar consultas, mas a primeira leitura é bem mais pesada);
+# False consulta apenas o estado selecionado, com uma consulta por aba
+RANKING_TODOS_ESTADOS = False
+
+# Intervalo (em segundos) entre as verificações da geração dos dados (data_version.py);
+# os resultados em cache são guardados por geração, então uma carga nova é vista
+# no máximo depois desse intervalo
+DATA_VERSION_TTL = 5
+
+# Quantidade máxima de resultados guardados por função em cache (os menos usados
+# recentemente são descartados primeiro)
+CACHE_MAX_ENTRIES = 256
+
+# True carrega os totais por ano, mês, UF e produto em memória (olap_cache.py) uma
+# única vez, compartilhados entre as sessões, e calcula os rankings localmente;
+# False consulta o banco a cada troca de filtro
+USE_OLAP_CACHE = True
+
+# Fluxo, anos e meses de cada aba, com o ranking de todos os estados pré-calculado no cubo
+TAB_VIEWS = [('E', ANOS, None), ('I', ANOS, None), ('E', [2021], MESES)]
+
+# Nome dos meses na visualização mensal
+NOMES_MESES = {
+    1: "Janeiro", 2: "Fevereiro", 3: "Março", 4: "Abril",
+    5: "Maio", 6: "Junho", 7: "Julho", 8: "Agosto",
+    9: "Setembro", 10: "Outubro", 11: "Novembro", 12: "Dezembro"
+}
+
+# True exibe, abaixo da visualização, o tempo entre a interação (troca de filtro ou de
+# visualização) e a página pronta (ativado, com o painel de diagnóstico, pela variável
+# de ambiente DASHBOARD_DIAGNOSTICS=1)
+SHOW_RENDER_TIME = os.environ.get('DASHBOARD_DIAGNOSTICS') == '1'
+
+# True permite abrir, pela barra lateral, o painel de diagnóstico da visualização: tempo
+# e origem de cada leitura de ranking (acerto ou falha do cache), as consultas SQL
+# executadas e os planos de execução (EXPLAIN ANALYZE) das consultas por trás dela
+# (ativado pela variável de ambiente DASHBOARD_DIAGNOSTICS=1)
+SHOW_DIAGNOSTICS = os.environ.get('DASHBOARD_DIAGNOSTICS') == '1'
+
+# Função para conectar ao backend de consultas configurado em query_backend.BACKEND
+# (PostgreSQL, com um pool de conexões compartilhado entre as sessões, ou DuckDB
+# sobre os arquivos locais)
 @st.cache_resource
 def get_connection():
-    return psycopg2.connect(**DB_CONFIG)
+    return query_backend.get_backend(query_backend.BACKEND, DB_CONFIG)
+
+# Função para obter a geração atual dos dados; muda a cada carga, enriquecimento NCM
+# ou atualização da tabela de resumo
+@st.cache_data(ttl=DATA_VERSION_TTL)
+def get_data_version():
+    return data_version.get_version(get_connection())
 
 # Função para executar consultas SQL e retornar os resultados como DataFrame
-@st.cache_data
-def run_query(query):
-    conn = get_connection()
+# (em cache por consulta, parâmetros e geração dos dados)
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def run_query(query, params=None, version=None):
+    backend = get_connection()
     try:
-        return pd.read_sql_query(query, conn)
+        return backend.query(query, params)
     except Exception as e:
         st.error(f"Erro ao executar consulta: {e}")
         return pd.DataFrame()
 
-# Função para obter a lista de estados disponíveis no banco
-@st.cache_data
-def get_estados():
-    query = """
-    SELECT DISTINCT "SG_UF_NCM" 
-    FROM export_data
-    WHERE "SG_UF_NCM" IS NOT NULL
-    ORDER BY "SG_UF_NCM"
-    """
-    df = run_query(query)
+# Função para obter os fluxos que podem ser consultados na tabela de resumo; os demais
+# (ou tudo, se o resumo não existir ou estiver desatualizado) usam as tabelas de dados
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def get_rollup_flows(version):
+    return dashboard_queries.get_rollup_flows(get_connection())
+
+# Função para carregar o cubo em memória; uma nova geração dos dados gera um novo
+# cubo, e o anterior é descartado (max_entries=1)
+@st.cache_resource(max_entries=1)
+def get_cube(version):
+    cube = olap_cache.load_cube(get_connection(), ANOS, get_rollup_flows(version))
+    cube.precompute(TAB_VIEWS)
+    return cube
+
+# Função para obter a lista de estados disponíveis no banco (em cache por geração dos dados)
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def get_estados(version):
+    if USE_OLAP_CACHE:
+        return ["Todos"] + get_cube(version).get_estados('E')
+    use_rollup = dashboard_queries.can_use_rollup(get_rollup_flows(version), 'E')
+    df = run_query(dashboard_queries.build_estados_query(use_rollup), version=version)
     estados = df["SG_UF_NCM"].tolist()
     # Adicionar a opção "Todos" no início da lista
     estados.insert(0, "Todos")
     return estados
 
+# Função para obter o ranking de uma aba de TAB_VIEWS (estado=None traz todos os estados);
+# cada aba tem a sua consulta em cache, executada apenas quando a aba é exibida
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def get_ranking(fluxo, anos, meses, estado, version):
+    use_rollup = dashboard_queries.can_use_rollup(get_rollup_flows(version), fluxo)
+    query, params = dashboard_queries.build_top_produtos_query(
+        fluxo, anos, meses, estado=estado, use_rollup=use_rollup
+    )
+    try:
+        return get_connection().query(query, params)
+    except Exception as e:
+        st.error(f"Erro ao executar consulta: {e}")
+        return pd.DataFrame()
+
+# Função para obter o ranking de uma aba; a consulta (em cache) é a mesma para todos os
+# anos e meses da aba, então cada aba faz uma única leitura da tabela
+def get_ranking_aba(fluxo, anos, meses, estado):
+    version = get_data_version()
+    start = time.perf_counter()
+    # Consultas executadas nesta leitura (nenhuma quando o resultado já estava em cache)
+    with instrumentation.collect() as consultas:
+        if USE_OLAP_CACHE:
+            df = get_cube(version).top_k(fluxo, anos, meses, estado=estado)
+        else:
+            df = get_ranking(fluxo, anos, meses, None if RANKING_TODOS_ESTADOS else estado, version)
+
+    leituras = st.session_state.get('diagnostico_leituras')
+    if leituras is not None:
+        leituras.append({
+            'aba': (fluxo, tuple(anos), tuple(meses) if meses else None),
+            'fluxo': fluxo,
+            'anos': ', '.join(map(str, anos)),
+            'mês a mês': bool(meses),
+            'origem': "cubo em memória" if USE_OLAP_CACHE else "consulta SQL",
+            'cache': "falha" if consultas else "acerto",
+            'tempo (ms)': (time.perf_counter() - start) * 1000,
+            'consultas': consultas,
+        })
+    return df
+
+# Função para pré-carregar os caches de uma geração dos dados: o cubo (com os rankings
+# de todas as abas) ou, sem o cubo, os rankings de cada estado em cada aba
+def prewarm(version):
+    estados = get_estados(version)
+    if not USE_OLAP_CACHE:
+        for estado in ([None] if RANKING_TODOS_ESTADOS else estados):
+            for fluxo, anos, meses in TAB_VIEWS:
+                get_ranking(fluxo, anos, meses, estado, version)
+
+# Função executada em segundo plano: a cada mudança da geração dos dados (ao final de
+# uma carga), pré-carrega os caches antes que algum usuário os peça
+def watch_data_version():
+    last_version = None
+    while True:
+        try:
+            version = data_version.get_version(get_connection())
+            if version != last_version:
+                prewarm(version)
+                last_version = version
+        except Exception as e:
+            print(f"Erro ao pré-carregar os caches: {e}")
+        time.sleep(DATA_VERSION_TTL)
+
+# Função para iniciar a thread de pré-carregamento uma única vez por processo
+@st.cache_resource
+def start_prewarm_thread():
+    thread = threading.Thread(target=watch_data_version, name='prewarm', daemon=True)
+    thread.start()
+    return thread
+
 # Função para obter top 3 produtos exportados por estado nos anos 2020 e 2021
 def get_top_exportacoes(estado, ano):
-    # Condição WHERE para estados específicos ou para todos
-    where_estado = f"\"SG_UF_NCM\" = '{estado}'" if estado != "Todos" else "1=1"
-    
-    query = f"""
-    SELECT no_ncm_por as produto, 
-           SUM("KG_LIQUIDO") as quantidade_total
-    FROM export_data
-    WHERE {where_estado}
-      AND "CO_ANO" = {ano}
-      AND no_ncm_por IS NOT NULL
-    GROUP BY no_ncm_por
-    ORDER BY quantidade_total DESC
-    LIMIT 3
-    """
-    return run_query(query)
+    return dashboard_queries.select_ranking(get_ranking_aba('E', ANOS, None, estado), estado, ano=ano)
 
 # Função para obter top 3 produtos importados por estado nos anos 2020 e 2021
 def get_top_importacoes(estado, ano):
-    # Condição WHERE para estados específicos ou para todos
-    where_estado = f"\"SG_UF_NCM\" = '{estado}'" if estado != "Todos" else "1=1"
-    
-    query = f"""
-    SELECT no_ncm_por as produto,
-           SUM("KG_LIQUIDO") as quantidade_total
-    FROM import_data
-    WHERE {where_estado}
-      AND "CO_ANO" = {ano}
-      AND no_ncm_por IS NOT NULL
-    GROUP BY no_ncm_por
-    ORDER BY quantidade_total DESC
-    LIMIT 3
-    """
-    return run_query(query)
+    return dashboard_queries.select_ranking(get_ranking_aba('I', ANOS, None, estado), estado, ano=ano)
 
 # Função para obter top 3 produtos exportados por estado em cada mês de 2021
 def get_top_exportacoes_mes(estado, mes):
-    # Condição WHERE para estados específicos ou para todos
-    where_estado = f"\"SG_UF_NCM\" = '{estado}'" if estado != "Todos" else "1=1"
-    
-    query = f"""
-    SELECT no_ncm_por as produto, 
-           SUM("KG_LIQUIDO") as quantidade_total
-    FROM export_data
-    WHERE {where_estado}
-      AND "CO_ANO" = 2021
-      AND "CO_MES" = {mes}
-      AND no_ncm_por IS NOT NULL
-    GROUP BY no_ncm_por
-    ORDER BY quantidade_total DESC
-    LIMIT 3
-    """
-    return run_query(query)
+    return dashboard_queries.select_ranking(get_ranking_aba('E', [2021], MESES, estado), estado, ano=2021, mes=mes)
+
+# Função para criar o gráfico de barras de um ranking; o mesmo ranking e título
+# reaproveitam a figura já criada, entre execuções e sessões
+@st.cache_resource(max_entries=CACHE_MAX_ENTRIES)
+def get_bar_chart(df, titulo):
+    fig = px.bar(
+        df,
+        x='produto',
+        y='quantidade_total',
+        title=titulo,
+        labels={"quantidade_total": "Quantidade (KG)", "produto": ""},
+        text_auto=True
+    )
+    fig.update_layout(height=400)
+    return fig
+
+# Função para exibir o top 3 de um fluxo em 2020 e 2021, um ano por coluna
+def render_anual(estado, get_top, titulo, descricao):
+    st.header(f"Top 3 Produtos Mais {titulo} - {estado}")
+
+    for col, ano in zip(st.columns(2), ANOS):
+        with col:
+            st.subheader(str(ano))
+            df = get_top(estado, ano)
+
+            if not df.empty:
+                # Gráfico de barras com Plotly
+                fig = get_bar_chart(df, f"Top 3 Produtos {titulo} - {estado} - {ano}")
+                st.plotly_chart(fig, use_container_width=True)
+
+                # Exibindo os dados em formato tabular
+                st.dataframe(
+                    df.style.format({"quantidade_total": "{:,.2f} KG"})
+                )
+            else:
+                st.info(f"Não há dados de {descricao} para {estado} em {ano}.")
+
+# Função para exibir as exportações 2020-2021
+def render_exportacoes(estado):
+    render_anual(estado, get_top_exportacoes, "Exportados", "exportação")
+
+# Função para exibir as importações 2020-2021
+def render_importacoes(estado):
+    render_anual(estado, get_top_importacoes, "Importados", "importação")
+
+# Função para exibir as exportações mensais de 2021
+def render_exportacoes_mensais(estado):
+    st.header(f"Top 3 Produtos Exportados por Mês em 2021 - {estado}")
+
+    # Exibir todos os meses em um grid
+    st.subheader("Visão Geral de Todos os Meses")
+
+    # Criando um layout com 3 colunas
+    cols = st.columns(3)
+
+    for mes in MESES:
+        df_mes = get_top_exportacoes_mes(estado, mes)
+
+        with cols[(mes - 1) % 3]:
+            st.write(f"**{NOMES_MESES[mes]}**")
+
+            if not df_mes.empty:
+                # Mostrando uma tabela simplificada para cada mês
+                st.dataframe(
+                    df_mes.style.format({"quantidade_total": "{:,.2f} KG"})
+                )
+            else:
+                st.info(f"Sem dados")
+
+# Função para capturar os planos de execução das consultas por trás das leituras de
+# ranking da visualização; com o cubo, a consulta de carga do cubo de cada fluxo
+def capture_plans(leituras, estado):
+    rollup_flows = get_rollup_flows(get_data_version())
+    planos = []
+    for fluxo, anos, meses in dict.fromkeys(leitura['aba'] for leitura in leituras):
+        use_rollup = dashboard_queries.can_use_rollup(rollup_flows, fluxo)
+        if USE_OLAP_CACHE:
+            titulo = f"Carga do cubo em memória (fluxo {fluxo})"
+            query, params = dashboard_queries.build_aggregate_query(fluxo, ANOS, use_rollup)
+        else:
+            titulo = f"Ranking (fluxo {fluxo}, anos {', '.join(map(str, anos))}{', mês a mês' if meses else ''})"
+            query, params = dashboard_queries.build_top_produtos_query(
+                fluxo, list(anos), list(meses) if meses else None,
+                estado=None if RANKING_TODOS_ESTADOS else estado, use_rollup=use_rollup
+            )
+        try:
+            planos.append((titulo, dashboard_queries.explain(get_connection(), query, params)))
+        except Exception as e:
+            planos.append((titulo, f"Erro ao capturar o plano: {e}"))
+    return planos
+
+# Função para exibir o painel de diagnóstico da visualização: as leituras de ranking
+# (tempo, origem e acerto do cache), as consultas SQL executadas e, sob demanda, os
+# planos de execução; a captura executa as consultas, então fica atrás de um botão
+def render_diagnostics(view, estado, leituras):
+    with st.expander("Diagnóstico da visualização", expanded=True):
+        acertos = sum(leitura['cache'] == "acerto" for leitura in leituras)
+        st.write(f"**Leituras de ranking:** {len(leituras)} ({acertos} acertos do cache, "
+                 f"{len(leituras) - acertos} falhas)")
+        if leituras:
+            df = pd.DataFrame(leituras)
+            df['consultas SQL'] = df['consultas'].map(len)
+            st.dataframe(
+                df.drop(columns=['aba', 'consultas']).style.format({"tempo (ms)": "{:,.1f}"}),
+                hide_index=True
+            )
+
+        consultas = [consulta for leitura in leituras for consulta in leitura['consultas']]
+        if consultas:
+            st.write("**Consultas SQL executadas**")
+            df = pd.DataFrame(consultas)
+            df['tempo (ms)'] = df['seconds'] * 1000
+            st.dataframe(
+                df[['backend', 'tempo (ms)', 'rows', 'rows_per_second', 'status', 'query_id', 'sql']]
+                .style.format({"tempo (ms)": "{:,.1f}", "rows_per_second": "{:,.0f}"}),
+                hide_index=True
+            )
+
+        if st.button("Capturar planos de execução (EXPLAIN ANALYZE)", disabled=not leituras):
+            st.session_state['diagnostico_planos'] = (view, estado, capture_plans(leituras, estado))
+        planos = st.session_state.get('diagnostico_planos')
+        if planos and planos[:2] == (view, estado):
+            for titulo, plano in planos[2]:
+                st.write(f"**{titulo}**")
+                st.code(plano, language=None)
+
+# Visualizações do dashboard (rótulo e função que a exibe)
+VIEWS = {
+    "Exportações 2020-2021": render_exportacoes,
+    "Importações 2020-2021": render_importacoes,
+    "Exportações Mensais 2021": render_exportacoes_mensais,
+}
+
+# Função para exibir a visualização escolhida; como fragmento, a troca de visualização
+# executa apenas esta função, sem repetir o restante da página
+@st.fragment
+def render_view(estado):
+    # Início da interação: da execução da página ou, em uma troca de visualização, deste fragmento
+    start = st.session_state.pop('render_start', None) or time.perf_counter()
+
+    # Leituras de ranking desta execução, para o painel de diagnóstico
+    diagnostico = SHOW_DIAGNOSTICS and st.session_state.get('diagnostico', False)
+    st.session_state['diagnostico_leituras'] = [] if diagnostico else None
+
+    view = st.radio("Visualização", list(VIEWS), horizontal=True, key='visao', label_visibility='collapsed')
+    VIEWS[view](estado)
+
+    if SHOW_RENDER_TIME:
+        st.caption(f"Visualização montada em {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    if diagnostico:
+        render_diagnostics(view, estado, st.session_state['diagnostico_leituras'])
 
 # Layout do Dashboard
 st.set_page_config(page_title="Desafio SeuBoné", page_icon="📊", layout="wide")
 
+# Nome do dashboard nas métricas das consultas (instrumentation.py)
+instrumentation.set_script('dashboard')
+
+# Início da execução, para medir o tempo até a página ficar interativa
+st.session_state['render_start'] = time.perf_counter()
+
 # Título do Dashboard
 st.title("Dashboard para o Desafio SeuBoné")
 
 # Verificar conexão com o banco
 try:
     conn = get_connection()
-    st.success("Conexão com o banco de dados estabelecida com sucesso!")
+    st.success(f"Conexão com o banco de dados estabelecida com sucesso! (backend: {conn.name})")
 except Exception as e:
     st.error(f"Erro ao conectar ao banco de dados: {e}")
     st.stop()
 
+start_prewarm_thread()
+
 # Barra lateral para filtros
 st.sidebar.header("Filtros")
 
 # Seletor de estados
-estados = get_estados()
+estados = get_estados(get_data_version())
 if not estados:
     st.warning("Não foram encontrados estados nos dados. Verifique se os dados foram carregados corretamente.")
     st.stop()
 
 estado_selecionado = st.sidebar.selectbox("Selecione o estado:", estados)
 
-# Abas para diferentes visualizações
-tab1, tab2, tab3 = st.tabs(["Exportações 2020-2021", "Importações 2020-2021", "Exportações Mensais 2021"])
-
-# Tab 1: Exportações 2020-2021
-with tab1:
-    st.header(f"Top 3 Produtos Mais Exportados - {estado_selecionado}")
-    
-    col1, col2 = st.columns(2)
-    
-    # Dados de 2020
-    with col1:
-        st.subheader("2020")
-        df_exp_2020 = get_top_exportacoes(estado_selecionado, 2020)
-        
-        if not df_exp_2020.empty:
-            # Criando um gráfico de barras com Plotly
-            fig = px.bar(
-                df_exp_2020, 
-                x='produto', 
-                y='quantidade_total',
-                title=f"Top 3 Produtos Exportados - {estado_selecionado} - 2020",
-                labels={"quantidade_total": "Quantidade (KG)", "produto": ""},
-                text_auto=True
-            )
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
-            
-            # Exibindo os dados em formato tabular
-            st.dataframe(
-                df_exp_2020.style.format({"quantidade_total": "{:,.2f} KG"})
-            )
-        else:
-            st.info(f"Não há dados de exportação para {estado_selecionado} em 2020.")
-    
-    # Dados de 2021
-    with col2:
-        st.subheader("2021")
-        df_exp_2021 = get_top_exportacoes(estado_selecionado, 2021)
-        
-        if not df_exp_2021.empty:
-            # Criando um gráfico de barras com Plotly
-            fig = px.bar(
-                df_exp_2021, 
-                x='produto', 
-                y='quantidade_total',
-                title=f"Top 3 Produtos Exportados - {estado_selecionado} - 2021",
-                labels={"quantidade_total": "Quantidade (KG)", "produto": ""},
-                text_auto=True
-            )
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
-            
-            # Exibindo os dados em formato tabular
-            st.dataframe(
-                df_exp_2021.style.format({"quantidade_total": "{:,.2f} KG"})
-            )
-        else:
-            st.info(f"Não há dados de exportação para {estado_selecionado} em 2021.")
-
-# Tab 2: Importações 2020-2021
-with tab2:
-    st.header(f"Top 3 Produtos Mais Importados - {estado_selecionado}")
-    
-    col1, col2 = st.columns(2)
-    
-    # Dados de 2020
-    with col1:
-        st.subheader("2020")
-        df_imp_2020 = get_top_importacoes(estado_selecionado, 2020)
-        
-        if not df_imp_2020.empty:
-            # Criando um gráfico de barras com Plotly
-            fig = px.bar(
-                df_imp_2020, 
-                x='produto', 
-                y='quantidade_total',
-                title=f"Top 3 Produtos Importados - {estado_selecionado} - 2020",
-                labels={"quantidade_total": "Quantidade (KG)", "produto": ""},
-                text_auto=True
-            )
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
-            
-            # Exibindo os dados em formato tabular
-            st.dataframe(
-                df_imp_2020.style.format({"quantidade_total": "{:,.2f} KG"})
-            )
-        else:
-            st.info(f"Não há dados de importação para {estado_selecionado} em 2020.")
-    
-    # Dados de 2021
-    with col2:
-        st.subheader("2021")
-        df_imp_2021 = get_top_importacoes(estado_selecionado, 2021)
-        
-        if not df_imp_2021.empty:
-            # Criando um gráfico de barras com Plotly
-            fig = px.bar(
-                df_imp_2021, 
-                x='produto', 
-                y='quantidade_total',
-                title=f"Top 3 Produtos Importados - {estado_selecionado} - 2021",
-                labels={"quantidade_total": "Quantidade (KG)", "produto": ""},
-                text_auto=True
-            )
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
-            
-            # Exibindo os dados em formato tabular
-            st.dataframe(
-                df_imp_2021.style.format({"quantidade_total": "{:,.2f} KG"})
-            )
-        else:
-            st.info(f"Não há dados de importação para {estado_selecionado} em 2021.")
-
-# Tab 3: Exportações Mensais 2021
-with tab3:
-    st.header(f"Top 3 Produtos Exportados por Mês em 2021 - {estado_selecionado}")
-    
-    nomes_meses = {
-        1: "Janeiro", 2: "Fevereiro", 3: "Março", 4: "Abril",
-        5: "Maio", 6: "Junho", 7: "Julho", 8: "Agosto",
-        9: "Setembro", 10: "Outubro", 11: "Novembro", 12: "Dezembro"
-    }
+if SHOW_DIAGNOSTICS:
+    st.sidebar.toggle("Painel de diagnóstico", key='diagnostico')
 
-    # Exibir todos os meses em um grid
-    st.subheader("Visão Geral de Todos os Meses")
-    
-    # Criando um layout com 3 colunas
-    cols = st.columns(3)
-    
-    for mes in range(1, 13):
-        df_mes = get_top_exportacoes_mes(estado_selecionado, mes)
-        col_index = (mes - 1) % 3
-        
-        with cols[col_index]:
-            st.write(f"**{nomes_meses[mes]}**")
-            
-            if not df_mes.empty:
-                # Mostrando uma tabela simplificada para cada mês
-                st.dataframe(
-                    df_mes.style.format({"quantidade_total": "{:,.2f} KG"})
-                )
-            else:
-                st.info(f"Sem dados")
+if USE_OLAP_CACHE:
+    cube = get_cube(get_data_version())
+    st.sidebar.caption(f"Cache em memória: {cube.rows:,} linhas, {cube.nbytes / 2**20:.1f} MB")
+
+# Seletor da visualização: apenas a visualização escolhida é calculada e desenhada
+# (com st.tabs, todas as abas eram montadas a cada interação)
+render_view(estado_selecionado)
 
 # Rodapé
 st.markdown("---")
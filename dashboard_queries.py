@@ -0,0 +1,216 @@
+"""
+Consultas do dashboard, independentes do Streamlit (usadas também pelos benchmarks).
+As consultas usam parâmetros no formato %(nome)s, aceitos pelos dois backends de
+query_backend.py; apenas nomes de tabelas e colunas, validados, entram no texto SQL.
+"""
+
+import rollup
+
+# Origem da descrição dos produtos: False usa a coluna no_ncm_por preenchida nas
+# tabelas de dados; True faz a junção com a tabela de dimensão ncm
+# (útil quando o ncm_data.py é executado com --no-denormalize)
+USE_NCM_DIMENSION = False
+
+# Tabela de cada fluxo
+FLOW_TABLES = {'E': 'export_data', 'I': 'import_data'}
+
+# Métricas que podem ser usadas no ranking
+METRICS = ['KG_LIQUIDO', 'VL_FOB']
+
+# Valor da coluna estado nas linhas com o total de todos os estados
+TODOS = 'Todos'
+
+# True usa a tabela de resumo (rollup.py) sempre que ela estiver completa para o fluxo
+USE_ROLLUP = True
+
+ESTADOS_QUERY = """
+SELECT DISTINCT "SG_UF_NCM"
+FROM export_data
+WHERE "SG_UF_NCM" IS NOT NULL
+ORDER BY "SG_UF_NCM"
+"""
+
+ESTADOS_ROLLUP_QUERY = f"""
+SELECT DISTINCT "SG_UF_NCM"
+FROM {rollup.ROLLUP_TABLE}
+WHERE flow = 'E' AND "SG_UF_NCM" IS NOT NULL
+ORDER BY "SG_UF_NCM"
+"""
+
+
+def get_produto_source(table):
+    """Retorna a tabela de origem e a coluna de descrição dos produtos"""
+    if USE_NCM_DIMENSION:
+        return f'{table} JOIN ncm ON ncm.co_ncm = {table}."CO_NCM"', "ncm.no_ncm_por"
+    return table, "no_ncm_por"
+
+
+def get_rollup_flows(backend):
+    """
+    Retorna os fluxos que a tabela de resumo pode atender (todos os meses carregados
+    já resumidos). Sem o resumo (ou no DuckDB, que não o possui), retorna uma lista vazia.
+    """
+    if not USE_ROLLUP:
+        return []
+    try:
+        df = backend.query(rollup.COVERAGE_QUERY)
+    except Exception:
+        return []
+    return sorted(df.loc[df['completo'].astype(bool), 'flow'].str.strip())
+
+
+def can_use_rollup(rollup_flows, fluxo, metrica='KG_LIQUIDO'):
+    """Verifica se a consulta pode ser respondida pela tabela de resumo"""
+    return fluxo in rollup_flows and metrica in rollup.ROLLUP_METRICS
+
+
+def build_estados_query(use_rollup=False):
+    return ESTADOS_ROLLUP_QUERY if use_rollup else ESTADOS_QUERY
+
+
+def build_in_clause(column, name, values, params):
+    """Monta `coluna IN (%(nome_0)s, ...)` com um parâmetro por valor"""
+    names = []
+    for i, value in enumerate(values):
+        params[f'{name}_{i}'] = int(value)
+        names.append(f'%({name}_{i})s')
+    return f'{column} IN ({", ".join(names)})'
+
+
+def build_top_produtos_query(fluxo, anos, meses=None, metrica='KG_LIQUIDO', estado=None, n=3, use_rollup=False):
+    """
+    Monta a consulta dos n produtos com maior `metrica` em cada ano (e em cada mês,
+    se `meses` for informado), com uma única leitura da tabela.
+    estado=None traz o ranking de todos os estados de uma vez, mais o total geral
+    (estado = 'Todos'); estado='Todos' traz apenas o total geral; uma UF traz só
+    essa UF.
+    Com use_rollup=True, as somas vêm da tabela de resumo (rollup.py) em vez da
+    tabela de dados; o resultado é o mesmo.
+    Retorna (consulta, parâmetros); as colunas do resultado são estado, ano,
+    [mes,] posicao, produto e total.
+    """
+    if fluxo not in FLOW_TABLES:
+        raise ValueError(f"Fluxo inválido: {fluxo} (use {', '.join(FLOW_TABLES)})")
+    if metrica not in METRICS:
+        raise ValueError(f"Métrica inválida: {metrica} (use {', '.join(METRICS)})")
+
+    params = {'n': int(n)}
+    filters = []
+    if use_rollup:
+        if metrica not in rollup.ROLLUP_METRICS:
+            raise ValueError(f"Métrica {metrica} não está disponível na tabela de resumo")
+        source, produto = get_produto_source(rollup.ROLLUP_TABLE)
+        params['fluxo'] = fluxo
+        filters.append(f'{rollup.ROLLUP_TABLE}.flow = %(fluxo)s')
+    else:
+        source, produto = get_produto_source(FLOW_TABLES[fluxo])
+    filters += [build_in_clause('"CO_ANO"', 'ano', anos, params), f'{produto} IS NOT NULL']
+    periodo = ['"CO_ANO"']
+    periodo_cols = ['ano']
+    if meses is not None:
+        filters.append(build_in_clause('"CO_MES"', 'mes', meses, params))
+        periodo.append('"CO_MES"')
+        periodo_cols.append('mes')
+
+    grupos = ', '.join(periodo + [produto])
+    if estado is None:
+        # Ranking por UF e total geral na mesma leitura
+        estado_expr = f'CASE WHEN GROUPING("SG_UF_NCM") = 1 THEN \'{TODOS}\' ELSE "SG_UF_NCM" END'
+        group_by = f'GROUPING SETS (("SG_UF_NCM", {grupos}), ({grupos}))'
+    elif estado == TODOS:
+        estado_expr = f"'{TODOS}'"
+        group_by = grupos
+    else:
+        params['estado'] = estado
+        filters.append('"SG_UF_NCM" = %(estado)s')
+        estado_expr = '"SG_UF_NCM"'
+        group_by = f'"SG_UF_NCM", {grupos}'
+
+    select_periodo = ', '.join(f'{col} AS {alias}' for col, alias in zip(periodo, periodo_cols))
+    partition = ', '.join(['estado'] + periodo_cols)
+    query = f"""
+    SELECT estado, {', '.join(periodo_cols)}, posicao, produto, total
+    FROM (
+        SELECT estado, {', '.join(periodo_cols)}, produto, total,
+               ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY total DESC, produto) AS posicao
+        FROM (
+            SELECT {estado_expr} AS estado,
+                   {select_periodo},
+                   {produto} AS produto,
+                   SUM("{metrica}") AS total
+            FROM {source}
+            WHERE {' AND '.join(filters)}
+            GROUP BY {group_by}
+        ) totais
+    ) ranking
+    WHERE posicao <= %(n)s
+    ORDER BY {partition}, posicao
+    """
+    return query, params
+
+
+def build_aggregate_query(fluxo, anos, use_rollup=False):
+    """
+    Monta a consulta dos totais de cada métrica por ano, mês, UF e produto, o menor
+    agregado que responde a todos os rankings do dashboard (usada pelo olap_cache.py).
+    A tabela de resumo já está nesse nível, então suas linhas são lidas sem novo
+    agrupamento (um produto pode aparecer em mais de uma linha; quem lê soma).
+    Retorna (consulta, parâmetros); as colunas do resultado são ano, mes, estado,
+    produto e uma coluna por métrica de METRICS.
+    """
+    if fluxo not in FLOW_TABLES:
+        raise ValueError(f"Fluxo inválido: {fluxo} (use {', '.join(FLOW_TABLES)})")
+
+    params = {}
+    filters = []
+    if use_rollup:
+        source, produto = get_produto_source(rollup.ROLLUP_TABLE)
+        params['fluxo'] = fluxo
+        filters.append(f'{rollup.ROLLUP_TABLE}.flow = %(fluxo)s')
+        metrics = ', '.join(f'"{metrica}"::float8 AS "{metrica}"' for metrica in METRICS)
+        group_by = ''
+    else:
+        source, produto = get_produto_source(FLOW_TABLES[fluxo])
+        metrics = ', '.join(f'SUM("{metrica}")::float8 AS "{metrica}"' for metrica in METRICS)
+        group_by = f'GROUP BY "CO_ANO", "CO_MES", "SG_UF_NCM", {produto}'
+    filters += [build_in_clause('"CO_ANO"', 'ano', anos, params), f'{produto} IS NOT NULL']
+
+    query = f"""
+    SELECT "CO_ANO" AS ano, "CO_MES" AS mes, "SG_UF_NCM" AS estado, {produto} AS produto, {metrics}
+    FROM {source}
+    WHERE {' AND '.join(filters)}
+    {group_by}
+    """
+    return query, params
+
+
+def top_produtos(backend, fluxo, anos, meses=None, metrica='KG_LIQUIDO', estado=None, n=3, use_rollup=False):
+    """Executa build_top_produtos_query em um backend de query_backend.py"""
+    return backend.query(*build_top_produtos_query(fluxo, anos, meses, metrica, estado, n, use_rollup))
+
+
+def explain(backend, query, params=None):
+    """
+    Executa a consulta com EXPLAIN ANALYZE e retorna o plano, com os tempos reais de
+    cada nó, como texto. No PostgreSQL usa EXPLAIN (ANALYZE, BUFFERS), que inclui as
+    páginas lidas do cache compartilhado e do disco.
+    """
+    if backend.name == 'duckdb':
+        # Colunas explain_key e explain_value; o plano está na última
+        df = backend.query(f"EXPLAIN ANALYZE {query}", params)
+        return '\n'.join(df.iloc[:, -1].astype(str))
+    df = backend.query(f"EXPLAIN (ANALYZE, BUFFERS) {query}", params)
+    return '\n'.join(df.iloc[:, 0])
+
+
+def select_ranking(df, estado, **periodo):
+    """
+    Filtra o resultado de build_top_produtos_query para um estado e período
+    (ex.: ano=2021, mes=3), no formato das consultas originais (produto, quantidade_total)
+    """
+    if df.empty:
+        return df.reindex(columns=['produto', 'quantidade_total'])
+    mask = df['estado'] == estado
+    for col, value in periodo.items():
+        mask &= df[col] == value
+    return df.loc[mask, ['produto', 'total']].rename(columns={'total': 'quantidade_total'}).reset_index(drop=True)
@@ -0,0 +1,61 @@
+"""
+Versão (contador de geração) dos dados consultados pelo dashboard.
+O send_data.py, o ncm_data.py e o rollup.py incrementam a geração ao alterar os
+dados; o dashboard usa a geração como parte da chave dos seus caches, então um
+resultado em cache nunca sobrevive a uma alteração dos dados.
+"""
+
+from psycopg2 import sql
+
+# Tabela com a geração atual (uma única linha)
+DATA_VERSION_TABLE = 'data_version'
+
+# Consulta da geração atual, executada pelo dashboard em qualquer backend de query_backend.py
+VERSION_QUERY = f"SELECT generation FROM {DATA_VERSION_TABLE}"
+
+
+def create_data_version_table(conn):
+    """Cria a tabela da geração, se ainda não existir, começando em 0"""
+    cursor = conn.cursor()
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            generation BIGINT NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """).format(table=sql.Identifier(DATA_VERSION_TABLE)))
+    cursor.execute(sql.SQL("INSERT INTO {table} (generation) VALUES (0) ON CONFLICT (id) DO NOTHING").format(
+        table=sql.Identifier(DATA_VERSION_TABLE)
+    ))
+    conn.commit()
+    cursor.close()
+
+
+def bump(conn, commit=False):
+    """
+    Incrementa a geração na transação corrente, que passa a valer junto com o
+    commit dos dados (com commit=True, em uma transação própria). Sem a tabela,
+    não faz nada. Retorna a nova geração, ou None.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (DATA_VERSION_TABLE,))
+        if not cursor.fetchone()[0]:
+            return None
+        cursor.execute(sql.SQL(
+            "UPDATE {table} SET generation = generation + 1, updated_at = now() RETURNING generation"
+        ).format(table=sql.Identifier(DATA_VERSION_TABLE)))
+        row = cursor.fetchone()
+        if commit:
+            conn.commit()
+        return row[0] if row else None
+    finally:
+        cursor.close()
+
+
+def get_version(backend):
+    """Geração atual lida por um backend de query_backend.py (0 se a tabela não existir)"""
+    try:
+        return int(backend.query(VERSION_QUERY)['generation'].iloc[0])
+    except Exception:
+        return 0
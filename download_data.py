@@ -1,14 +1,63 @@
 """
 Script para baixar a base de dados
+
+Uso interativo: python download_data.py
+Uso em lote:    python download_data.py --years 2020-2021 [--workers 4]
 """
 
+import argparse
+import hashlib
+import json
 import os
 import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import suppress
+from datetime import datetime, timezone
+
 import requests
 from bs4 import BeautifulSoup
-from datetime import datetime
 from tqdm import tqdm
 
+import instrumentation
+
+# Endereço dos arquivos da balança comercial (pode ser alterado com COMEXSTAT_BASE_URL,
+# por exemplo para um servidor local de testes)
+BASE_URL = os.environ.get('COMEXSTAT_BASE_URL', 'https://balanca.economia.gov.br/balanca/bd')
+
+# Página com os links para os arquivos da base de dados bruta
+LISTING_URL = "https://www.gov.br/mdic/pt-br/assuntos/comercio-exterior/estatisticas/base-de-dados-bruta"
+
+# Caminho (relativo a BASE_URL) dos arquivos de exportação/importação de cada ano e da tabela NCM
+TRADE_FILE_PATH = 'comexstat-bd/ncm/{prefix}_{year}.csv'
+NCM_FILE_PATH = 'tabelas/NCM.csv'
+
+# Prefixos dos arquivos de dados (mesmos do send_data.py)
+FILE_PREFIXES = ['EXP', 'IMP']
+
+# Diretório dos arquivos baixados
+OUTPUT_DIRECTORY = 'src/ncm_data'
+
+# Arquivo, no diretório de saída, com ETag, Last-Modified, tamanho e sha256 de cada arquivo baixado
+METADATA_FILE = '.downloads.json'
+
+# Sufixo do arquivo parcial; só recebe o nome final quando o download termina
+PART_SUFFIX = '.part'
+
+# Quantidade de arquivos baixados em paralelo
+DOWNLOAD_WORKERS = 4
+
+# Tamanho dos blocos lidos da resposta e gravados no disco
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+# Tempo máximo (em segundos) para conectar e entre dois blocos recebidos
+REQUEST_TIMEOUT = (10, 60)
+
+# Tentativas por arquivo; cada nova tentativa continua do arquivo parcial
+MAX_RETRIES = 3
+
 def get_user_year():
     """Permite que o usuário escolha o ano da base de dados."""
     current_year = datetime.now().year
@@ -28,36 +77,272 @@ def get_user_year():
         except ValueError:
             print("Por favor, insira um número válido para o ano.")
 
+class DownloadMetadata:
+    """
+    Metadados dos arquivos baixados (METADATA_FILE), compartilhados entre as threads
+    de download e gravados no disco a cada alteração
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, METADATA_FILE)
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as file:
+                self.entries = json.load(file)
+
+    def get(self, name):
+        with self.lock:
+            return dict(self.entries.get(name, {}))
+
+    def update(self, name, entry):
+        with self.lock:
+            self.entries[name] = entry
+            # Gravação atômica: um processo interrompido não deixa o arquivo pela metade
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(self.entries, file, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+# Uma sessão HTTP (com conexões reaproveitadas) por thread de download
+_local = threading.local()
+
+
+def get_session():
+    if not hasattr(_local, 'session'):
+        _local.session = requests.Session()
+        # Sem compressão, os bytes recebidos (e as faixas do Range) são os do arquivo
+        _local.session.headers['Accept-Encoding'] = 'identity'
+    return _local.session
+
+
+def build_file_urls(years, base_url=BASE_URL, include_ncm=True):
+    """Retorna (url, nome do arquivo) dos arquivos EXP/IMP de cada ano e, se pedido, da tabela NCM"""
+    paths = [TRADE_FILE_PATH.format(prefix=prefix, year=year) for year in years for prefix in FILE_PREFIXES]
+    if include_ncm:
+        paths.append(NCM_FILE_PATH)
+    base_url = base_url.rstrip('/')
+    return [(f"{base_url}/{path}", os.path.basename(path)) for path in paths]
+
+
+def parse_years(values):
+    """Converte ['2020-2021', '2023'] em [2020, 2021, 2023]"""
+    years = set()
+    for value in values:
+        start, _, end = value.partition('-')
+        years.update(range(int(start), int(end or start) + 1))
+    return sorted(years)
+
+
+def get_validator(response):
+    """ETag forte ou, na falta dele, Last-Modified: identifica a versão do arquivo no servidor (If-Range)"""
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
+
+
+def get_range_start(response):
+    """Primeiro byte de uma resposta 206 (Content-Range: bytes INÍCIO-FIM/TOTAL)"""
+    match = re.match(r'bytes (\d+)-', response.headers.get('Content-Range', ''))
+    return int(match.group(1)) if match else None
+
+
+def hash_file(path, hasher=None):
+    hasher = hasher or hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(DOWNLOAD_CHUNK_SIZE), b''):
+            hasher.update(block)
+    return hasher
+
+
+def fetch_file(url, destination, metadata, position=None):
+    """
+    Baixa `url` para `destination` e retorna 'baixado', 'retomado' ou 'inalterado'.
+    - Arquivo já baixado, com o mesmo tamanho dos metadados: requisição condicional
+      (If-None-Match/If-Modified-Since); um 304 não transfere nada.
+    - Arquivo parcial (.part) de um download interrompido: continua do último byte
+      com Range, desde que o arquivo no servidor seja o mesmo (If-Range).
+    Os dados vão para o .part, que só substitui o destino (os.replace) quando completo.
+    """
+    name = os.path.basename(destination)
+    part_path = destination + PART_SUFFIX
+    entry = metadata.get(name)
+    headers = {}
+    offset = 0
+
+    if os.path.exists(part_path) and entry.get('part_validator'):
+        offset = os.path.getsize(part_path)
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = entry['part_validator']
+    elif os.path.exists(destination) and entry.get('size') == os.path.getsize(destination):
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    with get_session().get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+        if response.status_code == 304:
+            return 'inalterado'
+        range_rejected = response.status_code == 416 or (
+            response.status_code == 206 and get_range_start(response) != offset
+        )
+        if range_rejected:
+            if 'Range' not in headers:
+                # Resposta parcial a uma requisição sem Range: nova tentativa em fetch_with_retries
+                raise IOError(f"Resposta {response.status_code} inesperada ao baixar {name}")
+            # Parcial que não corresponde ao servidor: recomeça do zero (o .part pode já
+            # ter sido removido, ex.: por outra execução)
+            with suppress(FileNotFoundError):
+                os.remove(part_path)
+            metadata.update(name, {**entry, 'part_validator': None})
+            return fetch_file(url, destination, metadata, position)
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            status, mode = 'retomado', 'ab'
+            hasher = hash_file(part_path)
+        else:
+            status, mode, offset = 'baixado', 'wb', 0
+            hasher = hashlib.sha256()
+        content_length = response.headers.get('Content-Length')
+        total_size = offset + int(content_length) if content_length else None
+
+        # Versão do arquivo sendo baixada, para retomar o .part em uma próxima execução
+        metadata.update(name, {**entry, 'url': url, 'part_validator': get_validator(response)})
+
+        with instrumentation.stage('download', file=name, result=status) as record:
+            with open(part_path, mode) as file, tqdm(
+                    desc=name,
+                    total=total_size,
+                    initial=offset,
+                    unit='B',
+                    unit_scale=True,
+                    unit_divisor=1024,
+                    position=position,
+                    leave=position is None,
+                ) as bar:
+                for data in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    file.write(data)
+                    hasher.update(data)
+                    bar.update(len(data))
+                    record.add_bytes(len(data))
+
+        size = os.path.getsize(part_path)
+        if total_size is not None and size != total_size:
+            raise IOError(f"Download incompleto de {name}: {size} de {total_size} bytes")
+
+        os.replace(part_path, destination)
+        record_download(metadata, name, url, response, size, hasher.hexdigest())
+        return status
+
+
+def record_download(metadata, name, url, response, size, sha256):
+    """Registra nos metadados um arquivo baixado por completo"""
+    metadata.update(name, {
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'size': size,
+        'sha256': sha256,
+        'downloaded_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    })
+
+
+def fetch_with_retries(url, destination, metadata, position=None, retries=MAX_RETRIES):
+    """fetch_file com novas tentativas após falhas de rede; cada tentativa continua do .part"""
+    for attempt in range(1, retries + 1):
+        try:
+            return fetch_file(url, destination, metadata, position)
+        except requests.HTTPError:
+            # Resposta de erro do servidor (ex.: 404 de um ano ainda não publicado)
+            raise
+        except (requests.RequestException, IOError):
+            if attempt == retries:
+                raise
+            time.sleep(2 ** attempt)
+
+
 def download_file(url, destination):
     """
     Baixa um arquivo
     """
-    response = requests.get(url, stream=True)
-    
-    if response.status_code != 200:
-        print(f"Erro ao baixar o arquivo: {response.status_code}")
+    metadata = DownloadMetadata(os.path.dirname(destination) or '.')
+    try:
+        status = fetch_with_retries(url, destination, metadata)
+    except (requests.RequestException, IOError) as e:
+        print(f"Erro ao baixar o arquivo: {e}")
         return False
-    
-    total_size = int(response.headers.get('content-length', 0))
-    block_size = 1024  # 1 KB
-    
-    with open(destination, 'wb') as file, tqdm(
-            desc=os.path.basename(destination),
-            total=total_size,
-            unit='B',
-            unit_scale=True,
-            unit_divisor=1024,
-        ) as bar:
-        for data in response.iter_content(block_size):
-            file.write(data)
-            bar.update(len(data))
-    
+
+    if status == 'inalterado':
+        print(f"{os.path.basename(destination)} não mudou desde o último download.")
     return True
 
+
+def download_files(files, output_directory=OUTPUT_DIRECTORY, workers=DOWNLOAD_WORKERS):
+    """
+    Baixa em paralelo (até `workers` arquivos por vez) a lista de (url, nome do arquivo).
+    Retorna {nome do arquivo: situação}, com a situação 'baixado', 'retomado',
+    'inalterado' ou a mensagem de erro.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    metadata = DownloadMetadata(output_directory)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                fetch_with_retries, url, os.path.join(output_directory, name), metadata, i % workers
+            ): name
+            for i, (url, name) in enumerate(files)
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except (requests.RequestException, IOError) as e:
+                results[name] = f"erro: {e}"
+    return results
+
+
+def download_all(years, output_directory=OUTPUT_DIRECTORY, base_url=BASE_URL, workers=DOWNLOAD_WORKERS,
+                 include_ncm=True):
+    """Baixa os arquivos EXP/IMP dos anos informados e a tabela NCM (ver download_files)"""
+    return download_files(build_file_urls(years, base_url, include_ncm), output_directory, workers)
+
+
+def run_batch(args):
+    """Modo em lote, não interativo: baixa todos os arquivos dos anos informados"""
+    years = parse_years(args.years)
+    start = time.perf_counter()
+    results = download_all(years, args.output, args.base_url, args.workers, not args.no_ncm)
+    elapsed = time.perf_counter() - start
+
+    for name in sorted(results):
+        print(f"{name}: {results[name]}")
+    failures = sum(1 for status in results.values() if status.startswith('erro'))
+    print(f"{len(results)} arquivos em {elapsed:.1f}s ({failures} com erro)")
+    return failures == 0
+
 def main():
+    parser = argparse.ArgumentParser(description="Baixa os arquivos da base de dados NCM.")
+    parser.add_argument('--years', nargs='+', metavar='ANO',
+                        help="anos ou intervalos a baixar sem interação, ex.: 2020-2021 2023")
+    parser.add_argument('--workers', type=int, default=DOWNLOAD_WORKERS,
+                        help=f"arquivos baixados em paralelo (padrão: {DOWNLOAD_WORKERS})")
+    parser.add_argument('--base-url', default=BASE_URL, help=f"endereço dos arquivos (padrão: {BASE_URL})")
+    parser.add_argument('--output', default=OUTPUT_DIRECTORY,
+                        help=f"diretório dos arquivos baixados (padrão: {OUTPUT_DIRECTORY})")
+    parser.add_argument('--no-ncm', action='store_true', help="não baixar a tabela NCM.csv")
+    args = parser.parse_args()
+
+    if args.years:
+        sys.exit(0 if run_batch(args) else 1)
+
     # Configurações
-    base_url = "https://www.gov.br/mdic/pt-br/assuntos/comercio-exterior/estatisticas/base-de-dados-bruta"
-    output_directory = "src/ncm_data"
+    base_url = LISTING_URL
+    output_directory = args.output
     
     # Solicitar ao usuário que escolha o ano
     selected_year = get_user_year()
@@ -0,0 +1,230 @@
+"""
+Medição das etapas dos scripts (download, leitura do CSV, deduplicação, COPY,
+dimensão NCM, UPDATE, resumo e consultas do dashboard). Cada etapa concluída gera
+um registro com o tempo decorrido, as linhas processadas, linhas/s e o pico de
+memória do processo. Com METRICS_FILE definido, cada registro é acrescentado ao
+arquivo como uma linha JSON:
+
+    {"ts": "...", "script": "send_data", "pid": 123, "stage": "copy", "seconds": 1.9,
+     "rows": 500000, "rows_per_second": 263157.9, "peak_rss_mb": 812.4, "status": "ok",
+     "table": "staging_export_data", "format": "text"}
+
+Com PROMETHEUS_TEXTFILE_DIR, os totais por etapa do processo também são gravados
+em <diretório>/<script>.prom, para o textfile collector do node_exporter.
+
+Uso:
+    with instrumentation.stage('copy', rows=len(df), table=table_name):
+        ...
+    for chunk in instrumentation.timed_iter('parse', chunks, file=name):
+        ...
+"""
+
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+# Arquivo de métricas em linhas JSON (None = não gravar; o arquivo cresce a cada execução)
+METRICS_FILE = os.environ.get('METRICS_FILE')
+
+# Diretório do textfile collector do Prometheus (None = não gravar)
+PROMETHEUS_TEXTFILE_DIR = os.environ.get('PROMETHEUS_TEXTFILE_DIR')
+
+# Prefixo das métricas no Prometheus
+METRIC_PREFIX = 'comexstat'
+
+# Nome do script nos registros (padrão: o nome do arquivo executado, sem .py)
+_script = None
+
+# Totais por etapa do processo atual, para o arquivo do Prometheus
+_totals = {}
+
+# Serializa a gravação dos registros (etapas em threads diferentes, ex.: send_data.prefetch)
+_lock = threading.Lock()
+
+# Listas que recebem os registros emitidos no contexto atual (ver collect)
+_collectors = ContextVar('instrumentation_collectors', default=())
+
+
+def peak_rss_mb():
+    """Pico de memória residente do processo, em MB"""
+    # No Linux ru_maxrss é informado em KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def set_script(name):
+    """Define o nome do script nos registros (ex.: 'dashboard', executado pelo streamlit)"""
+    global _script
+    _script = name
+
+
+def get_script():
+    if _script:
+        return _script
+    return os.path.splitext(os.path.basename(sys.argv[0] if sys.argv and sys.argv[0] else 'python'))[0]
+
+
+class StageRecord:
+    """Etapa em andamento; linhas e campos podem ser informados durante a execução"""
+
+    def __init__(self, name, rows=None, **fields):
+        self.name = name
+        self.rows = rows
+        self.fields = fields
+        self.seconds = 0.0
+
+    def add_rows(self, rows):
+        self.rows = (self.rows or 0) + rows
+
+    def add_bytes(self, size):
+        self.fields['bytes'] = self.fields.get('bytes', 0) + size
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+
+@contextmanager
+def stage(name, rows=None, **fields):
+    """Mede o bloco como a etapa `name`; uma exceção é registrada com status 'erro' e propagada"""
+    record = StageRecord(name, rows, **fields)
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield record
+    except BaseException:
+        status = 'erro'
+        raise
+    finally:
+        record.seconds = time.perf_counter() - start
+        emit(record, status)
+
+
+def timed_iter(name, iterator, measure='rows', **fields):
+    """
+    Repassa os itens de `iterator` medindo como a etapa `name` apenas o tempo gasto
+    para produzi-los (não o do consumidor). len() de cada item é somado às linhas
+    (measure='rows', blocos de um DataFrame) ou aos bytes (measure='bytes').
+    O registro é emitido ao fim da iteração; interrompida antes do fim, com status
+    'interrompido'.
+    """
+    record = StageRecord(name, **fields)
+    iterator = iter(iterator)
+    status = 'ok'
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                record.seconds += time.perf_counter() - start
+            if measure == 'bytes':
+                record.add_bytes(len(item))
+            else:
+                record.add_rows(len(item))
+            yield item
+    except GeneratorExit:
+        status = 'interrompido'
+        raise
+    except BaseException:
+        status = 'erro'
+        raise
+    finally:
+        emit(record, status)
+
+
+@contextmanager
+def collect():
+    """
+    Guarda em uma lista os registros emitidos no contexto atual durante o bloco
+    (inclusive nas threads de query_backend.run_concurrently); usado pelo painel de
+    diagnóstico do dashboard para saber quais consultas uma visualização executou.
+    """
+    records = []
+    token = _collectors.set(_collectors.get() + (records,))
+    try:
+        yield records
+    finally:
+        _collectors.reset(token)
+
+
+def emit(record, status='ok'):
+    """Grava o registro de uma etapa concluída"""
+    entry = {
+        'ts': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+        'script': get_script(),
+        'pid': os.getpid(),
+        'stage': record.name,
+        'seconds': round(record.seconds, 4),
+        'rows': record.rows,
+        'rows_per_second': round(record.rows / record.seconds, 1) if record.rows and record.seconds else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'status': status,
+        **record.fields,
+    }
+    if 'bytes' in record.fields and record.seconds:
+        entry['bytes_per_second'] = round(record.fields['bytes'] / record.seconds, 1)
+
+    for records in _collectors.get():
+        records.append(entry)
+
+    with _lock:
+        if METRICS_FILE:
+            with open(METRICS_FILE, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+
+        totals = _totals.setdefault(record.name, {'seconds': 0.0, 'rows': 0, 'calls': 0, 'errors': 0})
+        totals['seconds'] += record.seconds
+        totals['rows'] += record.rows or 0
+        totals['calls'] += 1
+        totals['errors'] += status == 'erro'
+        # Os processos de leitura paralela (send_data.load_batch) só gravam as linhas
+        # JSON: cada processo sobrescreveria o arquivo do Prometheus dos demais
+        if PROMETHEUS_TEXTFILE_DIR and multiprocessing.parent_process() is None:
+            write_prometheus(PROMETHEUS_TEXTFILE_DIR, entry['script'])
+
+
+def format_prometheus(script):
+    """Totais por etapa do processo no formato de texto do Prometheus"""
+    # Totais acumulados pelo processo: contadores (reiniciam a cada execução, o que rate() trata)
+    metrics = [
+        ('stage_seconds_total', 'seconds', "Tempo total das etapas, em segundos"),
+        ('stage_rows_total', 'rows', "Linhas processadas pelas etapas"),
+        ('stage_calls_total', 'calls', "Execuções das etapas"),
+        ('stage_errors_total', 'errors', "Execuções das etapas que terminaram em erro"),
+    ]
+    lines = []
+    for metric, key, description in metrics:
+        name = f"{METRIC_PREFIX}_{metric}"
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} counter")
+        for stage_name, totals in sorted(_totals.items()):
+            lines.append(f'{name}{{script="{script}",stage="{stage_name}"}} {totals[key]:g}')
+
+    name = f"{METRIC_PREFIX}_peak_rss_bytes"
+    lines.append(f"# HELP {name} Pico de memória residente do processo")
+    lines.append(f"# TYPE {name} gauge")
+    lines.append(f'{name}{{script="{script}"}} {int(peak_rss_mb() * 1024 * 1024)}')
+
+    name = f"{METRIC_PREFIX}_last_run_timestamp_seconds"
+    lines.append(f"# HELP {name} Horário da última etapa concluída")
+    lines.append(f"# TYPE {name} gauge")
+    lines.append(f'{name}{{script="{script}"}} {time.time():.3f}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(directory, script):
+    """Grava <directory>/<script>.prom de forma atômica (o collector nunca lê um arquivo pela metade)"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{script}.prom")
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(format_prometheus(script))
+    os.replace(temp_path, path)
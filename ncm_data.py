@@ -1,6 +1,18 @@
+import numpy as np
 import pandas as pd
 import psycopg2
-import chardet
+import csv_reader
+import data_version
+import instrumentation
+import parquet_cache
+import rollup
+import argparse
+import hashlib
+import os
+from collections import namedtuple
+from io import StringIO
+from psycopg2 import sql
+from tqdm import tqdm
 
 # Configurações do PostgreSQL
 DB_CONFIG = {
@@ -10,29 +22,47 @@ DB_CONFIG = {
     'password': 'admin'
 }
 
+# Tabela de dimensão com as descrições de cada código NCM
+NCM_TABLE = 'ncm'
+
+# Tabela que guarda o hash do último NCM.csv carregado na dimensão
+NCM_SOURCE_TABLE = 'ncm_source'
+
+# Estrutura de consulta código -> descrição usada no preenchimento durante a carga:
+# - codes: códigos NCM ordenados (int64), para busca com np.searchsorted;
+# - description_index: posição da descrição de cada código em `descriptions`;
+# - descriptions: descrições distintas, usadas como categorias do resultado.
+NcmLookup = namedtuple('NcmLookup', ['codes', 'description_index', 'descriptions'])
+
 def detect_encoding(file_path):
-    """Detecta a codificação do arquivo"""
-    with open(file_path, 'rb') as f:
-        result = chardet.detect(f.read())
-    return result['encoding']
+    """Detecta a codificação do arquivo a partir de uma amostra (resultado em cache por arquivo)"""
+    return csv_reader.detect_encoding(file_path)
 
 def read_ncm_mapping(file_path):
     """Lê o arquivo CSV com o mapeamento NCM"""
     try:
+        if parquet_cache.is_fresh(file_path):
+            # Arquivo já convertido pelo parquet_cache.py: apenas as duas colunas são lidas
+            df = parquet_cache.read_ncm(columns=['CO_NCM', 'NO_NCM_POR'])
+            df['CO_NCM'] = df['CO_NCM'].str.zfill(8)
+            return df.drop_duplicates()
+
         encoding = detect_encoding(file_path)
         print(f"Detectada codificação: {encoding}")
         
-        df = pd.read_csv(
-            file_path, 
-            sep=';', 
-            dtype={'CO_NCM': str},
+        columns = csv_reader.read_header(file_path, encoding)
+        if 'CO_NCM' not in columns or 'NO_NCM_POR' not in columns:
+            print("Erro: Arquivo deve conter colunas CO_NCM e NO_NCM_POR")
+            return None
+        
+        # Apenas as duas colunas usadas são lidas (o arquivo tem mais de dez)
+        df = csv_reader.read_csv(
+            file_path,
+            dtype=csv_reader.NCM_DTYPES,
+            usecols=['CO_NCM', 'NO_NCM_POR'],
             encoding=encoding
         )
         
-        if 'CO_NCM' not in df.columns or 'NO_NCM_POR' not in df.columns:
-            print("Erro: Arquivo deve conter colunas CO_NCM e NO_NCM_POR")
-            return None
-            
         df['CO_NCM'] = df['CO_NCM'].str.zfill(8)
         return df[['CO_NCM', 'NO_NCM_POR']].drop_duplicates()
         
@@ -40,59 +70,289 @@ def read_ncm_mapping(file_path):
         print(f"Erro ao ler arquivo: {e}")
         return None
 
-def update_table_with_ncm(conn, table_name, ncm_mapping, temp_table_suffix=""):
-    """Atualiza uma tabela específica com descrições NCM"""
+def build_ncm_lookup(ncm_mapping):
+    """Monta a estrutura de consulta a partir do mapeamento lido por read_ncm_mapping"""
+    codes = pd.to_numeric(ncm_mapping['CO_NCM'], errors='coerce')
+    valid = ncm_mapping[codes.notna()].assign(CO_NCM=codes[codes.notna()].astype('int64'))
+    valid = valid.drop_duplicates(subset='CO_NCM', keep='last').sort_values('CO_NCM')
+
+    description_index, descriptions = pd.factorize(valid['NO_NCM_POR'].astype(str))
+    return NcmLookup(
+        codes=valid['CO_NCM'].to_numpy(),
+        description_index=description_index.astype(np.int32),
+        descriptions=pd.Index(descriptions)
+    )
+
+def get_lookup_cache_path(file_path):
+    """Arquivo onde a estrutura de consulta é guardada, ao lado do NCM.csv"""
+    return os.path.splitext(file_path)[0] + '.lookup.npz'
+
+def save_ncm_lookup(lookup, cache_path, source_stat):
+    """Grava a estrutura de consulta; as descrições ficam concatenadas em um único bloco de bytes"""
+    encoded = [description.encode('utf-8') for description in lookup.descriptions]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(description) for description in encoded])
+
+    # Grava em um arquivo temporário e substitui, para nunca deixar um cache pela metade
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(
+            f,
+            codes=lookup.codes,
+            description_index=lookup.description_index,
+            blob=np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            offsets=offsets,
+            source=np.array([source_stat.st_size, source_stat.st_mtime_ns], dtype=np.int64)
+        )
+    os.replace(tmp_path, cache_path)
+
+def load_ncm_lookup(file_path):
+    """
+    Retorna a estrutura de consulta do NCM.csv. O cache em disco é usado enquanto
+    o tamanho e a data de modificação do arquivo não mudarem; caso contrário, o
+    arquivo é lido novamente e o cache é regravado.
+    Retorna None se o arquivo não puder ser lido.
+    """
+    cache_path = get_lookup_cache_path(file_path)
+    source_stat = os.stat(file_path)
+
+    try:
+        with np.load(cache_path) as cache:
+            if cache['source'].tolist() == [source_stat.st_size, source_stat.st_mtime_ns]:
+                blob = cache['blob'].tobytes()
+                offsets = cache['offsets']
+                descriptions = [
+                    blob[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])
+                ]
+                return NcmLookup(
+                    codes=cache['codes'],
+                    description_index=cache['description_index'],
+                    descriptions=pd.Index(descriptions, dtype=object)
+                )
+    except (OSError, KeyError, ValueError):
+        pass
+
+    ncm_mapping = read_ncm_mapping(file_path)
+    if ncm_mapping is None:
+        return None
+    lookup = build_ncm_lookup(ncm_mapping)
+    try:
+        save_ncm_lookup(lookup, cache_path, source_stat)
+    except OSError as e:
+        print(f"Aviso: não foi possível gravar o cache do NCM: {e}")
+    return lookup
+
+def lookup_ncm_descriptions(co_ncm, lookup):
+    """
+    Retorna as descrições dos códigos como pd.Categorical (NaN para códigos
+    desconhecidos), aplicando a busca de forma vetorizada.
+    """
+    values = pd.to_numeric(pd.Series(co_ncm), errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    category_codes = np.full(len(values), -1, dtype=np.int32)
+
+    if len(lookup.codes):
+        known = ~np.isnan(values)
+        codes = np.where(known, values, -1).astype(np.int64)
+        positions = np.minimum(np.searchsorted(lookup.codes, codes), len(lookup.codes) - 1)
+        found = known & (lookup.codes[positions] == codes)
+        category_codes[found] = lookup.description_index[positions[found]]
+
+    return pd.Categorical.from_codes(category_codes, categories=lookup.descriptions)
+
+def create_ncm_tables(conn):
+    """Cria a tabela de dimensão NCM e a tabela com o hash do arquivo de origem"""
     cursor = conn.cursor()
-    temp_table_name = f"temp_ncm_{temp_table_suffix}" if temp_table_suffix else "temp_ncm"
-    
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {ncm} (
+            co_ncm INTEGER PRIMARY KEY,
+            no_ncm_por TEXT NOT NULL
+        )
+    """).format(ncm=sql.Identifier(NCM_TABLE)))
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {source} (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            content_hash CHAR(64) NOT NULL,
+            loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """).format(source=sql.Identifier(NCM_SOURCE_TABLE)))
+    conn.commit()
+    cursor.close()
+
+def load_ncm_dimension(conn, ncm_mapping):
+    """
+    Carrega o mapeamento na dimensão NCM com um único COPY e um upsert.
+    Não faz nada se o conteúdo for igual ao da última carga.
+    Retorna a lista de códigos novos ou com descrição alterada.
+    """
+    codes = pd.to_numeric(ncm_mapping['CO_NCM'], errors='coerce')
+    for code in ncm_mapping.loc[codes.isna(), 'CO_NCM']:
+        print(f"Aviso: Código NCM inválido ignorado: {code}")
+
+    dimension = pd.DataFrame({
+        'co_ncm': codes,
+        'no_ncm_por': ncm_mapping['NO_NCM_POR']
+    }).dropna().drop_duplicates(subset='co_ncm', keep='last')
+    dimension['co_ncm'] = dimension['co_ncm'].astype('int64')
+
+    output = StringIO()
+    dimension.to_csv(output, header=False, index=False)
+    content_hash = hashlib.sha256(output.getvalue().encode('utf-8')).hexdigest()
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql.SQL("SELECT content_hash FROM {source}").format(source=sql.Identifier(NCM_SOURCE_TABLE)))
+        row = cursor.fetchone()
+        if row is not None and row[0] == content_hash:
+            print("Dimensão NCM já está atualizada.")
+            return []
+
+        with instrumentation.stage('ncm_fill', rows=len(dimension), table=NCM_TABLE) as record:
+            cursor.execute("CREATE TEMPORARY TABLE temp_ncm (co_ncm INTEGER, no_ncm_por TEXT) ON COMMIT DROP")
+            output.seek(0)
+            cursor.copy_expert("COPY temp_ncm FROM STDIN WITH (FORMAT csv)", output)
+
+            cursor.execute(sql.SQL("""
+                INSERT INTO {ncm} (co_ncm, no_ncm_por)
+                SELECT co_ncm, no_ncm_por FROM temp_ncm
+                ON CONFLICT (co_ncm) DO UPDATE SET no_ncm_por = EXCLUDED.no_ncm_por
+                WHERE {ncm}.no_ncm_por IS DISTINCT FROM EXCLUDED.no_ncm_por
+                RETURNING co_ncm
+            """).format(ncm=sql.Identifier(NCM_TABLE)))
+            changed = [code for (code,) in cursor.fetchall()]
+            record.set(changed_codes=len(changed))
+
+        cursor.execute(sql.SQL("""
+            INSERT INTO {source} (content_hash) VALUES (%s)
+            ON CONFLICT (id) DO UPDATE SET content_hash = EXCLUDED.content_hash, loaded_at = now()
+        """).format(source=sql.Identifier(NCM_SOURCE_TABLE)), (content_hash,))
+        if changed:
+            # Descrições novas ou alteradas mudam o resultado da junção com a dimensão
+            data_version.bump(conn)
+        conn.commit()
+        print(f"Dimensão NCM atualizada: {len(changed)} códigos novos ou alterados.")
+        return changed
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def update_table_with_ncm(conn, table_name, changed_codes=None, months=None):
+    """
+    Preenche no_ncm_por a partir da dimensão NCM apenas nas linhas ainda sem
+    descrição, um mês por vez, com commit a cada mês. Se `months` for informado,
+    apenas esses (CO_ANO, CO_MES) são processados. Linhas dos códigos em
+    `changed_codes` (descrições alteradas) também são atualizadas.
+    A geração dos dados (data_version.py) é incrementada no commit de cada mês alterado.
+    Retorna a lista de meses atualizados.
+    """
+    cursor = conn.cursor()
+    table = sql.Identifier(table_name)
+    updated_months = []
+
     try:
         # Verificar se a tabela existe
-        cursor.execute(f"SELECT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = '{table_name.lower()}')")
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table_name,))
         if not cursor.fetchone()[0]:
             print(f"Tabela {table_name} não existe. Pulando...")
-            return
+            return updated_months
 
-        # Adicionar coluna de descrição se não existir
-        cursor.execute(f'ALTER TABLE "{table_name}" ADD COLUMN IF NOT EXISTS no_ncm_por TEXT')
-
-        # Criar tabela temporária com tipo bigint para compatibilidade
-        cursor.execute(f"""
-            CREATE TEMPORARY TABLE {temp_table_name} (
-                co_ncm BIGINT PRIMARY KEY,
-                no_ncm_por TEXT
-            ) ON COMMIT DROP
-        """)
-
-        # Inserir dados na temporária, convertendo para bigint
-        for _, row in ncm_mapping.iterrows():
-            try:
-                ncm_code = int(row['CO_NCM'])
-                cursor.execute(
-                    f"INSERT INTO {temp_table_name} (co_ncm, no_ncm_por) VALUES (%s, %s)",
-                    (ncm_code, row['NO_NCM_POR'])
-                )
-            except ValueError:
-                print(f"Aviso: Código NCM inválido ignorado: {row['CO_NCM']}")
-
-        # Atualizar tabela principal
-        update_query = f"""
-            UPDATE "{table_name}" 
-            SET no_ncm_por = t.no_ncm_por
-            FROM {temp_table_name} t
-            WHERE "{table_name}"."CO_NCM" = t.co_ncm
-        """
-        
-        cursor.execute(update_query)
-        print(f"Tabela {table_name} atualizada com sucesso!")
+        # Adicionar coluna de descrição se não existir; o índice parcial contém apenas
+        # as linhas sem descrição, então localizar o que falta enriquecer é barato
+        cursor.execute(sql.SQL("ALTER TABLE {table} ADD COLUMN IF NOT EXISTS no_ncm_por TEXT").format(table=table))
+        cursor.execute(sql.SQL(
+            'CREATE INDEX IF NOT EXISTS {index} ON {table} ("CO_ANO", "CO_MES") WHERE no_ncm_por IS NULL'
+        ).format(index=sql.Identifier(f"{table_name}_sem_ncm_idx"), table=table))
         conn.commit()
 
+        if changed_codes:
+            # Descrições alteradas no NCM.csv: atualizar apenas as linhas desses códigos
+            cursor.execute(sql.SQL("""
+                UPDATE {table} t
+                SET no_ncm_por = n.no_ncm_por
+                FROM {ncm} n
+                WHERE t."CO_NCM" = n.co_ncm
+                  AND n.co_ncm = ANY(%s)
+                  AND t.no_ncm_por IS NOT NULL
+                  AND t.no_ncm_por IS DISTINCT FROM n.no_ncm_por
+                RETURNING t."CO_ANO", t."CO_MES"
+            """).format(table=table, ncm=sql.Identifier(NCM_TABLE)), (list(changed_codes),))
+            changed_months = sorted(set(cursor.fetchall()))
+            if changed_months:
+                data_version.bump(conn)
+            conn.commit()
+            updated_months.extend(changed_months)
+
+        if months is None:
+            cursor.execute(sql.SQL(
+                'SELECT DISTINCT "CO_ANO", "CO_MES" FROM {table} WHERE no_ncm_por IS NULL ORDER BY 1, 2'
+            ).format(table=table))
+            months = cursor.fetchall()
+
+        update_query = sql.SQL("""
+            UPDATE {table} t
+            SET no_ncm_por = n.no_ncm_por
+            FROM {ncm} n
+            WHERE t."CO_NCM" = n.co_ncm
+              AND t.no_ncm_por IS NULL
+              AND t."CO_ANO" = %s
+              AND t."CO_MES" = %s
+        """).format(table=table, ncm=sql.Identifier(NCM_TABLE))
+
+        total = 0
+        with instrumentation.stage('update', table=table_name, months=len(months)) as record:
+            with tqdm(months, desc=f"Enriquecendo {table_name}", unit=' mês') as bar:
+                for ano, mes in bar:
+                    cursor.execute(update_query, (ano, mes))
+                    rows = cursor.rowcount
+                    # Nova geração no mesmo commit do mês: uma falha nos meses seguintes
+                    # não deixa o dashboard com resultados em cache anteriores a este
+                    if rows:
+                        data_version.bump(conn)
+                    conn.commit()
+                    total += rows
+                    record.add_rows(rows)
+                    if rows:
+                        updated_months.append((ano, mes))
+                    bar.set_postfix_str(f"linhas={total}")
+
+        print(f"Tabela {table_name} atualizada com sucesso! {total} linhas enriquecidas.")
+        return sorted(set(updated_months))
+
     except Exception as e:
         conn.rollback()
         print(f"Erro ao atualizar {table_name}: {e}")
+        return updated_months
     finally:
         cursor.close()
 
+def refresh_ncm(conn, ncm_mapping, denormalize=True):
+    """
+    Carrega (ou atualiza) a dimensão NCM e, com denormalize=True, preenche
+    no_ncm_por nas tabelas de dados e atualiza a tabela de resumo dos meses
+    enriquecidos. Usada pelo main e pelo sync.py.
+    """
+    # Carregar (ou atualizar) a dimensão NCM com um único COPY
+    create_ncm_tables(conn)
+    data_version.create_data_version_table(conn)
+    changed_codes = load_ncm_dimension(conn, ncm_mapping)
+
+    if not denormalize:
+        print("Enriquecimento das tabelas ignorado; o dashboard pode usar a junção com a tabela ncm.")
+        return
+
+    # Atualizar ambas as tabelas apenas onde falta a descrição e, na tabela de
+    # resumo do dashboard, apenas os meses enriquecidos
+    for flow, table_name in rollup.FLOW_TABLES.items():
+        months = update_table_with_ncm(conn, table_name, changed_codes)
+        rollup.refresh_months(conn, flow, months)
+
 def main():
+    parser = argparse.ArgumentParser(description="Carrega as descrições NCM e enriquece as tabelas de dados.")
+    parser.add_argument('--no-denormalize', action='store_true',
+                        help="apenas carregar a dimensão NCM, sem preencher no_ncm_por nas tabelas de dados")
+    args = parser.parse_args()
+
     ncm_file_path = "./src/ncm_data/NCM.csv"
     
     try:
@@ -104,10 +364,8 @@ def main():
         
         conn = psycopg2.connect(**DB_CONFIG)
         print("Conectado ao PostgreSQL!")
-        
-        # Atualizar ambas as tabelas com tabelas temporárias diferentes
-        update_table_with_ncm(conn, 'export_data', ncm_mapping, "export")
-        update_table_with_ncm(conn, 'import_data', ncm_mapping, "import")
+
+        refresh_ncm(conn, ncm_mapping, not args.no_denormalize)
         
     except Exception as e:
         print(f"Erro: {e}")
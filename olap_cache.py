@@ -0,0 +1,199 @@
+"""
+Cubo em memória com os totais por fluxo, ano, mês, UF e produto, usado pelo
+dashboard para calcular os rankings sem consultar o banco a cada troca de filtro.
+O cubo é carregado uma única vez (da tabela de resumo, quando disponível) em
+arrays NumPy; o top-K de qualquer estado, "Todos", ano ou mês é calculado com
+somas agrupadas (np.bincount) e np.argpartition.
+"""
+
+import numpy as np
+import pandas as pd
+
+import dashboard_queries
+import query_backend
+
+class FlowArrays:
+    """Linhas do agregado de um fluxo, com UF e produto como códigos inteiros"""
+
+    def __init__(self, ano, mes, estado, produto, metrics):
+        self.ano = ano
+        self.mes = mes
+        self.estado = estado
+        self.produto = produto
+        self.metrics = metrics
+
+    @property
+    def nbytes(self):
+        arrays = [self.ano, self.mes, self.estado, self.produto, *self.metrics.values()]
+        return sum(array.nbytes for array in arrays)
+
+
+class TradeCube:
+    """
+    Agregado (ano, mês, UF, produto) de cada fluxo em arrays NumPy.
+    top_k devolve o mesmo formato de dashboard_queries.build_top_produtos_query,
+    então dashboard_queries.select_ranking funciona com os dois.
+    """
+
+    def __init__(self, frames):
+        # Códigos compartilhados entre os fluxos; os produtos ficam em ordem
+        # alfabética, então o código também desempata o ranking pelo nome
+        self.estados = np.array(sorted({
+            estado for df in frames.values() for estado in df['estado'].dropna().unique()
+        }), dtype=object)
+        self.produtos = np.array(sorted({
+            produto for df in frames.values() for produto in df['produto'].dropna().unique()
+        }), dtype=object)
+        self.flows = {fluxo: self.build_arrays(df) for fluxo, df in frames.items()}
+        self.estados_por_fluxo = {
+            fluxo: sorted(df['estado'].dropna().unique().tolist()) for fluxo, df in frames.items()
+        }
+        self.precomputed = {}
+
+    def build_arrays(self, df):
+        # UF ausente recebe o código len(estados): entra apenas no total "Todos"
+        estado = pd.Categorical(df['estado'], categories=self.estados).codes.astype(np.int16)
+        estado[estado < 0] = len(self.estados)
+
+        return FlowArrays(
+            ano=df['ano'].to_numpy(dtype=np.int16),
+            mes=df['mes'].to_numpy(dtype=np.int8),
+            estado=estado,
+            produto=pd.Categorical(df['produto'], categories=self.produtos).codes.astype(np.int32),
+            metrics={
+                metrica: pd.to_numeric(df[metrica]).fillna(0).to_numpy(dtype=np.float64)
+                for metrica in dashboard_queries.METRICS
+            },
+        )
+
+    @property
+    def rows(self):
+        return sum(len(arrays.ano) for arrays in self.flows.values())
+
+    @property
+    def nbytes(self):
+        """Memória ocupada pelos arrays e pelos rankings pré-calculados"""
+        total = sum(arrays.nbytes for arrays in self.flows.values())
+        total += self.estados.nbytes + self.produtos.nbytes
+        total += sum(df.memory_usage(deep=True).sum() for df in self.precomputed.values())
+        return int(total)
+
+    def get_estados(self, fluxo='E'):
+        return list(self.estados_por_fluxo.get(fluxo, []))
+
+    def precompute(self, views, metrica='KG_LIQUIDO', k=3):
+        """Calcula e guarda o ranking de todos os estados para cada (fluxo, anos, meses)"""
+        for fluxo, anos, meses in views:
+            key = self.get_key(fluxo, anos, meses, metrica, k)
+            self.precomputed[key] = self.compute_top_k(fluxo, anos, meses, metrica, None, k)
+
+    @staticmethod
+    def get_key(fluxo, anos, meses, metrica, k):
+        return fluxo, tuple(anos), None if meses is None else tuple(meses), metrica, k
+
+    def top_k(self, fluxo, anos, meses=None, metrica='KG_LIQUIDO', estado=None, k=3):
+        """
+        Os k produtos com maior `metrica` em cada ano (e mês, se `meses` for
+        informado) para um estado, "Todos" ou, com estado=None, todos os estados
+        """
+        precomputed = self.precomputed.get(self.get_key(fluxo, anos, meses, metrica, k))
+        if precomputed is not None:
+            if estado is None:
+                return precomputed
+            return precomputed[precomputed['estado'] == estado].reset_index(drop=True)
+        return self.compute_top_k(fluxo, anos, meses, metrica, estado, k)
+
+    def compute_top_k(self, fluxo, anos, meses, metrica, estado, k):
+        columns = ['estado', 'ano'] + (['mes'] if meses is not None else []) + ['posicao', 'produto', 'total']
+        arrays = self.flows.get(fluxo)
+        if arrays is None or metrica not in arrays.metrics:
+            return pd.DataFrame(columns=columns)
+
+        anos = np.array(sorted(anos), dtype=np.int16)
+        mask = np.isin(arrays.ano, anos)
+        n_periodos = len(anos)
+        if meses is not None:
+            meses = np.array(sorted(meses), dtype=np.int8)
+            mask &= np.isin(arrays.mes, meses)
+            n_periodos *= len(meses)
+
+        # Grupos: cada UF (mais a UF ausente) ou, com um estado informado, apenas ele
+        if estado is None:
+            grupo = arrays.estado[mask].astype(np.int64)
+            n_grupos = len(self.estados) + 1
+        else:
+            if estado != dashboard_queries.TODOS:
+                mask &= arrays.estado == self.get_estado_code(estado)
+            grupo = np.zeros(int(mask.sum()), dtype=np.int64)
+            n_grupos = 1
+
+        periodo = np.searchsorted(anos, arrays.ano[mask]).astype(np.int64)
+        if meses is not None:
+            periodo = periodo * len(meses) + np.searchsorted(meses, arrays.mes[mask])
+
+        # Soma agrupada por (grupo, período, produto) em uma matriz densa
+        n_produtos = len(self.produtos)
+        key = (grupo * n_periodos + periodo) * n_produtos + arrays.produto[mask]
+        shape = (n_grupos, n_periodos, n_produtos)
+        size = n_grupos * n_periodos * n_produtos
+        totals = np.bincount(key, weights=arrays.metrics[metrica][mask], minlength=size).reshape(shape)
+        present = np.bincount(key, minlength=size).reshape(shape) > 0
+
+        if estado is None:
+            # Estados (sem a UF ausente) mais o total geral
+            totals = np.concatenate([totals[:-1], totals.sum(axis=0, keepdims=True)])
+            present = np.concatenate([present[:-1], present.any(axis=0, keepdims=True)])
+            nomes = np.append(self.estados, dashboard_queries.TODOS)
+        else:
+            nomes = np.array([estado], dtype=object)
+
+        return self.rank(totals, present, nomes, anos, meses, k, columns)
+
+    def get_estado_code(self, estado):
+        code = np.searchsorted(self.estados, estado)
+        if code < len(self.estados) and self.estados[code] == estado:
+            return code
+        return -1
+
+    def rank(self, totals, present, nomes, anos, meses, k, columns):
+        """Seleciona os k maiores de cada (grupo, período) com argpartition e ordena só esses k"""
+        k = min(k, totals.shape[-1])
+        if k == 0:
+            return pd.DataFrame(columns=columns)
+        scores = np.where(present, totals, -np.inf)
+        top = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+        top_scores = np.take_along_axis(scores, top, axis=-1)
+        # Ordem final: total decrescente e, no empate, o produto (código em ordem alfabética)
+        order = np.lexsort((top, -top_scores), axis=-1)
+        top = np.take_along_axis(top, order, axis=-1)
+        top_scores = np.take_along_axis(top_scores, order, axis=-1)
+
+        n_grupos, n_periodos = totals.shape[:2]
+        grupo, periodo, posicao = np.indices((n_grupos, n_periodos, k)).reshape(3, -1)
+        data = {'estado': nomes[grupo]}
+        if meses is None:
+            data['ano'] = anos[periodo]
+        else:
+            data['ano'] = anos[periodo // len(meses)]
+            data['mes'] = meses[periodo % len(meses)]
+        data['posicao'] = posicao + 1
+        data['produto'] = self.produtos[top.ravel()]
+        data['total'] = top_scores.ravel()
+
+        df = pd.DataFrame(data, columns=columns)
+        # Períodos com menos de k produtos
+        return df[np.isfinite(df['total'])].reset_index(drop=True)
+
+
+def load_cube(backend, anos, rollup_flows=()):
+    """
+    Carrega o agregado de cada fluxo (da tabela de resumo, se completa) em um
+    TradeCube, com as consultas dos fluxos em paralelo
+    """
+    flows = list(dashboard_queries.FLOW_TABLES)
+    queries = [
+        dashboard_queries.build_aggregate_query(fluxo, anos, dashboard_queries.can_use_rollup(rollup_flows, fluxo))
+        for fluxo in flows
+    ]
+    return TradeCube(dict(zip(flows, query_backend.run_concurrently(backend, queries))))
+
@@ -0,0 +1,290 @@
+"""
+Cache em Parquet dos arquivos CSV baixados (EXP_*.csv, IMP_*.csv e NCM.csv).
+Cada arquivo é convertido uma única vez; as cargas seguintes leem o Parquet,
+apenas com as colunas e os meses necessários, sem interpretar o CSV novamente.
+
+Uso: python parquet_cache.py src/ncm_data
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import csv_reader
+
+# Diretório do cache
+CACHE_DIR = './src/parquet'
+
+# Arquivo com o estado de cada arquivo de origem convertido
+STATE_FILE = 'sources.json'
+
+# Compressão dos arquivos Parquet
+COMPRESSION = 'zstd'
+
+# Quantidade de linhas convertidas por vez
+CONVERT_CHUNK_SIZE = 1_000_000
+
+# Prefixos dos arquivos de dados e o fluxo correspondente (mesmos do send_data.py)
+FLOW_PREFIXES = {'EXP': 'E', 'IMP': 'I'}
+
+# Tipos das colunas de partição dos dados de comércio
+PARTITION_SCHEMA = pa.schema([('flow', pa.string()), ('CO_ANO', pa.int16()), ('CO_MES', pa.int8())])
+
+
+def get_trade_dir(cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, 'trade')
+
+
+def get_ncm_path(cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, 'ncm', 'NCM.parquet')
+
+
+def get_source_key(source_path):
+    """Nome do arquivo de origem sem extensão, usado para nomear os arquivos do cache"""
+    return os.path.splitext(os.path.basename(source_path))[0]
+
+
+def infer_kind(source_path):
+    """Retorna 'E', 'I' (dados de comércio), 'NCM' ou None"""
+    name = os.path.basename(source_path).upper()
+    if name.startswith('NCM'):
+        return 'NCM'
+    for prefix, flow in FLOW_PREFIXES.items():
+        if name.startswith(f"{prefix}_"):
+            return flow
+    return None
+
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_state(cache_dir=CACHE_DIR):
+    try:
+        with open(os.path.join(cache_dir, STATE_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state, cache_dir=CACHE_DIR):
+    # Grava em um arquivo temporário e substitui, para nunca deixar o estado pela metade
+    path = os.path.join(cache_dir, STATE_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def is_fresh(source_path, cache_dir=CACHE_DIR):
+    """
+    Verifica se o cache do arquivo existe e corresponde ao conteúdo atual.
+    Tamanho e data de modificação iguais bastam; se mudarem, o hash do conteúdo
+    decide (um arquivo baixado de novo, mas idêntico, continua válido).
+    """
+    state = load_state(cache_dir)
+    entry = state.get(get_source_key(source_path))
+    if entry is None or not os.path.exists(source_path):
+        return False
+
+    stat = os.stat(source_path)
+    if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return True
+    if entry['size'] != stat.st_size or file_sha256(source_path) != entry['sha256']:
+        return False
+
+    entry['mtime_ns'] = stat.st_mtime_ns
+    save_state(state, cache_dir)
+    return True
+
+
+def get_arrow_schema(columns):
+    """Esquema Arrow com os tipos de csv_reader.TRADE_DTYPES (colunas sem tipo definido viram texto)"""
+    fields = []
+    for col in columns:
+        col_type = csv_reader.TRADE_DTYPES.get(col)
+        if csv_reader.is_integer_type(col_type):
+            fields.append((col, getattr(pa, col_type)()))
+        elif col_type == 'category':
+            fields.append((col, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            fields.append((col, pa.string()))
+    return pa.schema(fields)
+
+
+def remove_trade_files(source_key, flow, cache_dir=CACHE_DIR):
+    """Remove os arquivos de um arquivo de origem, em todas as partições"""
+    pattern = os.path.join(get_trade_dir(cache_dir), f'flow={flow}', '*', '*', f'{source_key}-*.parquet')
+    for path in glob.glob(pattern):
+        os.remove(path)
+
+
+def get_trade_files(source_path, cache_dir=CACHE_DIR):
+    flow = infer_kind(source_path)
+    pattern = os.path.join(
+        get_trade_dir(cache_dir), f'flow={flow}', '*', '*', f'{get_source_key(source_path)}-*.parquet'
+    )
+    return sorted(glob.glob(pattern))
+
+
+def convert_trade_file(source_path, flow, cache_dir=CACHE_DIR, chunksize=CONVERT_CHUNK_SIZE):
+    """
+    Converte um arquivo EXP/IMP em arquivos Parquet particionados por
+    flow/CO_ANO/CO_MES, lendo o CSV em blocos. Retorna a lista de colunas.
+    """
+    columns = csv_reader.read_header(source_path)
+    schema = get_arrow_schema(columns)
+    engine = 'pyarrow' if csv_reader.pa_csv is not None else 'c'
+
+    def batches():
+        for chunk in csv_reader.read_csv_chunks(source_path, chunksize, engine=engine):
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            yield from table.to_batches()
+
+    source_key = get_source_key(source_path)
+    remove_trade_files(source_key, flow, cache_dir)
+    ds.write_dataset(
+        batches(),
+        os.path.join(get_trade_dir(cache_dir), f'flow={flow}'),
+        schema=schema,
+        format='parquet',
+        partitioning=ds.partitioning(pa.schema([schema.field('CO_ANO'), schema.field('CO_MES')]), flavor='hive'),
+        basename_template=f'{source_key}-{{i}}.parquet',
+        existing_data_behavior='overwrite_or_ignore',
+        file_options=ds.ParquetFileFormat().make_write_options(compression=COMPRESSION),
+    )
+    return columns
+
+
+def convert_ncm_file(source_path, cache_dir=CACHE_DIR):
+    """Converte o NCM.csv (todas as colunas, como texto) em um único arquivo Parquet"""
+    columns = csv_reader.read_header(source_path)
+    df = csv_reader.read_csv(source_path, dtype={col: str for col in columns})
+    path = get_ncm_path(cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path, compression=COMPRESSION)
+    os.replace(tmp_path, path)
+    return df.columns.tolist()
+
+
+def convert_file(source_path, cache_dir=CACHE_DIR, force=False):
+    """
+    Converte o arquivo, se o cache não estiver atualizado.
+    Retorna True se o arquivo foi convertido, False se o cache já estava atualizado.
+    """
+    kind = infer_kind(source_path)
+    if kind is None:
+        raise ValueError(f"Arquivo não reconhecido: {source_path} (esperado EXP_*, IMP_* ou NCM*)")
+    if not force and is_fresh(source_path, cache_dir):
+        return False
+
+    os.makedirs(cache_dir, exist_ok=True)
+    stat = os.stat(source_path)
+    sha256 = file_sha256(source_path)
+    if kind == 'NCM':
+        columns = convert_ncm_file(source_path, cache_dir)
+    else:
+        columns = convert_trade_file(source_path, kind, cache_dir)
+
+    state = load_state(cache_dir)
+    state[get_source_key(source_path)] = {
+        'kind': kind,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': sha256,
+        'columns': columns,
+    }
+    save_state(state, cache_dir)
+    return True
+
+
+def get_trade_dataset(source_path, cache_dir=CACHE_DIR):
+    files = get_trade_files(source_path, cache_dir)
+    return ds.dataset(
+        files,
+        format='parquet',
+        partitioning=ds.partitioning(PARTITION_SCHEMA, flavor='hive'),
+        partition_base_dir=get_trade_dir(cache_dir),
+    )
+
+
+def get_month_filter(months):
+    """Filtro (CO_ANO, CO_MES) IN months; as partições fora do filtro não são lidas"""
+    expression = None
+    for ano, mes in months:
+        condition = (ds.field('CO_ANO') == int(ano)) & (ds.field('CO_MES') == int(mes))
+        expression = condition if expression is None else expression | condition
+    return expression if expression is not None else ds.scalar(False)
+
+
+def to_dataframe(table, columns):
+    df = table.to_pandas(self_destruct=True, split_blocks=True)
+    return csv_reader.coerce_integer_columns(df[columns], csv_reader.TRADE_DTYPES)
+
+
+def get_columns(source_path, columns=None, cache_dir=CACHE_DIR):
+    """Colunas na ordem do arquivo original, opcionalmente restritas a `columns`"""
+    source_columns = load_state(cache_dir)[get_source_key(source_path)]['columns']
+    return source_columns if columns is None else [col for col in source_columns if col in columns]
+
+
+def read_trade(source_path, columns=None, months=None, cache_dir=CACHE_DIR):
+    """Lê os dados de um arquivo EXP/IMP a partir do cache, apenas com as colunas e meses pedidos"""
+    columns = get_columns(source_path, columns, cache_dir)
+    dataset = get_trade_dataset(source_path, cache_dir)
+    table = dataset.to_table(columns=columns, filter=None if months is None else get_month_filter(months))
+    return to_dataframe(table, columns)
+
+
+def iter_trade(source_path, batch_size, columns=None, months=None, cache_dir=CACHE_DIR):
+    """Lê os dados de um arquivo EXP/IMP a partir do cache em blocos de até `batch_size` linhas"""
+    columns = get_columns(source_path, columns, cache_dir)
+    dataset = get_trade_dataset(source_path, cache_dir)
+    scanner = dataset.scanner(
+        columns=columns, filter=None if months is None else get_month_filter(months), batch_size=batch_size
+    )
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            yield to_dataframe(pa.Table.from_batches([batch]), columns)
+
+
+def read_ncm(columns=None, cache_dir=CACHE_DIR):
+    """Lê o NCM.csv convertido, apenas com as colunas pedidas"""
+    return pq.read_table(get_ncm_path(cache_dir), columns=columns).to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Converte os arquivos CSV baixados para o cache em Parquet.")
+    parser.add_argument('path', nargs='?', default='./src/ncm_data',
+                        help="diretório ou arquivo CSV (padrão: ./src/ncm_data)")
+    parser.add_argument('--force', action='store_true', help="converter mesmo os arquivos já atualizados")
+    parser.add_argument('--clear', action='store_true', help="apagar o cache antes de converter")
+    args = parser.parse_args()
+
+    if args.clear and os.path.isdir(CACHE_DIR):
+        shutil.rmtree(CACHE_DIR)
+
+    files = [args.path] if os.path.isfile(args.path) else sorted(glob.glob(os.path.join(args.path, '*.csv')))
+    for source_path in files:
+        if infer_kind(source_path) is None:
+            continue
+        if convert_file(source_path, force=args.force):
+            print(f"Convertido: {source_path}")
+        else:
+            print(f"Atualizado: {source_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""
+Backends de consulta do dashboard: PostgreSQL ou DuckDB sobre os arquivos locais
+(cache em Parquet do parquet_cache.py ou, na falta dele, os CSVs baixados).
+Os dois backends expõem as mesmas tabelas (export_data, import_data e ncm), então
+as consultas do dashboard funcionam sem alteração em qualquer um deles.
+"""
+
+import contextvars
+import glob
+import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import psycopg2
+from psycopg2 import pool
+
+import instrumentation
+import ncm_data
+import parquet_cache
+
+# Backend usado pelo dashboard: 'postgres' ou 'duckdb'
+# (pode ser alterado pela variável de ambiente DASHBOARD_BACKEND)
+BACKEND = os.environ.get('DASHBOARD_BACKEND', 'postgres')
+
+# Diretório dos CSVs baixados, usado pelo DuckDB quando não há cache em Parquet
+DATA_DIR = os.environ.get('DASHBOARD_DATA_DIR', './src/ncm_data')
+
+# Tabela de cada fluxo e o prefixo dos arquivos correspondentes
+FLOW_TABLES = {'E': ('export_data', 'EXP'), 'I': ('import_data', 'IMP')}
+
+# Quantidade máxima de conexões abertas com o PostgreSQL (compartilhadas entre as sessões)
+POOL_SIZE = int(os.environ.get('DASHBOARD_POOL_SIZE', 10))
+
+# Tempo máximo de cada consulta no PostgreSQL, em milissegundos (0 = sem limite)
+STATEMENT_TIMEOUT_MS = int(os.environ.get('DASHBOARD_STATEMENT_TIMEOUT_MS', 60_000))
+
+# Conexões ociosas há mais tempo que isso (em segundos) são testadas antes do uso
+HEALTH_CHECK_INTERVAL = 30
+
+# Quantidade de consultas executadas em paralelo por run_concurrently
+QUERY_WORKERS = POOL_SIZE
+
+# Caracteres do texto de cada consulta gravados nas métricas (instrumentation.py)
+QUERY_TEXT_LENGTH = 160
+
+
+class PostgresBackend:
+    """
+    Consultas no PostgreSQL carregado pelo send_data.py, com um pool de conexões
+    compartilhado entre as threads. Quem pede uma conexão com o pool cheio espera
+    a próxima livre; conexões quebradas são descartadas e a consulta é repetida
+    uma vez em uma conexão nova.
+    """
+
+    name = 'postgres'
+
+    def __init__(self, db_config, pool_size=POOL_SIZE, statement_timeout_ms=STATEMENT_TIMEOUT_MS):
+        self.statement_timeout_ms = statement_timeout_ms
+        self.pool = pool.ThreadedConnectionPool(
+            1, pool_size, options=f'-c statement_timeout={int(statement_timeout_ms)}', **db_config
+        )
+        # O ThreadedConnectionPool falha quando está cheio; o semáforo faz a thread esperar
+        self.slots = threading.BoundedSemaphore(pool_size)
+        self.last_used = {}
+
+    def get_conn(self):
+        """Obtém uma conexão do pool, testando as que ficaram ociosas por muito tempo"""
+        while True:
+            conn = self.pool.getconn()
+            last_used = self.last_used.get(id(conn))
+            if not conn.closed and last_used is None:
+                # As consultas do dashboard só leem: sem transações abertas entre uma consulta e outra
+                conn.autocommit = True
+            elif not conn.closed and time.monotonic() - last_used > HEALTH_CHECK_INTERVAL:
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                except psycopg2.Error:
+                    pass
+            if not conn.closed:
+                return conn
+            # Conexão encerrada pelo servidor: descartar e pedir outra (o pool abre uma nova)
+            self.discard(conn)
+
+    def put_conn(self, conn):
+        self.last_used[id(conn)] = time.monotonic()
+        self.pool.putconn(conn)
+
+    def discard(self, conn):
+        self.last_used.pop(id(conn), None)
+        self.pool.putconn(conn, close=True)
+
+    def query(self, query, params=None, timeout_ms=None):
+        """
+        Executa a consulta (parâmetros no formato %(nome)s) e retorna um DataFrame.
+        timeout_ms substitui STATEMENT_TIMEOUT_MS apenas nesta consulta.
+        O tempo registrado (etapa 'query') inclui a espera por uma conexão livre.
+        """
+        with instrumentation.stage('query', backend=self.name, **describe_query(query)) as record:
+            df = self.run(query, params, timeout_ms)
+            record.add_rows(len(df))
+        return df
+
+    def run(self, query, params, timeout_ms):
+        with self.slots:
+            for attempt in range(2):
+                conn = self.get_conn()
+                try:
+                    df = self.read(conn, query, params, timeout_ms)
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    if not conn.closed:
+                        # Erro da consulta (ex.: statement_timeout), com a conexão ainda válida
+                        self.put_conn(conn)
+                        raise
+                    # Conexão perdida (ex.: o servidor reiniciou): repetir em uma conexão nova
+                    self.discard(conn)
+                    if attempt == 0:
+                        continue
+                    raise
+                except Exception:
+                    self.put_conn(conn)
+                    raise
+                self.put_conn(conn)
+                return df
+
+    def read(self, conn, query, params, timeout_ms):
+        if timeout_ms is None:
+            return pd.read_sql_query(query, conn, params=params)
+        with conn.cursor() as cursor:
+            cursor.execute("SET statement_timeout = %s", (int(timeout_ms),))
+        try:
+            return pd.read_sql_query(query, conn, params=params)
+        finally:
+            if not conn.closed:
+                with conn.cursor() as cursor:
+                    cursor.execute("SET statement_timeout = %s", (int(self.statement_timeout_ms),))
+
+    def close(self):
+        self.pool.closeall()
+
+
+class DuckDBBackend:
+    """Consultas com o DuckDB, em memória, direto dos arquivos locais"""
+
+    name = 'duckdb'
+
+    def __init__(self, data_dir=DATA_DIR, cache_dir=parquet_cache.CACHE_DIR):
+        import duckdb
+
+        self.conn = duckdb.connect(':memory:')
+        self.sources = {}
+        self.create_ncm_table(data_dir)
+        for flow, (table_name, prefix) in FLOW_TABLES.items():
+            self.create_trade_table(flow, table_name, prefix, data_dir, cache_dir)
+
+    def create_ncm_table(self, data_dir):
+        self.conn.execute("CREATE TABLE ncm (co_ncm INTEGER PRIMARY KEY, no_ncm_por VARCHAR)")
+        ncm_path = os.path.join(data_dir, 'NCM.csv')
+        if not os.path.exists(ncm_path):
+            return
+
+        mapping = ncm_data.read_ncm_mapping(ncm_path)
+        if mapping is None:
+            return
+        lookup = ncm_data.build_ncm_lookup(mapping)
+        ncm_df = pd.DataFrame({
+            'co_ncm': lookup.codes.astype('int32'),
+            'no_ncm_por': lookup.descriptions[lookup.description_index].astype(str),
+        })
+        self.conn.register('ncm_df', ncm_df)
+        self.conn.execute("INSERT INTO ncm SELECT co_ncm, no_ncm_por FROM ncm_df")
+        self.conn.unregister('ncm_df')
+
+    def create_trade_table(self, flow, table_name, prefix, data_dir, cache_dir):
+        """
+        Carrega o fluxo em uma tabela em memória, já com a descrição NCM (como a
+        tabela desnormalizada do PostgreSQL). Cada CSV é lido do cache em Parquet
+        quando ele está atualizado (parquet_cache.is_fresh) e, caso contrário, do
+        próprio CSV; arquivos do cache sem o CSV de origem são ignorados. Os dados
+        são ordenados por ano e UF, então as consultas filtradas pulam os blocos de
+        outros anos e UFs.
+        """
+        sources = []
+        kinds = set()
+        for csv_path in sorted(glob.glob(os.path.join(data_dir, f'{prefix}_*.csv'))):
+            parquet_files = parquet_cache.get_trade_files(csv_path, cache_dir)
+            if parquet_files and parquet_cache.is_fresh(csv_path, cache_dir):
+                files = ', '.join(sql_literal(path) for path in parquet_files)
+                sources.append(f"SELECT * EXCLUDE (flow) FROM read_parquet([{files}], hive_partitioning = true)")
+                kinds.add('parquet')
+            else:
+                sources.append(
+                    f"SELECT * FROM read_csv({sql_literal(csv_path)}, delim = ';', quote = '\"', header = true, "
+                    f"encoding = 'latin-1')"
+                )
+                kinds.add('csv')
+        if not sources:
+            return
+        self.sources[table_name] = '+'.join(sorted(kinds))
+        # BY NAME: no Parquet, as colunas de partição (CO_ANO, CO_MES) vêm no fim
+        source = '(' + ' UNION ALL BY NAME '.join(sources) + ')'
+
+        self.conn.execute(f"""
+            CREATE TABLE {table_name} AS
+            SELECT t.*, n.no_ncm_por
+            FROM {source} t
+            LEFT JOIN ncm n ON n.co_ncm = t."CO_NCM"
+            ORDER BY t."CO_ANO", t."SG_UF_NCM"
+        """)
+
+    def query(self, query, params=None, timeout_ms=None):
+        """
+        Executa a consulta (parâmetros no formato %(nome)s) e retorna um DataFrame.
+        timeout_ms é aceito por compatibilidade com o PostgresBackend e ignorado.
+        """
+        with instrumentation.stage('query', backend=self.name, **describe_query(query)) as record:
+            df = self.run(query, params)
+            record.add_rows(len(df))
+        return df
+
+    def run(self, query, params):
+        # Cada consulta usa seu próprio cursor: o dashboard atende várias sessões em threads
+        cursor = self.conn.cursor()
+        try:
+            if params:
+                query = re.sub(r'%\((\w+)\)s', r'$\1', query).replace('%%', '%')
+                return cursor.execute(query, params).df()
+            return cursor.execute(query).df()
+        finally:
+            cursor.close()
+
+    def close(self):
+        self.conn.close()
+
+
+# Pool de threads compartilhado pelas consultas executadas em paralelo
+_executor = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix='consulta')
+
+
+def run_concurrently(backend, queries, timeout_ms=None):
+    """
+    Executa as consultas [(consulta, parâmetros), ...] em paralelo e retorna os
+    DataFrames na mesma ordem (a primeira exceção é propagada)
+    """
+    # Cada consulta roda no contexto de quem chamou (ver instrumentation.collect)
+    futures = [
+        _executor.submit(contextvars.copy_context().run, backend.query, query, params, timeout_ms)
+        for query, params in queries
+    ]
+    return [future.result() for future in futures]
+
+
+def describe_query(query):
+    """Identificação da consulta nos registros de métricas: hash do texto e o início dele"""
+    text = ' '.join(query.split())
+    return {'query_id': hashlib.sha1(text.encode('utf-8')).hexdigest()[:12], 'sql': text[:QUERY_TEXT_LENGTH]}
+
+
+def sql_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def get_backend(name=BACKEND, db_config=None):
+    """Cria o backend configurado ('postgres' exige db_config)"""
+    if name == 'postgres':
+        return PostgresBackend(db_config)
+    if name == 'duckdb':
+        return DuckDBBackend()
+    raise ValueError(f"Backend desconhecido: {name} (use 'postgres' ou 'duckdb')")
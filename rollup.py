@@ -0,0 +1,283 @@
+"""
+Tabela de resumo (rollup) com SUM(KG_LIQUIDO) e SUM(VL_FOB) por fluxo, ano, mês,
+UF e código NCM, usada pelo dashboard no lugar das tabelas de dados.
+O resumo é atualizado mês a mês: o send_data.py atualiza os meses carregados
+(comparando o manifesto das cargas com o estado do resumo) e o ncm_data.py,
+os meses enriquecidos.
+
+Uso: python rollup.py [--flow E] [--rebuild]
+"""
+
+import argparse
+
+import psycopg2
+from psycopg2 import sql
+from tqdm import tqdm
+
+import data_version
+import instrumentation
+
+# Configurações do PostgreSQL
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'postgres',
+    'user': 'postgres',
+    'password': 'admin'
+}
+
+# Tabela de resumo e tabela com o estado de cada mês resumido
+ROLLUP_TABLE = 'trade_rollup'
+ROLLUP_STATE_TABLE = 'rollup_state'
+
+# Manifesto das cargas (mesmo do send_data.py)
+MANIFEST_TABLE = 'load_manifest'
+
+# Tabela de dados de cada fluxo (mesmas do send_data.py)
+FLOW_TABLES = {'E': 'export_data', 'I': 'import_data'}
+
+# Métricas somadas no resumo
+ROLLUP_METRICS = ['KG_LIQUIDO', 'VL_FOB']
+
+# Fluxos cujo resumo cobre todos os meses do manifesto, atualizados depois da última carga.
+# Os meses carregados sem o manifesto entram na primeira atualização do fluxo
+# (refresh_months); depois dela, devem ser resumidos com --rebuild.
+# Usada pelo dashboard para decidir entre o resumo e as tabelas de dados
+COVERAGE_QUERY = f"""
+SELECT m.flow,
+       bool_and(coalesce(s.refreshed_at >= m.loaded_at, false)) AS completo
+FROM {MANIFEST_TABLE} m
+LEFT JOIN {ROLLUP_STATE_TABLE} s
+  ON s.flow = m.flow AND s.co_ano = m.co_ano AND s.co_mes = m.co_mes
+GROUP BY m.flow
+"""
+
+
+def create_rollup_tables(conn):
+    """Cria a tabela de resumo e a tabela de estado, se ainda não existirem"""
+    cursor = conn.cursor()
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {rollup} (
+            flow CHAR(1) NOT NULL,
+            "CO_ANO" SMALLINT NOT NULL,
+            "CO_MES" SMALLINT NOT NULL,
+            "SG_UF_NCM" TEXT,
+            "CO_NCM" INTEGER,
+            no_ncm_por TEXT,
+            "KG_LIQUIDO" NUMERIC,
+            "VL_FOB" NUMERIC,
+            row_count BIGINT NOT NULL
+        )
+    """).format(rollup=sql.Identifier(ROLLUP_TABLE)))
+    # Atende à substituição de um mês e às consultas do dashboard (fluxo, ano, [mês,] UF)
+    cursor.execute(sql.SQL(
+        'CREATE INDEX IF NOT EXISTS {index} ON {rollup} (flow, "CO_ANO", "CO_MES", "SG_UF_NCM")'
+    ).format(index=sql.Identifier(f"{ROLLUP_TABLE}_mes_uf_idx"), rollup=sql.Identifier(ROLLUP_TABLE)))
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {state} (
+            flow CHAR(1) NOT NULL,
+            co_ano SMALLINT NOT NULL,
+            co_mes SMALLINT NOT NULL,
+            source_rows BIGINT NOT NULL,
+            rollup_rows BIGINT NOT NULL,
+            refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (flow, co_ano, co_mes)
+        )
+    """).format(state=sql.Identifier(ROLLUP_STATE_TABLE)))
+    conn.commit()
+    cursor.close()
+
+
+def table_exists(cursor, table_name):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table_name,))
+    return cursor.fetchone()[0]
+
+
+def has_description_column(cursor, table_name):
+    """Verifica se a tabela de dados já tem a coluna no_ncm_por (criada pelo ncm_data.py ou pelo --ncm-file)"""
+    cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = 'no_ncm_por' "
+        "AND NOT attisdropped)",
+        (table_name,)
+    )
+    return cursor.fetchone()[0]
+
+
+def has_state(cursor, flow):
+    """Verifica se o resumo do fluxo já foi calculado alguma vez"""
+    cursor.execute(sql.SQL("SELECT EXISTS (SELECT 1 FROM {state} WHERE flow = %s)").format(
+        state=sql.Identifier(ROLLUP_STATE_TABLE)
+    ), (flow,))
+    return cursor.fetchone()[0]
+
+
+def refresh_months(conn, flow, months):
+    """
+    Recalcula o resumo dos (CO_ANO, CO_MES) informados a partir da tabela de dados
+    do fluxo. Cada mês é substituído em uma única transação (DELETE + INSERT e o
+    estado), então o dashboard nunca enxerga um mês resumido pela metade.
+    Na primeira atualização do fluxo, todos os meses da tabela são resumidos.
+    Retorna a quantidade de meses atualizados.
+    """
+    months = sorted({(int(ano), int(mes)) for ano, mes in months})
+    if not months:
+        return 0
+
+    table_name = FLOW_TABLES[flow]
+    create_rollup_tables(conn)
+    cursor = conn.cursor()
+    rollup = sql.Identifier(ROLLUP_TABLE)
+    state = sql.Identifier(ROLLUP_STATE_TABLE)
+
+    delete_query = sql.SQL('DELETE FROM {rollup} WHERE flow = %s AND "CO_ANO" = %s AND "CO_MES" = %s').format(
+        rollup=rollup
+    )
+    insert_template = """
+        WITH inserted AS (
+            INSERT INTO {rollup}
+                (flow, "CO_ANO", "CO_MES", "SG_UF_NCM", "CO_NCM", no_ncm_por, "KG_LIQUIDO", "VL_FOB", row_count)
+            SELECT %s, "CO_ANO", "CO_MES", "SG_UF_NCM", "CO_NCM", {description} AS no_ncm_por,
+                   SUM("KG_LIQUIDO"), SUM("VL_FOB"), count(*)
+            FROM {table}
+            WHERE "CO_ANO" = %s AND "CO_MES" = %s
+            GROUP BY "CO_ANO", "CO_MES", "SG_UF_NCM", "CO_NCM", 6
+            RETURNING row_count
+        )
+        SELECT coalesce(sum(row_count), 0), count(*) FROM inserted
+    """
+    upsert_state = sql.SQL("""
+        INSERT INTO {state} (flow, co_ano, co_mes, source_rows, rollup_rows)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (flow, co_ano, co_mes) DO UPDATE SET
+            source_rows = EXCLUDED.source_rows,
+            rollup_rows = EXCLUDED.rollup_rows,
+            refreshed_at = now()
+    """).format(state=state)
+    delete_state = sql.SQL("DELETE FROM {state} WHERE flow = %s AND co_ano = %s AND co_mes = %s").format(state=state)
+
+    try:
+        if not table_exists(cursor, table_name):
+            print(f"Tabela {table_name} não existe. Resumo não atualizado.")
+            return 0
+        if not has_state(cursor, flow):
+            # Primeira atualização do fluxo: todos os meses da tabela são resumidos,
+            # inclusive os carregados sem o manifesto (que get_stale_months não enxerga)
+            cursor.execute(sql.SQL('SELECT DISTINCT "CO_ANO", "CO_MES" FROM {table}').format(
+                table=sql.Identifier(table_name)
+            ))
+            months = sorted(set(months) | {(int(ano), int(mes)) for ano, mes in cursor.fetchall()})
+        # Antes do ncm_data.py a tabela pode não ter a descrição; o resumo fica sem ela
+        # (o dashboard com USE_NCM_DIMENSION usa a junção pelo CO_NCM)
+        description = sql.SQL('no_ncm_por' if has_description_column(cursor, table_name) else 'NULL::text')
+        insert_query = sql.SQL(insert_template).format(
+            rollup=rollup, table=sql.Identifier(table_name), description=description
+        )
+
+        with instrumentation.stage('rollup', table=table_name, months=len(months)) as record:
+            with tqdm(months, desc=f"Resumindo {table_name}", unit=' mês') as bar:
+                for ano, mes in bar:
+                    cursor.execute(delete_query, (flow, ano, mes))
+                    cursor.execute(insert_query, (flow, ano, mes))
+                    source_rows, rollup_rows = cursor.fetchone()
+                    if rollup_rows:
+                        cursor.execute(upsert_state, (flow, ano, mes, source_rows, rollup_rows))
+                    else:
+                        # Mês que não existe mais na tabela de dados
+                        cursor.execute(delete_state, (flow, ano, mes))
+                    # O dashboard passa a ler o mês atualizado (geração no mesmo commit)
+                    data_version.bump(conn)
+                    conn.commit()
+                    # Linhas da tabela de dados resumidas
+                    record.add_rows(int(source_rows))
+                    bar.set_postfix_str(f"{mes:02d}/{ano}")
+
+        # Estatísticas atualizadas para o planejador depois de substituir os meses
+        cursor.execute(sql.SQL("ANALYZE {rollup}").format(rollup=rollup))
+        conn.commit()
+
+        print(f"Resumo de {table_name} atualizado: {len(months)} meses.")
+        return len(months)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def get_stale_months(conn, flow):
+    """
+    Meses do fluxo carregados (segundo o manifesto) depois da última atualização
+    do resumo, ou ainda não resumidos
+    """
+    create_rollup_tables(conn)
+    cursor = conn.cursor()
+    try:
+        if not table_exists(cursor, MANIFEST_TABLE):
+            return []
+        cursor.execute(sql.SQL("""
+            SELECT m.co_ano, m.co_mes
+            FROM {manifest} m
+            LEFT JOIN {state} s
+              ON s.flow = m.flow AND s.co_ano = m.co_ano AND s.co_mes = m.co_mes
+            WHERE m.table_name = %s
+              AND (s.refreshed_at IS NULL OR s.refreshed_at < m.loaded_at)
+            ORDER BY 1, 2
+        """).format(manifest=sql.Identifier(MANIFEST_TABLE), state=sql.Identifier(ROLLUP_STATE_TABLE)),
+            (FLOW_TABLES[flow],))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def refresh_stale(conn, flows=FLOW_TABLES):
+    """Atualiza o resumo dos meses carregados desde a última atualização. Retorna a quantidade de meses"""
+    total = 0
+    for flow in flows:
+        total += refresh_months(conn, flow, get_stale_months(conn, flow))
+    return total
+
+
+def rebuild(conn, flow):
+    """Recalcula o resumo de todos os meses da tabela de dados (e remove os meses que não existem mais)"""
+    create_rollup_tables(conn)
+    cursor = conn.cursor()
+    try:
+        table_name = FLOW_TABLES[flow]
+        months = []
+        if table_exists(cursor, table_name):
+            cursor.execute(sql.SQL('SELECT DISTINCT "CO_ANO", "CO_MES" FROM {table}').format(
+                table=sql.Identifier(table_name)
+            ))
+            months = cursor.fetchall()
+        cursor.execute(sql.SQL("SELECT co_ano, co_mes FROM {state} WHERE flow = %s").format(
+            state=sql.Identifier(ROLLUP_STATE_TABLE)
+        ), (flow,))
+        months += cursor.fetchall()
+        conn.commit()
+    finally:
+        cursor.close()
+    return refresh_months(conn, flow, months)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Atualiza a tabela de resumo usada pelo dashboard.")
+    parser.add_argument('--flow', choices=sorted(FLOW_TABLES), action='append',
+                        help="fluxo a atualizar (padrão: todos)")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="recalcular todos os meses, não apenas os carregados desde a última atualização")
+    args = parser.parse_args()
+    flows = args.flow or list(FLOW_TABLES)
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        data_version.create_data_version_table(conn)
+        if args.rebuild:
+            for flow in flows:
+                rebuild(conn, flow)
+        elif not refresh_stale(conn, flows):
+            print("Resumo já está atualizado.")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
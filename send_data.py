@@ -1,8 +1,30 @@
+import numpy as np
 import pandas as pd
 import psycopg2
-from io import StringIO
+from io import BytesIO, StringIO
+import argparse
 import csv
+import glob
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stderr, redirect_stdout
+from functools import lru_cache
 from psycopg2 import sql
+from tqdm import tqdm
+
+import binary_copy
+import csv_reader
+import data_version
+import instrumentation
+import ncm_data
+import parquet_cache
+import rollup
 
 # Configurações do PostgreSQL
 DB_CONFIG = {
@@ -12,30 +34,262 @@ DB_CONFIG = {
     'password': 'admin'
 }
 
-# Função para ler o arquivo CSV
-def read_csv(file_path):
-    csv_file = file_path
-    
-    # Lendo o CSV com pandas
-    df = pd.read_csv(csv_file, sep=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-    
-    # Convertendo colunas numéricas para tipos apropriados
-    numeric_cols = ['CO_ANO', 'CO_MES', 'QT_ESTAT', 'KG_LIQUIDO', 'VL_FOB']
-    for col in numeric_cols:
+# Formato usado no COPY: 'text' (to_csv) ou 'binary' (binary_copy, direto dos arrays NumPy)
+COPY_FORMAT = 'text'
+
+# Arquivo NCM.csv usado para preencher a descrição dos produtos durante a leitura
+# (None = a descrição é preenchida depois, pelo ncm_data.py)
+NCM_FILE = None
+
+# Coluna com a descrição do produto, derivada de CO_NCM
+NCM_DESCRIPTION_COLUMN = 'no_ncm_por'
+
+# Leitor de CSV: 'c' (leitor padrão do pandas) ou 'pyarrow'
+CSV_ENGINE = 'c'
+
+# Ler os arquivos do cache em Parquet (parquet_cache.py) quando ele estiver atualizado
+USE_PARQUET_CACHE = True
+
+# Quantidade de linhas lidas por bloco no modo streaming
+CHUNK_SIZE = 500_000
+
+# Tamanho aproximado, em bytes, de cada faixa do arquivo no modo de leitura paralela
+PARSE_RANGE_SIZE = 32 * 1024 * 1024
+
+# Colunas numéricas convertidas após a leitura
+NUMERIC_COLS = ['CO_ANO', 'CO_MES', 'QT_ESTAT', 'KG_LIQUIDO', 'VL_FOB']
+
+# Colunas que compõem a chave única das tabelas
+KEY_COLUMNS = ['CO_ANO', 'CO_MES', 'CO_NCM', 'CO_UNID', 'CO_PAIS', 'SG_UF_NCM', 'CO_VIA', 'CO_URF']
+
+# Colunas que identificam uma partição mensal dos dados
+MONTH_COLUMNS = ['CO_ANO', 'CO_MES']
+
+# Tipos explícitos das colunas dos arquivos EXP/IMP, usados no esquema tipado
+TYPED_SCHEMA = {
+    'CO_ANO': 'SMALLINT',
+    'CO_MES': 'SMALLINT',
+    'CO_NCM': 'INTEGER',
+    'CO_UNID': 'SMALLINT',
+    'CO_PAIS': 'SMALLINT',
+    'SG_UF_NCM': 'CHAR(2)',
+    'CO_VIA': 'SMALLINT',
+    'CO_URF': 'INTEGER',
+    'QT_ESTAT': 'BIGINT',
+    'KG_LIQUIDO': 'BIGINT',
+    'VL_FOB': 'BIGINT',
+    'VL_FRETE': 'BIGINT',
+    'VL_SEGURO': 'BIGINT',
+}
+
+# Tabela que registra a impressão digital de cada mês já carregado
+MANIFEST_TABLE = 'load_manifest'
+
+# Prefixos dos arquivos baixados e o tipo de dado correspondente
+FILE_PREFIXES = {'EXP': 'E', 'IMP': 'I'}
+
+# Quantidade padrão de arquivos carregados em paralelo no modo em lote
+BATCH_WORKERS = 4
+
+# Processos paralelos usados pelo PostgreSQL na criação dos índices após a carga em massa
+INDEX_BUILD_WORKERS = 4
+
+# Função para converter as colunas numéricas de um DataFrame (ou bloco)
+def coerce_types(df):
+    for col in NUMERIC_COLS:
         if col in df.columns:
             df[col] = pd.to_numeric(df[col], errors='coerce')
-    
+
+    # Colunas inteiras com valores ausentes viram float64 na leitura; o tipo inteiro
+    # com suporte a nulos evita que "123.0" seja enviado para colunas inteiras
+    for col in df.columns:
+        if pd.api.types.is_float_dtype(df[col]):
+            values = df[col].dropna()
+            if (values == values.round()).all():
+                df[col] = df[col].astype('Int64')
+    return df
+
+# Função para obter a estrutura de consulta do NCM, lida uma única vez por processo
+@lru_cache(maxsize=1)
+def get_ncm_lookup(file_path):
+    lookup = ncm_data.load_ncm_lookup(file_path)
+    if lookup is None:
+        raise ValueError(f"Não foi possível ler o mapeamento NCM de {file_path}")
+    return lookup
+
+# Função para preencher a descrição dos produtos, se NCM_FILE estiver definido
+def attach_ncm_descriptions(df):
+    if NCM_FILE is None or 'CO_NCM' not in df.columns:
+        return df
+    df[NCM_DESCRIPTION_COLUMN] = ncm_data.lookup_ncm_descriptions(df['CO_NCM'], get_ncm_lookup(NCM_FILE))
     return df
 
+# Função para verificar se o arquivo pode ser lido do cache em Parquet
+def use_parquet_cache(file_path):
+    return USE_PARQUET_CACHE and parquet_cache.is_fresh(file_path)
+
+# Função para ler o arquivo CSV
+def read_csv(file_path, parse_workers=None):
+    with instrumentation.stage('parse', file=os.path.basename(file_path)) as record:
+        if use_parquet_cache(file_path):
+            # O arquivo já foi convertido: nenhuma interpretação de CSV é necessária
+            record.set(source='parquet')
+            df = coerce_types(parquet_cache.read_trade(file_path))
+        elif parse_workers:
+            # Leitura paralela por faixas de bytes, reunidas na ordem do arquivo
+            record.set(workers=parse_workers)
+            df = pd.concat(read_csv_parallel(file_path, parse_workers), ignore_index=True)
+        else:
+            # Lendo o CSV com os tipos definidos em csv_reader.TRADE_DTYPES
+            df = csv_reader.read_csv(file_path, engine=CSV_ENGINE)
+
+            # Convertendo colunas numéricas para tipos apropriados
+            df = coerce_types(df)
+
+        df = attach_ncm_descriptions(df)
+        record.add_rows(len(df))
+    return df
+
+# Função para ler o arquivo CSV em blocos de tamanho fixo
+def read_csv_chunks(file_path, chunksize=CHUNK_SIZE, parse_workers=None, months=None):
+    """
+    Se `months` for informado e o arquivo estiver no cache em Parquet, apenas as
+    partições desses meses são lidas; na leitura do CSV, os blocos vêm completos.
+    """
+    fields = {'file': os.path.basename(file_path)}
+    if use_parquet_cache(file_path):
+        fields['source'] = 'parquet'
+        chunks = (
+            attach_ncm_descriptions(coerce_types(chunk))
+            for chunk in parquet_cache.iter_trade(file_path, chunksize, months=months)
+        )
+    elif parse_workers:
+        # Com leitura paralela, cada bloco corresponde a uma faixa de bytes
+        fields['workers'] = parse_workers
+        chunks = (attach_ncm_descriptions(chunk) for chunk in read_csv_parallel(file_path, parse_workers))
+    else:
+        chunks = (
+            attach_ncm_descriptions(coerce_types(chunk))
+            for chunk in csv_reader.read_csv_chunks(file_path, chunksize, engine=CSV_ENGINE)
+        )
+
+    # O tempo medido é o da leitura dos blocos, sem o do envio de cada um
+    yield from instrumentation.timed_iter('parse', chunks, **fields)
+
+# Função para dividir o arquivo em faixas de bytes alinhadas ao fim das linhas
+def split_byte_ranges(file_path, range_size=PARSE_RANGE_SIZE):
+    """
+    Retorna as faixas (início, fim) que cobrem o arquivo após o cabeçalho.
+    Cada faixa termina em uma quebra de linha; os arquivos EXP/IMP não possuem
+    quebras de linha dentro de campos entre aspas.
+    """
+    size = os.path.getsize(file_path)
+    ranges = []
+    with open(file_path, 'rb') as f:
+        f.readline()
+        start = f.tell()
+        while start < size:
+            end = start + range_size
+            if end < size:
+                # Avança até o fim da linha corrente
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            else:
+                end = size
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+# Função executada em cada processo para ler uma faixa de bytes do arquivo
+def parse_byte_range(file_path, columns, start, end, encoding):
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    df = csv_reader.read_csv_bytes(BytesIO(data), columns, encoding=encoding)
+    return coerce_types(df)
+
+# Função para ler o arquivo CSV em paralelo, dividindo-o em faixas de bytes
+def read_csv_parallel(file_path, workers, range_size=PARSE_RANGE_SIZE):
+    """
+    Lê as faixas em processos separados e entrega os DataFrames na ordem do
+    arquivo. No máximo 2 * workers faixas ficam em memória ao mesmo tempo.
+    """
+    encoding = csv_reader.detect_encoding(file_path)
+    columns = csv_reader.read_header(file_path, encoding)
+    ranges = split_byte_ranges(file_path, range_size)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(parse_byte_range, file_path, columns, start, end, encoding))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+# Função para ler os blocos em uma thread separada, enquanto o bloco anterior é enviado
+def prefetch(iterator, max_pending=1):
+    """
+    Consome o iterador em segundo plano mantendo no máximo `max_pending`
+    blocos prontos na fila, de modo que a memória fique limitada ao tamanho do bloco
+    """
+    pending = queue.Queue(maxsize=max_pending)
+    done = object()
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(done)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
 # Função para criar a tabela no PostgreSQL
-def create_table(conn, df, data_type):
+def create_table(conn, df, data_type, typed=False, partition_by_month=False, defer_constraints=False):
+    """
+    Cria a tabela, se ainda não existir, e as partições necessárias para os dados do DataFrame.
+    Com typed=True, os tipos vêm de TYPED_SCHEMA e a tabela é particionada por
+    CO_ANO (LIST) ou, com partition_by_month=True, por (CO_ANO, CO_MES) (RANGE).
+    Com defer_constraints=True, a tabela é criada sem a constraint de unicidade,
+    que é construída depois por finalize_bulk_load.
+    """
     cursor = conn.cursor()
     
     # Gerando os tipos de colunas automaticamente
     columns_with_types = []
     for col in df.columns:
         dtype = df[col].dtype
-        if dtype == 'int64':
+        if col == NCM_DESCRIPTION_COLUMN:
+            pg_type = 'TEXT'
+        elif typed and col.upper() in TYPED_SCHEMA:
+            pg_type = TYPED_SCHEMA[col.upper()]
+        elif pd.api.types.is_integer_dtype(dtype):
             pg_type = 'BIGINT'
         elif dtype == 'float64':
             pg_type = 'FLOAT'
@@ -44,7 +298,7 @@ def create_table(conn, df, data_type):
         columns_with_types.append(f'"{col}" {pg_type}')
     
     # Identificar os nomes exatos das colunas de chave no DataFrame
-    key_column_names = ['CO_ANO', 'CO_MES', 'CO_NCM', 'CO_UNID', 'CO_PAIS', 'SG_UF_NCM', 'CO_VIA', 'CO_URF']
+    key_column_names = KEY_COLUMNS
     existing_key_columns = []
     
     for key_col in key_column_names:
@@ -55,35 +309,95 @@ def create_table(conn, df, data_type):
         
     # Somente incluir a constraint se todas as colunas da chave existirem
     constraint_clause = ""
-    if len(existing_key_columns) == len(key_column_names):
-        constraint_name = "export_data_unique" if data_type == 'E' else "import_data_unique"
+    if len(existing_key_columns) == len(key_column_names) and not defer_constraints:
+        constraint_name = get_constraint_name(data_type)
         constraint_clause = f", CONSTRAINT {constraint_name} UNIQUE ({', '.join(existing_key_columns)})"
     
+    # A chave de partição faz parte da chave única, então a constraint continua válida
+    partition_clause = ""
+    if typed:
+        partition_clause = 'PARTITION BY RANGE ("CO_ANO", "CO_MES")' if partition_by_month else 'PARTITION BY LIST ("CO_ANO")'
+
     if data_type == 'E':
         create_table_sql = f"""
         CREATE TABLE IF NOT EXISTS export_data (
             {', '.join(columns_with_types)}
             {constraint_clause}
-        );
+        ) {partition_clause};
         """
     if data_type == 'I':
         create_table_sql = f"""
         CREATE TABLE IF NOT EXISTS import_data (
             {', '.join(columns_with_types)}
             {constraint_clause}
-        );
+        ) {partition_clause};
         """
     
+    # Serializa a criação entre cargas concorrentes (CREATE TABLE IF NOT EXISTS não é
+    # seguro quando duas sessões criam a mesma tabela ao mesmo tempo)
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (get_table_name(data_type),))
     cursor.execute(create_table_sql)
+    if NCM_DESCRIPTION_COLUMN in df.columns:
+        # Tabelas criadas antes do preenchimento na carga ainda não têm a coluna
+        cursor.execute(sql.SQL("ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {col} TEXT").format(
+            table=sql.Identifier(get_table_name(data_type)), col=sql.Identifier(NCM_DESCRIPTION_COLUMN)
+        ))
+    ensure_partitions(cursor, data_type, df)
     conn.commit()
     cursor.close()
 
+# Função para criar as partições que ainda não existem para os dados do DataFrame
+def ensure_partitions(cursor, data_type, df):
+    """
+    Não faz nada se a tabela não for particionada. Não confirma a transação:
+    quem chama decide quando fazer o commit.
+    """
+    table_name = get_table_name(data_type)
+    cursor.execute(
+        "SELECT partnatts FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", (table_name,)
+    )
+    row = cursor.fetchone()
+    if row is None or df.empty:
+        return
+
+    # Partições por ano (LIST em CO_ANO) ou por mês (RANGE em CO_ANO, CO_MES)
+    years = sorted(int(y) for y in df['CO_ANO'].dropna().unique())
+    by_month = row[0] == 2
+    wanted = {}
+    for year in years:
+        if by_month:
+            for month in range(1, 13):
+                wanted[f"{table_name}_{year}_{month:02d}"] = sql.SQL("FROM ({y}, {m}) TO ({y}, {n})").format(
+                    y=sql.Literal(year), m=sql.Literal(month), n=sql.Literal(month + 1)
+                )
+        else:
+            wanted[f"{table_name}_{year}"] = sql.SQL("IN ({y})").format(y=sql.Literal(year))
+
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass",
+        (table_name,)
+    )
+    existing = {relname for (relname,) in cursor.fetchall()}
+    missing = [name for name in wanted if name not in existing]
+    if not missing and f"{table_name}_default" in existing:
+        return
+
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (table_name,))
+    # A partição padrão recebe linhas sem ano/mês válidos
+    cursor.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {part} PARTITION OF {table} DEFAULT").format(
+        part=sql.Identifier(f"{table_name}_default"), table=sql.Identifier(table_name)
+    ))
+    for name in missing:
+        cursor.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {part} PARTITION OF {table} FOR VALUES {bounds}").format(
+            part=sql.Identifier(name), table=sql.Identifier(table_name), bounds=wanted[name]
+        ))
+
 # Função para verificar se os dados já existem
 def check_existing_data(conn, df, data_type):
     cursor = conn.cursor()
     
     # Identificar colunas que compõem a chave única
-    key_columns = ['CO_ANO', 'CO_MES', 'CO_NCM', 'CO_UNID', 'CO_PAIS', 'SG_UF_NCM', 'CO_VIA', 'CO_URF']
+    key_columns = KEY_COLUMNS
     
     # Verificar se todas as colunas necessárias estão presentes
     missing_cols = [col for col in key_columns if col not in df.columns]
@@ -94,24 +408,26 @@ def check_existing_data(conn, df, data_type):
     # Construir consulta para verificar registros existentes
     table_name = 'export_data' if data_type == 'E' else 'import_data'
     
-    # Criar uma string com os valores das colunas-chave para comparação
-    df['key_values'] = df[key_columns].astype(str).apply(lambda row: '|'.join(row), axis=1)
-    
-    # Consultar os registros existentes
-    existing_query = sql.SQL("SELECT {cols} FROM {table}").format(
-        cols=sql.SQL(',').join(map(sql.Identifier, key_columns)),
-        table=sql.Identifier(table_name)
-    )
-    
-    cursor.execute(existing_query)
-    existing_records = cursor.fetchall()
-    
-    # Criar conjunto de chaves existentes
-    existing_keys = set('|'.join(str(value) for value in row) for row in existing_records)
-    
-    # Filtrar DataFrame para manter apenas registros não existentes
-    new_records = df[~df['key_values'].isin(existing_keys)].copy()
-    
+    with instrumentation.stage('dedup', rows=len(df), table=table_name, method='client') as record:
+        # Criar uma string com os valores das colunas-chave para comparação
+        df['key_values'] = df[key_columns].astype(str).apply(lambda row: '|'.join(row), axis=1)
+
+        # Consultar os registros existentes
+        existing_query = sql.SQL("SELECT {cols} FROM {table}").format(
+            cols=sql.SQL(',').join(map(sql.Identifier, key_columns)),
+            table=sql.Identifier(table_name)
+        )
+
+        cursor.execute(existing_query)
+        existing_records = cursor.fetchall()
+
+        # Criar conjunto de chaves existentes
+        existing_keys = set('|'.join(str(value) for value in row) for row in existing_records)
+
+        # Filtrar DataFrame para manter apenas registros não existentes
+        new_records = df[~df['key_values'].isin(existing_keys)].copy()
+        record.set(new_rows=len(new_records))
+
     cursor.close()
     
     if len(new_records) == 0:
@@ -122,39 +438,825 @@ def check_existing_data(conn, df, data_type):
     
     return new_records.drop(columns=['key_values'])
 
+# Função para obter o nome da tabela de acordo com o tipo de dado
+def get_table_name(data_type):
+    return 'export_data' if data_type == 'E' else 'import_data'
+
+# Função para obter o nome da constraint de unicidade de acordo com o tipo de dado
+def get_constraint_name(data_type):
+    return 'export_data_unique' if data_type == 'E' else 'import_data_unique'
+
+# Função para verificar se a constraint de unicidade existe na tabela
+def has_unique_constraint(cursor, data_type):
+    cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = %s::regclass AND conname = %s)",
+        (get_table_name(data_type), get_constraint_name(data_type))
+    )
+    return cursor.fetchone()[0]
+
+# Função para enviar um DataFrame via COPY para uma tabela
+def copy_dataframe(cursor, df, table_name):
+    with instrumentation.stage('copy', rows=len(df), table=table_name) as record:
+        record.set(format=write_copy(cursor, df, table_name))
+
+# Função para escrever o COPY de um DataFrame; retorna o formato usado ('text' ou 'binary')
+def write_copy(cursor, df, table_name):
+    if COPY_FORMAT == 'binary':
+        column_types = binary_copy.get_column_types(cursor, table_name)
+        # Tipos sem codificação binária (ex.: NUMERIC) e valores fora dos limites do tipo
+        # usam o formato texto, em que o PostgreSQL rejeita os valores inválidos
+        if binary_copy.supports_binary(df, column_types):
+            copy_query = sql.SQL("COPY {table} ({cols}) FROM STDIN WITH (FORMAT binary)").format(
+                table=sql.Identifier(table_name),
+                cols=sql.SQL(', ').join(map(sql.Identifier, df.columns))
+            )
+            encoding = psycopg2.extensions.encodings[cursor.connection.encoding]
+            data = binary_copy.encode_dataframe(df, column_types, encoding)
+            cursor.copy_expert(copy_query.as_string(cursor), BytesIO(data))
+            return 'binary'
+
+    output = StringIO()
+    # Escrever os dados no buffer no formato que o PostgreSQL espera
+    df.to_csv(output, sep='\t', header=False, index=False, quoting=csv.QUOTE_NONE, escapechar='\\')
+    output.seek(0)
+
+    # As colunas são listadas explicitamente para que colunas extras da tabela
+    # (como no_ncm_por) não quebrem o COPY
+    copy_query = sql.SQL("COPY {table} ({cols}) FROM STDIN WITH NULL AS ''").format(
+        table=sql.Identifier(table_name),
+        cols=sql.SQL(', ').join(map(sql.Identifier, df.columns))
+    )
+    cursor.copy_expert(copy_query.as_string(cursor), output)
+    return 'text'
+
+# Função para criar a tabela de manifesto das cargas
+def create_manifest_table(conn):
+    cursor = conn.cursor()
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {manifest} (
+            table_name VARCHAR(63) NOT NULL,
+            flow CHAR(1) NOT NULL,
+            co_ano SMALLINT NOT NULL,
+            co_mes SMALLINT NOT NULL,
+            row_count BIGINT NOT NULL,
+            sum_vl_fob NUMERIC,
+            sum_kg_liquido NUMERIC,
+            content_hash CHAR(32) NOT NULL,
+            loaded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (table_name, co_ano, co_mes)
+        )
+    """).format(manifest=sql.Identifier(MANIFEST_TABLE)))
+    conn.commit()
+    cursor.close()
+
+# Função para calcular a impressão digital de cada (CO_ANO, CO_MES) de um DataFrame
+def compute_month_fingerprints(df):
+    """
+    Calcula, em uma única passada vetorizada, a quantidade de linhas, as somas
+    de VL_FOB e KG_LIQUIDO e um hash do conteúdo de cada mês.
+    O hash de cada linha é somado (módulo 2^64) dentro do mês, então o
+    resultado não depende da ordem das linhas e pode ser acumulado bloco a bloco.
+    Retorna um DataFrame indexado por (CO_ANO, CO_MES).
+    """
+    # Normaliza os tipos para que o hash não dependa dos dtypes inferidos na leitura;
+    # a descrição do produto é derivada de CO_NCM e não faz parte do conteúdo do arquivo
+    canonical = pd.DataFrame({
+        col: df[col].astype('float64') if pd.api.types.is_numeric_dtype(df[col]) else df[col].astype(object)
+        for col in df.columns if col != NCM_DESCRIPTION_COLUMN
+    })
+    row_hash = pd.util.hash_pandas_object(canonical, index=False).to_numpy()
+
+    # As duas metades de 32 bits são somadas em int64 para evitar overflow
+    parts = pd.DataFrame({
+        'CO_ANO': df['CO_ANO'].to_numpy(),
+        'CO_MES': df['CO_MES'].to_numpy(),
+        'hash_lo': (row_hash & np.uint64(0xFFFFFFFF)).astype('int64'),
+        'hash_hi': (row_hash >> np.uint64(32)).astype('int64'),
+        'sum_vl_fob': df['VL_FOB'].to_numpy() if 'VL_FOB' in df.columns else np.nan,
+        'sum_kg_liquido': df['KG_LIQUIDO'].to_numpy() if 'KG_LIQUIDO' in df.columns else np.nan,
+    })
+    grouped = parts.groupby(MONTH_COLUMNS)
+    fingerprints = grouped[['hash_lo', 'hash_hi', 'sum_vl_fob', 'sum_kg_liquido']].sum()
+    fingerprints['row_count'] = grouped.size()
+    return fingerprints
+
+# Função para somar as impressões digitais calculadas em blocos diferentes
+def merge_fingerprints(accumulated, fingerprints):
+    if accumulated is None:
+        return fingerprints
+    # concat + groupby preserva os inteiros (add com fill_value converteria para float)
+    return pd.concat([accumulated, fingerprints]).groupby(level=MONTH_COLUMNS).sum()
+
+# Função para formatar o hash de conteúdo de cada mês
+def format_content_hashes(fingerprints):
+    return {
+        key: f"{int(row.hash_hi) % 2**64:016x}{int(row.hash_lo) % 2**64:016x}"
+        for key, row in zip(fingerprints.index, fingerprints.itertuples())
+    }
+
+# Função para obter os meses cujas impressões digitais diferem do manifesto
+def get_changed_months(cursor, data_type, fingerprints):
+    cursor.execute(
+        sql.SQL("SELECT co_ano, co_mes, row_count, content_hash FROM {manifest} WHERE table_name = %s").format(
+            manifest=sql.Identifier(MANIFEST_TABLE)
+        ),
+        (get_table_name(data_type),)
+    )
+    loaded = {(ano, mes): (row_count, content_hash) for ano, mes, row_count, content_hash in cursor.fetchall()}
+
+    hashes = format_content_hashes(fingerprints)
+    changed = []
+    for key, row in zip(fingerprints.index, fingerprints.itertuples()):
+        if loaded.get(key) != (int(row.row_count), hashes[key]):
+            changed.append(key)
+    return changed
+
+# Função para verificar se o manifesto já possui algum mês da tabela
+def has_manifest_entries(cursor, data_type):
+    cursor.execute(
+        sql.SQL("SELECT EXISTS (SELECT 1 FROM {manifest} WHERE table_name = %s)").format(
+            manifest=sql.Identifier(MANIFEST_TABLE)
+        ),
+        (get_table_name(data_type),)
+    )
+    return cursor.fetchone()[0]
+
+# Função para registrar no manifesto os meses carregados (na transação corrente)
+def record_manifest(cursor, data_type, fingerprints, only_new=False):
+    """
+    Com only_new=True (cargas em modo append), a impressão digital só é gravada
+    para meses ainda ausentes do manifesto: um mês revisado acrescentado à tabela
+    não foi substituído, então mantém a impressão digital anterior e continua sendo
+    reportado por get_changed_months para um --mode replace posterior. Apenas
+    loaded_at é atualizado, para que rollup.py resuma as linhas acrescentadas.
+    """
+    hashes = format_content_hashes(fingerprints)
+    rows = [
+        (
+            get_table_name(data_type), data_type, int(ano), int(mes), int(row.row_count),
+            None if pd.isna(row.sum_vl_fob) else int(row.sum_vl_fob),
+            None if pd.isna(row.sum_kg_liquido) else int(row.sum_kg_liquido),
+            hashes[(ano, mes)]
+        )
+        for (ano, mes), row in zip(fingerprints.index, fingerprints.itertuples())
+    ]
+    upsert = sql.SQL("""
+        INSERT INTO {manifest}
+            (table_name, flow, co_ano, co_mes, row_count, sum_vl_fob, sum_kg_liquido, content_hash)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (table_name, co_ano, co_mes) {conflict}
+    """).format(
+        manifest=sql.Identifier(MANIFEST_TABLE),
+        conflict=sql.SQL("DO UPDATE SET loaded_at = now()" if only_new else """DO UPDATE SET
+            flow = EXCLUDED.flow,
+            row_count = EXCLUDED.row_count,
+            sum_vl_fob = EXCLUDED.sum_vl_fob,
+            sum_kg_liquido = EXCLUDED.sum_kg_liquido,
+            content_hash = EXCLUDED.content_hash,
+            loaded_at = now()""")
+    )
+    cursor.executemany(upsert, rows)
+
+# Função para filtrar as linhas pertencentes aos meses informados
+def filter_months(df, months):
+    keys = pd.MultiIndex.from_frame(df[MONTH_COLUMNS])
+    return df[keys.isin(months)]
+
+# Função para inserir um lote passando por uma tabela de staging temporária
+def insert_via_staging(cursor, df, data_type, use_constraint=True, bulk_load=False):
+    """
+    Envia o lote via COPY para uma tabela temporária e insere na tabela final
+    com ON CONFLICT DO NOTHING. A deduplicação é feita pelo índice único no
+    servidor, então o custo depende do tamanho do lote e não do histórico.
+    Com bulk_load=True (carga em massa, cuja constraint é criada depois por
+    finalize_bulk_load), o lote vai direto para a tabela final.
+    Retorna a quantidade de registros efetivamente inseridos.
+    """
+    table_name = get_table_name(data_type)
+    staging_name = f"staging_{table_name}"
+
+    if bulk_load:
+        copy_dataframe(cursor, df, table_name)
+        return len(df)
+
+    # Tabelas temporárias não geram WAL; ela é descartada ao final da transação
+    cursor.execute(sql.SQL(
+        "CREATE TEMPORARY TABLE IF NOT EXISTS {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"
+    ).format(staging=sql.Identifier(staging_name), table=sql.Identifier(table_name)))
+    cursor.execute(sql.SQL("TRUNCATE {staging}").format(staging=sql.Identifier(staging_name)))
+    copy_dataframe(cursor, df, staging_name)
+
+    # Sem a constraint (colunas-chave ausentes) qualquer índice único existente é usado
+    conflict_target = sql.SQL("ON CONSTRAINT {}").format(
+        sql.Identifier(get_constraint_name(data_type))
+    ) if use_constraint else sql.SQL("")
+    cols = sql.SQL(', ').join(map(sql.Identifier, df.columns))
+    with instrumentation.stage('dedup', rows=len(df), table=table_name, method='staging') as record:
+        cursor.execute(sql.SQL(
+            "INSERT INTO {table} ({cols}) SELECT {cols} FROM {staging} ON CONFLICT {target} DO NOTHING"
+        ).format(
+            table=sql.Identifier(table_name),
+            cols=cols,
+            staging=sql.Identifier(staging_name),
+            target=conflict_target
+        ))
+        record.set(new_rows=cursor.rowcount)
+    return cursor.rowcount
+
+# Função para substituir meses inteiros de forma atômica
+def replace_months(conn, chunks, data_type, months=None):
+    """
+    Substitui, mês a mês, os dados da tabela pelos dados recebidos.
+    Os blocos são enviados primeiro para uma tabela temporária lateral; depois,
+    para cada (CO_ANO, CO_MES), o DELETE dos dados antigos, o INSERT dos novos e
+    a atualização do manifesto ocorrem em uma única transação, então o dashboard
+    nunca enxerga um mês pela metade. O custo é proporcional ao mês substituído.
+    Se `months` for informado, apenas esses meses são substituídos.
+    Retorna a quantidade de registros inseridos, ou None em caso de erro.
+    """
+    table_name = get_table_name(data_type)
+    staging_name = f"replace_{table_name}"
+    cursor = conn.cursor()
+    fingerprints = None
+    columns = None
+    total = 0
+
+    try:
+        for chunk in chunks:
+            if columns is None:
+                # A tabela e a tabela lateral são criadas a partir do primeiro bloco
+                create_table(conn, chunk, data_type)
+                columns = list(chunk.columns)
+                cursor.execute(sql.SQL("DROP TABLE IF EXISTS {staging}").format(
+                    staging=sql.Identifier(staging_name)
+                ))
+                cursor.execute(sql.SQL(
+                    "CREATE TEMPORARY TABLE {staging} (LIKE {table} INCLUDING DEFAULTS)"
+                ).format(staging=sql.Identifier(staging_name), table=sql.Identifier(table_name)))
+            else:
+                ensure_partitions(cursor, data_type, chunk)
+            if months is not None:
+                chunk = filter_months(chunk, months)
+                if chunk.empty:
+                    continue
+            fingerprints = merge_fingerprints(fingerprints, compute_month_fingerprints(chunk))
+            copy_dataframe(cursor, chunk, staging_name)
+
+        if fingerprints is None:
+            print("Nenhum registro para substituir.")
+            return 0
+
+        cursor.execute(sql.SQL("CREATE INDEX ON {staging} ({cols})").format(
+            staging=sql.Identifier(staging_name),
+            cols=sql.SQL(', ').join(map(sql.Identifier, MONTH_COLUMNS))
+        ))
+        cursor.execute(sql.SQL("ANALYZE {staging}").format(staging=sql.Identifier(staging_name)))
+        conn.commit()
+
+        month_filter = sql.SQL("{ano} = %s AND {mes} = %s").format(
+            ano=sql.Identifier('CO_ANO'), mes=sql.Identifier('CO_MES')
+        )
+        cols = sql.SQL(', ').join(map(sql.Identifier, columns))
+        delete_query = sql.SQL("DELETE FROM {table} WHERE {filter}").format(
+            table=sql.Identifier(table_name), filter=month_filter
+        )
+        insert_query = sql.SQL("INSERT INTO {table} ({cols}) SELECT {cols} FROM {staging} WHERE {filter}").format(
+            table=sql.Identifier(table_name), cols=cols, staging=sql.Identifier(staging_name), filter=month_filter
+        )
+
+        for ano, mes in fingerprints.index:
+            params = (int(ano), int(mes))
+            with instrumentation.stage('replace', table=table_name, month=f"{int(ano)}-{int(mes):02d}") as record:
+                cursor.execute(delete_query, params)
+                deleted = cursor.rowcount
+                cursor.execute(insert_query, params)
+                inserted = cursor.rowcount
+                record.set(deleted_rows=deleted)
+                record.add_rows(inserted)
+            record_manifest(cursor, data_type, fingerprints.loc[[(ano, mes)]])
+            # Nova geração no mesmo commit do mês: se um mês seguinte falhar, os já
+            # substituídos não ficam com resultados antigos no cache do dashboard
+            data_version.bump(conn)
+            conn.commit()
+            print(f"Mês {int(mes):02d}/{int(ano)}: {deleted} registros substituídos por {inserted}.")
+            total += inserted
+        return total
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro ao substituir dados: {e}")
+        return None
+    finally:
+        if not conn.closed:
+            cursor.execute(sql.SQL("DROP TABLE IF EXISTS {staging}").format(
+                staging=sql.Identifier(staging_name)
+            ))
+            conn.commit()
+        cursor.close()
+
 # Função para inserir dados no PostgreSQL
-def insert_data(conn, df, data_type):
+def insert_data(conn, df, data_type, dedup='staging', fingerprints=None, bulk_load=False):
+    """
+    Insere o DataFrame ignorando registros já existentes.
+    dedup='staging' deduplica no servidor (padrão); dedup='client' usa a
+    comparação em Python de check_existing_data. Com bulk_load=True, a
+    deduplicação fica para finalize_bulk_load (ver insert_via_staging).
+    Se `fingerprints` for informado, os meses novos são registrados no manifesto
+    na mesma transação (ver record_manifest).
+    Retorna a quantidade de registros inseridos, ou None em caso de erro.
+    """
+    if dedup == 'staging':
+        cursor = conn.cursor()
+        try:
+            inserted = insert_via_staging(cursor, df, data_type, has_unique_constraint(cursor, data_type), bulk_load)
+            if fingerprints is not None:
+                record_manifest(cursor, data_type, fingerprints, only_new=True)
+            # Nova geração dos dados no mesmo commit da carga
+            data_version.bump(conn)
+            conn.commit()
+            print(f"{inserted} registros inseridos com sucesso! {len(df) - inserted} já existiam e foram ignorados.")
+            return inserted
+        except Exception as e:
+            conn.rollback()
+            print(f"Erro ao inserir dados: {e}")
+            return None
+        finally:
+            cursor.close()
+
     cursor = conn.cursor()
     
     # Verificar dados existentes antes de inserir
     df = check_existing_data(conn, df, data_type)
     if df is None:
-        return  # Todos os dados já existem
+        return 0  # Todos os dados já existem
     elif len(df) == 0:
         print("Nenhum novo registro para inserir.")
-        return
-    
-    output = StringIO()
-    # Escrever os dados no buffer no formato que o PostgreSQL espera
-    df.to_csv(output, sep='\t', header=False, index=False, quoting=csv.QUOTE_NONE, escapechar='\\')
-    output.seek(0)
+        return 0
     
     # Copiando os dados para o PostgreSQL
     try:
-        if data_type == 'E':
-            cursor.copy_expert("COPY export_data FROM STDIN WITH NULL AS ''", output)
-        elif data_type == 'I':
-            cursor.copy_expert("COPY import_data FROM STDIN WITH NULL AS ''", output)
+        copy_dataframe(cursor, df, get_table_name(data_type))
+        if fingerprints is not None:
+            record_manifest(cursor, data_type, fingerprints, only_new=True)
+        data_version.bump(conn)
         conn.commit()
         print(f"{len(df)} registros inseridos com sucesso!")
+        return len(df)
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro ao inserir dados: {e}")
+        return None
+    finally:
+        cursor.close()
+
+# Função para calcular as impressões digitais de um arquivo lendo-o em blocos
+def compute_file_fingerprints(file_path, chunksize=CHUNK_SIZE, parse_workers=None):
+    fingerprints = None
+    for chunk in prefetch(read_csv_chunks(file_path, chunksize, parse_workers)):
+        fingerprints = merge_fingerprints(fingerprints, compute_month_fingerprints(chunk))
+    return fingerprints
+
+# Função para atualizar a barra de progresso conforme os blocos são consumidos
+def track_progress(chunks, bar):
+    for chunk in chunks:
+        bar.update(len(chunk))
+        yield chunk
+
+# Função para carregar um arquivo em blocos, com memória limitada pelo tamanho do bloco
+def insert_data_streaming(conn, file_path, data_type, chunksize=CHUNK_SIZE, use_manifest=True, mode='append',
+                          parse_workers=None, bulk_load=False):
+    """
+    Lê o CSV em blocos e envia cada bloco via COPY enquanto o próximo é lido.
+    Cada bloco passa pela tabela de staging, ignorando registros já existentes;
+    toda a carga ocorre em uma única transação.
+    Se o manifesto já tiver meses desta tabela, uma primeira leitura calcula
+    as impressões digitais e apenas os meses alterados são enviados.
+    Com mode='replace', os meses do arquivo substituem os da tabela (replace_months).
+    Com parse_workers, o arquivo é lido em paralelo por faixas de bytes (read_csv_parallel).
+    Retorna a quantidade de registros inseridos, ou None em caso de erro.
+    """
+    table_name = get_table_name(data_type)
+    cursor = conn.cursor()
+
+    months = None
+    if use_manifest and has_manifest_entries(cursor, data_type):
+        fingerprints = compute_file_fingerprints(file_path, chunksize, parse_workers)
+        if fingerprints is None:
+            print("Arquivo sem registros.")
+            cursor.close()
+            return 0
+        months = get_changed_months(cursor, data_type, fingerprints)
+        skipped = len(fingerprints) - len(months)
+        if skipped:
+            print(f"{skipped} meses já carregados e inalterados serão ignorados.")
+        if not months:
+            print("Nenhum mês novo ou alterado para carregar.")
+            cursor.close()
+            return 0
+
+    cursor.close()
+    chunks = prefetch(read_csv_chunks(file_path, chunksize, parse_workers, months))
+    try:
+        if mode == 'replace':
+            with tqdm(desc=f"Preparando substituição em {table_name}", unit=' linhas', unit_scale=True) as bar:
+                return replace_months(conn, track_progress(chunks, bar), data_type, months)
+        return insert_chunks(conn, chunks, data_type, months, use_manifest, bulk_load)
+    finally:
+        chunks.close()
+
+# Função para inserir uma sequência de blocos em uma única transação
+def insert_chunks(conn, chunks, data_type, months=None, use_manifest=True, bulk_load=False):
+    """
+    Envia cada bloco pela tabela de staging, ignorando registros já existentes;
+    a tabela é criada a partir do primeiro bloco. Se `months` for informado,
+    apenas esses meses são enviados. Com use_manifest, os meses enviados ainda
+    ausentes do manifesto são registrados na mesma transação. Com bulk_load=True,
+    os blocos vão direto para a tabela (ver insert_via_staging).
+    Retorna a quantidade de registros inseridos, ou None em caso de erro.
+    """
+    table_name = get_table_name(data_type)
+    cursor = conn.cursor()
+    loaded_fingerprints = None
+    total = 0
+    inserted = 0
+
+    try:
+        with tqdm(desc=f"Enviando para {table_name}", unit=' linhas', unit_scale=True) as bar:
+            for i, chunk in enumerate(chunks):
+                # A tabela é criada a partir do primeiro bloco lido
+                if i == 0:
+                    create_table(conn, chunk, data_type)
+                    use_constraint = has_unique_constraint(cursor, data_type)
+                else:
+                    ensure_partitions(cursor, data_type, chunk)
+                bar.update(len(chunk))
+                if months is not None:
+                    chunk = filter_months(chunk, months)
+                    if chunk.empty:
+                        continue
+                if use_manifest:
+                    loaded_fingerprints = merge_fingerprints(loaded_fingerprints, compute_month_fingerprints(chunk))
+                inserted += insert_via_staging(cursor, chunk, data_type, use_constraint, bulk_load)
+                total += len(chunk)
+        if loaded_fingerprints is not None:
+            record_manifest(cursor, data_type, loaded_fingerprints, only_new=True)
+        data_version.bump(conn)
+        conn.commit()
+        print(f"{inserted} registros inseridos com sucesso! {total - inserted} já existiam e foram ignorados.")
+        return inserted
     except Exception as e:
         conn.rollback()
         print(f"Erro ao inserir dados: {e}")
+        return None
+    finally:
+        cursor.close()
+
+# Função para carregar um arquivo inteiro em memória, pulando meses já carregados
+def load_file(conn, file_path, data_type, use_manifest=True, mode='append', parse_workers=None, bulk_load=False):
+    """
+    Retorna a quantidade de registros inseridos, ou None em caso de erro.
+    """
+    # Ler o CSV
+    df = read_csv(file_path, parse_workers)
+    print("Dados lidos do CSV com sucesso!")
+
+    # Criar tabela (com constraint de unicidade)
+    create_table(conn, df, data_type)
+    print("Tabela criada ou verificada com sucesso!")
+
+    fingerprints = None
+    if use_manifest:
+        # Comparar as impressões digitais de cada mês antes de qualquer trabalho por linha
+        fingerprints = compute_month_fingerprints(df)
+        cursor = conn.cursor()
+        months = get_changed_months(cursor, data_type, fingerprints)
+        cursor.close()
+
+        skipped = len(fingerprints) - len(months)
+        if skipped:
+            print(f"{skipped} meses já carregados e inalterados serão ignorados.")
+        if not months:
+            print("Nenhum mês novo ou alterado para carregar.")
+            return 0
+        if skipped:
+            df = filter_months(df, months)
+            fingerprints = fingerprints.loc[months]
+
+    if mode == 'replace':
+        # Substituir os meses do arquivo de forma atômica
+        return replace_months(conn, [df], data_type)
+
+    # Inserir dados (com verificação de duplicados)
+    return insert_data(conn, df, data_type, fingerprints=fingerprints, bulk_load=bulk_load)
+
+# Função para inferir o tipo de dado (E/I) a partir do nome do arquivo
+def infer_data_type(file_path):
+    name = os.path.basename(file_path).upper()
+    for prefix, data_type in FILE_PREFIXES.items():
+        if name.startswith(f"{prefix}_"):
+            return data_type
+    return None
+
+# Função para listar os arquivos de um diretório ou padrão glob (aceita chaves, ex.: {EXP,IMP}_*.csv)
+def expand_pattern(pattern):
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.csv')
+
+    patterns = [pattern]
+    while any('{' in p for p in patterns):
+        expanded = []
+        for p in patterns:
+            match = re.search(r'\{([^{}]*)\}', p)
+            if not match:
+                expanded.append(p)
+                continue
+            for option in match.group(1).split(','):
+                expanded.append(p[:match.start()] + option + p[match.end():])
+        patterns = expanded
+
+    return sorted({path for p in patterns for path in glob.glob(p)})
+
+# Função executada em cada processo do modo em lote, com conexão própria
+def load_file_worker(file_path, data_type, streaming=False, mode='append', chunksize=CHUNK_SIZE,
+                     parse_workers=None, copy_format='text', ncm_file=None, csv_engine='c',
+                     use_parquet_cache=True, bulk_load=False):
+    global COPY_FORMAT, NCM_FILE, CSV_ENGINE, USE_PARQUET_CACHE
+    COPY_FORMAT = copy_format
+    NCM_FILE = ncm_file
+    CSV_ENGINE = csv_engine
+    USE_PARQUET_CACHE = use_parquet_cache
+    output = StringIO()
+    start = time.perf_counter()
+    rows = None
+
+    # A saída de cada arquivo é capturada para não se misturar à dos outros processos
+    with redirect_stdout(output), redirect_stderr(output):
+        try:
+            conn = psycopg2.connect(**DB_CONFIG)
+            try:
+                if streaming:
+                    rows = insert_data_streaming(
+                        conn, file_path, data_type, chunksize, mode=mode, parse_workers=parse_workers,
+                        bulk_load=bulk_load
+                    )
+                else:
+                    rows = load_file(
+                        conn, file_path, data_type, mode=mode, parse_workers=parse_workers, bulk_load=bulk_load
+                    )
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"Erro: {e}")
+
+    return {
+        'file': file_path,
+        'rows': rows,
+        'seconds': time.perf_counter() - start,
+        'log': output.getvalue(),
+    }
+
+# Função para criar a tabela a partir do início do arquivo, antes da carga
+def create_table_from_header(conn, file_path, data_type, typed=False, partition_by_month=False,
+                             defer_constraints=False):
+    """
+    Usada antes da carga, quando a tabela precisa de opções diferentes das inferidas
+    (esquema tipado ou carga em massa). Não faz nada se a tabela já existir; as
+    partições de cada ano são criadas automaticamente durante a carga.
+    """
+    # Uma amostra das primeiras linhas é suficiente para inferir os tipos das colunas
+    if use_parquet_cache(file_path):
+        sample = next(parquet_cache.iter_trade(file_path, 1000)).head(1000)
+    else:
+        sample = csv_reader.read_csv(file_path, nrows=1000)
+    sample = attach_ncm_descriptions(coerce_types(sample))
+    create_table(conn, sample, data_type, typed, partition_by_month, defer_constraints)
+
+# Função para concluir a carga em massa: deduplicar e criar os índices em uma única passada
+def finalize_bulk_load(conn, data_type, remove_duplicates=True):
+    """
+    Verifica e informa registros duplicados na chave única, remove as cópias
+    excedentes (se remove_duplicates=True) e cria a constraint de unicidade e os
+    índices das consultas do dashboard, usando criação paralela de índices.
+    Retorna True se a constraint foi criada (ou já existia).
+    """
+    table_name = get_table_name(data_type)
+    cursor = conn.cursor()
+    keys = sql.SQL(', ').join(map(sql.Identifier, KEY_COLUMNS))
+    table = sql.Identifier(table_name)
+
+    try:
+        if has_unique_constraint(cursor, data_type):
+            create_query_indexes(cursor, data_type)
+            conn.commit()
+            print(f"Tabela {table_name} já possui a constraint de unicidade.")
+            return True
+
+        start = time.perf_counter()
+        duplicates_query = sql.SQL("""
+            SELECT {keys}, count(*) AS copias
+            FROM {table}
+            GROUP BY {keys}
+            HAVING count(*) > 1
+        """).format(keys=keys, table=table)
+        cursor.execute(sql.SQL("SELECT count(*), coalesce(sum(copias - 1), 0) FROM ({duplicates}) d").format(
+            duplicates=duplicates_query
+        ))
+        duplicated_keys, extra = cursor.fetchone()
+        if duplicated_keys:
+            print(f"{duplicated_keys} chaves duplicadas em {table_name} ({extra} registros excedentes). Exemplos:")
+            cursor.execute(sql.SQL("{duplicates} LIMIT 5").format(duplicates=duplicates_query))
+            for row in cursor.fetchall():
+                print(f"  {dict(zip(KEY_COLUMNS, row[:-1]))} ({row[-1]} cópias)")
+            if not remove_duplicates:
+                print("Constraint de unicidade não criada: remova os duplicados e execute novamente.")
+                return False
+
+            # Mantém uma cópia de cada chave; tableoid distingue linhas de partições diferentes
+            cursor.execute(sql.SQL("""
+                DELETE FROM {table} t
+                USING (
+                    SELECT tableoid, ctid, row_number() OVER (PARTITION BY {keys}) AS n
+                    FROM {table}
+                ) d
+                WHERE t.tableoid = d.tableoid AND t.ctid = d.ctid AND d.n > 1
+            """).format(keys=keys, table=table))
+            print(f"{cursor.rowcount} registros duplicados removidos.")
+            data_version.bump(conn)
+
+        # Índices criados depois do COPY, com processos paralelos quando o PostgreSQL permite
+        with instrumentation.stage('indexes', table=table_name):
+            cursor.execute("SET max_parallel_maintenance_workers = %s", (INDEX_BUILD_WORKERS,))
+            cursor.execute("SET maintenance_work_mem = '1GB'")
+            cursor.execute(sql.SQL("ALTER TABLE {table} ADD CONSTRAINT {constraint} UNIQUE ({keys})").format(
+                table=table, constraint=sql.Identifier(get_constraint_name(data_type)), keys=keys
+            ))
+            create_query_indexes(cursor, data_type)
+            cursor.execute(sql.SQL("ANALYZE {table}").format(table=table))
+            conn.commit()
+        print(f"Índices de {table_name} criados em {time.perf_counter() - start:.1f}s.")
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro ao finalizar a carga de {table_name}: {e}")
+        return False
     finally:
         cursor.close()
 
+# Função para criar os índices usados pelas consultas do dashboard
+def create_query_indexes(cursor, data_type):
+    table_name = get_table_name(data_type)
+    table = sql.Identifier(table_name)
+    indexes = [
+        # Filtros de ano, mês e estado aplicados em todas as consultas do dashboard
+        (f"{table_name}_ano_mes_uf_idx", sql.SQL("({})").format(
+            sql.SQL(', ').join(map(sql.Identifier, ['CO_ANO', 'CO_MES', 'SG_UF_NCM'])))),
+        # Junção com as descrições NCM
+        (f"{table_name}_ncm_idx", sql.SQL("({})").format(sql.Identifier('CO_NCM'))),
+        # Índice BRIN compacto para varreduras por período (os dados chegam ordenados por mês)
+        (f"{table_name}_ano_mes_brin", sql.SQL("USING brin ({})").format(
+            sql.SQL(', ').join(map(sql.Identifier, ['CO_ANO', 'CO_MES'])))),
+    ]
+    for name, definition in indexes:
+        cursor.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {name} ON {table} {definition}").format(
+            name=sql.Identifier(name), table=table, definition=definition
+        ))
+
+# Função para carregar vários arquivos EXP/IMP em paralelo, sem interação
+def load_batch(pattern, workers=BATCH_WORKERS, streaming=False, mode='append', parse_workers=None,
+               typed=False, partition_by_month=False, bulk_load=False, copy_format='text', ncm_file=None,
+               csv_engine='c', use_parquet_cache=True, refresh_rollup=True):
+    """
+    Carrega todos os arquivos do diretório ou padrão informado usando um pool
+    de processos. Com refresh_rollup=True, ao final a tabela de resumo do
+    dashboard é atualizada para os meses carregados.
+    Retorna True se todos os arquivos foram carregados sem erro.
+    """
+    files = expand_pattern(pattern)
+    if not files:
+        print(f"Nenhum arquivo encontrado em {pattern}.")
+        return False
+
+    results = []
+    jobs = []
+    for file_path in files:
+        data_type = infer_data_type(file_path)
+        if data_type is None:
+            results.append({
+                'file': file_path, 'rows': None, 'seconds': 0.0,
+                'log': f"Não foi possível inferir o fluxo: o nome deve começar com {', '.join(FILE_PREFIXES)}.\n",
+            })
+        else:
+            jobs.append((file_path, data_type))
+
+    # O manifesto (e, no esquema tipado ou na carga em massa, as tabelas) é criado
+    # antes de iniciar os processos
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        create_manifest_table(conn)
+        data_version.create_data_version_table(conn)
+        if typed or bulk_load:
+            for data_type in sorted({data_type for _, data_type in jobs}):
+                file_path = next(path for path, dt in jobs if dt == data_type)
+                create_table_from_header(conn, file_path, data_type, typed, partition_by_month, bulk_load)
+    finally:
+        conn.close()
+
+    print(f"Carregando {len(jobs)} arquivos com {workers} processos...")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                load_file_worker, file_path, data_type, streaming, mode, CHUNK_SIZE, parse_workers, copy_format,
+                ncm_file, csv_engine, use_parquet_cache, bulk_load
+            )
+            for file_path, data_type in jobs
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            status = "OK" if result['rows'] is not None else "ERRO"
+            print(f"[{status}] {os.path.basename(result['file'])} ({result['seconds']:.1f}s)")
+
+    # Resumo por arquivo
+    print("\nResumo da carga:")
+    failures = 0
+    for result in sorted(results, key=lambda r: r['file']):
+        if result['rows'] is None:
+            failures += 1
+            print(f"  ERRO  {result['file']}  {result['seconds']:8.1f}s")
+            for line in result['log'].strip().splitlines()[-5:]:
+                print(f"        {line.strip()}")
+        else:
+            print(f"  OK    {result['file']}  {result['seconds']:8.1f}s  {result['rows']} registros inseridos")
+    print(f"{len(results) - failures} de {len(results)} arquivos carregados em {time.perf_counter() - start:.1f}s.")
+
+    if bulk_load:
+        # Constraint e índices criados uma única vez, depois de todos os arquivos
+        conn = psycopg2.connect(**DB_CONFIG)
+        try:
+            for data_type in sorted({data_type for _, data_type in jobs}):
+                if not finalize_bulk_load(conn, data_type):
+                    failures += 1
+        finally:
+            conn.close()
+
+    if refresh_rollup:
+        # Uma única atualização do resumo, depois das cargas e dos índices
+        conn = psycopg2.connect(**DB_CONFIG)
+        try:
+            rollup.refresh_stale(conn, sorted({data_type for _, data_type in jobs}))
+        except Exception as e:
+            failures += 1
+            print(f"Erro ao atualizar a tabela de resumo: {e}")
+        finally:
+            conn.close()
+
+    return failures == 0
+
 # Função principal
 def main():
+    global COPY_FORMAT, NCM_FILE, CSV_ENGINE, USE_PARQUET_CACHE
+    parser = argparse.ArgumentParser(description="Carrega arquivos de exportação/importação no PostgreSQL.")
+    parser.add_argument('--batch', metavar='CAMINHO',
+                        help="diretório ou padrão glob dos arquivos, ex.: 'src/ncm_data/{EXP,IMP}_*.csv'")
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS,
+                        help=f"quantidade de arquivos carregados em paralelo (padrão: {BATCH_WORKERS})")
+    parser.add_argument('--streaming', action='store_true', help="ler os arquivos em blocos")
+    parser.add_argument('--replace', action='store_true', help="substituir os meses já existentes no banco")
+    parser.add_argument('--parse-workers', type=int, default=None,
+                        help="ler cada arquivo em paralelo por faixas de bytes usando N processos")
+    parser.add_argument('--typed-schema', action='store_true',
+                        help="criar tabelas novas com tipos explícitos, particionadas por CO_ANO")
+    parser.add_argument('--partition-by-month', action='store_true',
+                        help="com --typed-schema, particionar por (CO_ANO, CO_MES)")
+    parser.add_argument('--bulk-load', action='store_true',
+                        help="carga inicial: criar a constraint de unicidade e os índices apenas após o COPY")
+    parser.add_argument('--binary-copy', action='store_true',
+                        help="enviar os dados com COPY no formato binário em vez de texto")
+    parser.add_argument('--ncm-file', metavar='NCM_CSV',
+                        help="preencher no_ncm_por durante a carga usando este NCM.csv, ex.: src/ncm_data/NCM.csv")
+    parser.add_argument('--csv-engine', choices=['c', 'pyarrow'], default='c',
+                        help="leitor de CSV: 'c' (pandas, padrão) ou 'pyarrow'")
+    parser.add_argument('--no-parquet-cache', action='store_true',
+                        help="ler sempre o CSV, mesmo que o cache em Parquet esteja atualizado")
+    parser.add_argument('--no-rollup', action='store_true',
+                        help="não atualizar a tabela de resumo do dashboard após a carga (ver rollup.py)")
+    args = parser.parse_args()
+    if args.binary_copy:
+        COPY_FORMAT = 'binary'
+    NCM_FILE = args.ncm_file
+    CSV_ENGINE = args.csv_engine
+    USE_PARQUET_CACHE = not args.no_parquet_cache
+
+    if args.batch:
+        # Modo em lote, não interativo (adequado para o cron)
+        mode = 'replace' if args.replace else 'append'
+        ok = load_batch(
+            args.batch, args.workers, args.streaming, mode, args.parse_workers,
+            args.typed_schema, args.partition_by_month, args.bulk_load, COPY_FORMAT, NCM_FILE,
+            CSV_ENGINE, USE_PARQUET_CACHE, not args.no_rollup
+        )
+        sys.exit(0 if ok else 1)
+
     # Substitua pelo conteúdo real do arquivo ou leia de um arquivo real
     file_content = input("Digite o caminho do arquivo CSV: ")
 
@@ -162,22 +1264,45 @@ def main():
     while data_type not in ['E', 'I']:
         print("Por favor, digite 'E' para exportação ou 'I' para importação.")
         data_type = input("Os dados são de exportação (E) ou importação (I)? ").strip().upper()
+
+    streaming = input("Usar modo streaming, lendo o arquivo em blocos (S/N)? ").strip().upper() == 'S'
+
+    # No modo de substituição, os meses do arquivo (por exemplo, revisados pelo ministério)
+    # substituem completamente os meses correspondentes no banco
+    replace = input("Substituir os meses do arquivo já existentes no banco (S/N)? ").strip().upper() == 'S'
+    mode = 'replace' if replace else 'append'
     
     try:
-        # Ler o CSV
-        df = read_csv(file_content)
-        print("Dados lidos do CSV com sucesso!")
-        
         # Conectar ao PostgreSQL
         conn = psycopg2.connect(**DB_CONFIG)
         print("Conexão com PostgreSQL estabelecida!")
-        
-        # Criar tabela (com constraint de unicidade)
-        create_table(conn, df, data_type)
-        print("Tabela criada ou verificada com sucesso!")
-        
-        # Inserir dados (com verificação de duplicados)
-        insert_data(conn, df, data_type)
+
+        # Criar o manifesto que registra os meses já carregados
+        create_manifest_table(conn)
+        data_version.create_data_version_table(conn)
+
+        if args.typed_schema or args.bulk_load:
+            create_table_from_header(
+                conn, file_content, data_type, args.typed_schema, args.partition_by_month, args.bulk_load
+            )
+
+        if streaming:
+            # Ler, converter e enviar o CSV bloco a bloco
+            insert_data_streaming(
+                conn, file_content, data_type, mode=mode, parse_workers=args.parse_workers, bulk_load=args.bulk_load
+            )
+        else:
+            load_file(
+                conn, file_content, data_type, mode=mode, parse_workers=args.parse_workers, bulk_load=args.bulk_load
+            )
+
+        if args.bulk_load:
+            # Criar a constraint de unicidade e os índices após o COPY
+            finalize_bulk_load(conn, data_type)
+
+        if not args.no_rollup:
+            # Atualizar a tabela de resumo do dashboard com os meses carregados
+            rollup.refresh_stale(conn, [data_type])
         
     except Exception as e:
         print(f"Erro: {e}")
@@ -0,0 +1,308 @@
+"""
+Carga de um arquivo remoto direto no PostgreSQL, sem cópia intermediária em disco:
+resposta HTTP -> descompactação incremental (.zip ou .gz, se for o caso) -> leitura
+do CSV em blocos e conversão de tipos -> COPY FROM STDIN.
+Cada estágio roda em sua própria thread, ligado ao seguinte por uma fila limitada
+(send_data.prefetch): um estágio mais rápido espera o mais lento, então a memória
+fica limitada a STREAM_QUEUE_BLOCKS blocos do download e a um bloco de linhas.
+Com --tee, os bytes recebidos também são gravados no diretório informado (como o
+download_data.py faria), para arquivamento.
+
+Uso: python stream_load.py URL [--type E] [--replace] [--tee src/ncm_data]
+"""
+
+import argparse
+import hashlib
+import io
+import itertools
+import os
+import struct
+import sys
+import zlib
+from urllib.parse import urlparse
+
+import psycopg2
+from tqdm import tqdm
+
+import csv_reader
+import data_version
+import download_data
+import instrumentation
+import rollup
+import send_data
+
+# Blocos do download (de download_data.DOWNLOAD_CHUNK_SIZE bytes) aguardando o leitor do CSV
+STREAM_QUEUE_BLOCKS = 8
+
+# Assinaturas do início de um arquivo .zip (cabeçalho local) e de um .gz
+ZIP_SIGNATURE = b'PK\x03\x04'
+GZIP_SIGNATURE = b'\x1f\x8b'
+
+# Cabeçalho local de um membro do .zip: assinatura, versão, flags, método, hora, data,
+# CRC-32, tamanho compactado, tamanho original, tamanho do nome e do campo extra
+ZIP_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+
+# Flag do cabeçalho local: CRC e tamanhos vêm em um descritor depois dos dados
+ZIP_DATA_DESCRIPTOR_FLAG = 0x08
+ZIP_DATA_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+
+
+class ChunkStream(io.RawIOBase):
+    """Arquivo somente leitura sobre um iterador de blocos de bytes (lido pelo pandas)"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self.buffer:
+            data = next(self.chunks, None)
+            if data is None:
+                return 0
+            self.buffer = memoryview(data)
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+
+def iter_download(url, tee_path=None):
+    """
+    Blocos da resposta HTTP. Com tee_path, cada bloco também é gravado no .part,
+    que recebe o nome final (e entra nos metadados do download_data.py) apenas
+    quando o arquivo chega completo; um .part interrompido pode ser retomado pelo
+    download_data.py.
+    """
+    with download_data.get_session().get(url, stream=True, timeout=download_data.REQUEST_TIMEOUT) as response:
+        response.raise_for_status()
+        content_length = response.headers.get('Content-Length')
+
+        tee = None
+        if tee_path:
+            metadata = download_data.DownloadMetadata(os.path.dirname(tee_path) or '.')
+            name = os.path.basename(tee_path)
+            metadata.update(name, {
+                **metadata.get(name), 'url': url, 'part_validator': download_data.get_validator(response)
+            })
+            tee = open(tee_path + download_data.PART_SUFFIX, 'wb')
+            hasher = hashlib.sha256()
+
+        size = 0
+        try:
+            for data in response.iter_content(download_data.DOWNLOAD_CHUNK_SIZE):
+                if tee:
+                    tee.write(data)
+                    hasher.update(data)
+                size += len(data)
+                yield data
+        finally:
+            if tee:
+                tee.close()
+
+        if content_length and size != int(content_length):
+            raise IOError(f"Download incompleto de {url}: {size} de {content_length} bytes")
+        if tee:
+            os.replace(tee_path + download_data.PART_SUFFIX, tee_path)
+            download_data.record_download(metadata, name, url, response, size, hasher.hexdigest())
+
+
+def iter_gunzip(chunks):
+    """Descompacta um fluxo .gz (inclusive com vários membros concatenados)"""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    # Membro iniciado e ainda não terminado
+    pending = False
+    for data in chunks:
+        while data:
+            pending = True
+            output = decompressor.decompress(data)
+            if output:
+                yield output
+            if decompressor.eof:
+                # Próximo membro, se houver
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                pending = False
+            else:
+                data = b''
+    if pending:
+        raise IOError("Arquivo .gz truncado")
+
+
+def iter_unzip(chunks):
+    """
+    Descompacta o primeiro arquivo de um .zip recebido em sequência, a partir do
+    cabeçalho local (sem o diretório central, que fica no fim do arquivo). Os
+    arquivos do ministério têm um único CSV por .zip. O restante do fluxo é lido
+    até o fim, para que o download (e a cópia em disco) termine.
+    """
+    chunks = iter(chunks)
+    buffer = bytearray()
+
+    def fill(size):
+        while len(buffer) < size:
+            data = next(chunks, None)
+            if data is None:
+                raise IOError("Arquivo .zip truncado")
+            buffer.extend(data)
+
+    fill(ZIP_LOCAL_HEADER.size)
+    (signature, _, flags, method, _, _, crc, compressed_size, _,
+     name_length, extra_length) = ZIP_LOCAL_HEADER.unpack_from(buffer)
+    if signature != struct.unpack('<I', ZIP_SIGNATURE)[0]:
+        raise IOError("Cabeçalho .zip inválido")
+    header_size = ZIP_LOCAL_HEADER.size + name_length + extra_length
+    fill(header_size)
+    del buffer[:header_size]
+
+    actual_crc = 0
+    if method == 0:
+        # Sem compressão: o tamanho precisa estar no cabeçalho
+        if flags & ZIP_DATA_DESCRIPTOR_FLAG:
+            raise IOError("Membro .zip sem compressão e sem tamanho no cabeçalho não é suportado")
+        remaining = compressed_size
+        for data in itertools.chain([bytes(buffer)], chunks):
+            output = data[:remaining]
+            remaining -= len(output)
+            if output:
+                actual_crc = zlib.crc32(output, actual_crc)
+                yield output
+            if remaining == 0:
+                tail = data[len(output):]
+                break
+        else:
+            raise IOError("Arquivo .zip truncado")
+    elif method == 8:
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        for data in itertools.chain([bytes(buffer)], chunks):
+            output = decompressor.decompress(data)
+            if output:
+                actual_crc = zlib.crc32(output, actual_crc)
+                yield output
+            if decompressor.eof:
+                tail = decompressor.unused_data
+                break
+        else:
+            raise IOError("Arquivo .zip truncado")
+    else:
+        raise IOError(f"Método de compressão {method} do .zip não suportado")
+
+    # Descritor com o CRC (quando não está no cabeçalho) e o resto do arquivo
+    tail = bytearray(tail)
+    for data in chunks:
+        if len(tail) < 16:
+            tail.extend(data)
+    if flags & ZIP_DATA_DESCRIPTOR_FLAG:
+        offset = 4 if tail.startswith(ZIP_DATA_DESCRIPTOR_SIGNATURE) else 0
+        crc = struct.unpack_from('<I', tail, offset)[0]
+    if crc != actual_crc:
+        raise IOError("CRC do arquivo descompactado não confere")
+
+
+def iter_decompressed(chunks):
+    """Descompacta o fluxo conforme a assinatura do início (.zip, .gz ou sem compressão)"""
+    chunks = iter(chunks)
+    first = next(chunks, b'')
+    chunks = itertools.chain([first], chunks)
+    if first.startswith(ZIP_SIGNATURE):
+        yield from iter_unzip(chunks)
+    elif first.startswith(GZIP_SIGNATURE):
+        yield from iter_gunzip(chunks)
+    else:
+        yield from chunks
+
+
+def peek_bytes(chunks, size):
+    """Lê pelo menos `size` bytes do início do fluxo; retorna (amostra, fluxo completo)"""
+    chunks = iter(chunks)
+    head = []
+    total = 0
+    for data in chunks:
+        head.append(data)
+        total += len(data)
+        if total >= size:
+            break
+    return b''.join(head)[:size], itertools.chain(head, chunks)
+
+
+def read_stream_chunks(chunks, chunksize=send_data.CHUNK_SIZE):
+    """Blocos de linhas do CSV recebido como fluxo de bytes, com os tipos do send_data.read_csv_chunks"""
+    sample, chunks = peek_bytes(chunks, csv_reader.ENCODING_SAMPLE_SIZE)
+    encoding = csv_reader.detect_encoding_bytes(sample)
+    stream = io.BufferedReader(ChunkStream(chunks), buffer_size=download_data.DOWNLOAD_CHUNK_SIZE)
+    for chunk in csv_reader.read_csv_stream(stream, chunksize, encoding=encoding):
+        yield send_data.attach_ncm_descriptions(send_data.coerce_types(chunk))
+
+
+def stream_load(conn, url, data_type, mode='append', tee_directory=None, chunksize=send_data.CHUNK_SIZE):
+    """
+    Baixa, descompacta, lê e envia o arquivo de `url` em um único fluxo.
+    mode='append' ignora registros já existentes (send_data.insert_chunks);
+    mode='replace' substitui os meses do arquivo (send_data.replace_months).
+    Os meses não são comparados com o manifesto antes do envio, pois isso exigiria
+    uma leitura a mais do arquivo; o manifesto é atualizado com os meses enviados.
+    Retorna a quantidade de registros inseridos, ou None em caso de erro.
+    """
+    tee_path = None
+    if tee_directory:
+        os.makedirs(tee_directory, exist_ok=True)
+        tee_path = os.path.join(tee_directory, os.path.basename(urlparse(url).path))
+
+    # Download -> (fila) -> descompactação e leitura do CSV -> (fila) -> COPY
+    # (o tempo da etapa 'parse' inclui a espera pelos blocos do download)
+    name = os.path.basename(urlparse(url).path)
+    raw = send_data.prefetch(
+        instrumentation.timed_iter('download', iter_download(url, tee_path), measure='bytes', file=name),
+        max_pending=STREAM_QUEUE_BLOCKS
+    )
+    chunks = send_data.prefetch(
+        instrumentation.timed_iter('parse', read_stream_chunks(iter_decompressed(raw), chunksize), file=name)
+    )
+    try:
+        if mode == 'replace':
+            table_name = send_data.get_table_name(data_type)
+            with tqdm(desc=f"Preparando substituição em {table_name}", unit=' linhas', unit_scale=True) as bar:
+                return send_data.replace_months(conn, send_data.track_progress(chunks, bar), data_type)
+        return send_data.insert_chunks(conn, chunks, data_type)
+    finally:
+        chunks.close()
+        raw.close()
+
+
+def infer_data_type(url):
+    """Fluxo (E/I) a partir do nome do arquivo na URL, ex.: .../EXP_2021.csv ou EXP_2021.zip"""
+    return send_data.infer_data_type(os.path.basename(urlparse(url).path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Baixa e carrega um arquivo no PostgreSQL em um único fluxo.")
+    parser.add_argument('url', help="endereço do arquivo EXP/IMP (.csv, .zip ou .gz)")
+    parser.add_argument('--type', choices=['E', 'I'], help="fluxo dos dados (padrão: pelo nome do arquivo)")
+    parser.add_argument('--replace', action='store_true', help="substituir os meses do arquivo já existentes no banco")
+    parser.add_argument('--tee', metavar='DIRETÓRIO', help="gravar também o arquivo baixado neste diretório")
+    parser.add_argument('--ncm-file', metavar='NCM_CSV', help="preencher no_ncm_por durante a carga (ver send_data.py)")
+    parser.add_argument('--no-rollup', action='store_true',
+                        help="não atualizar a tabela de resumo do dashboard após a carga (ver rollup.py)")
+    args = parser.parse_args()
+
+    data_type = args.type or infer_data_type(args.url)
+    if data_type is None:
+        parser.error("não foi possível inferir o fluxo pelo nome do arquivo; use --type")
+    send_data.NCM_FILE = args.ncm_file
+
+    conn = psycopg2.connect(**send_data.DB_CONFIG)
+    try:
+        send_data.create_manifest_table(conn)
+        data_version.create_data_version_table(conn)
+        rows = stream_load(conn, args.url, data_type, 'replace' if args.replace else 'append', args.tee)
+        if rows is not None and not args.no_rollup:
+            rollup.refresh_stale(conn, [data_type])
+    finally:
+        conn.close()
+    sys.exit(0 if rows is not None else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,366 @@
+"""
+Sincronização incremental com o site da balança comercial, sem interação:
+1. consulta a página base-de-dados-bruta com uma requisição condicional; sem
+   alterações (304, ou o mesmo conteúdo), usa o índice de links guardado e termina,
+   a menos que a última consulta dos arquivos tenha mais de FILE_CHECK_INTERVAL
+   segundos (arquivos revisados publicados no mesmo endereço não mudam a página);
+2. se a página mudou, lê apenas as tags <a> e compara os links com o estado local;
+3. baixa (download_data.py) apenas os arquivos novos ou revisados;
+4. compara as impressões digitais de cada mês dos arquivos baixados com as da
+   sincronização anterior e coloca na fila de carga apenas os meses afetados;
+5. com --load, carrega a fila (substituindo os meses no banco), enriquece os meses
+   carregados com a dimensão NCM e atualiza a tabela de resumo do dashboard.
+
+Uso: python sync.py [--years 2020-2021] [--load] [--interval 3600] [--check-interval 86400]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from urllib.parse import urljoin, urlparse
+
+import psycopg2
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+
+import download_data
+
+# Anos sincronizados por padrão
+SYNC_YEARS = [2020, 2021]
+
+# Arquivos, no diretório de saída, com o estado da última sincronização e a fila de carga
+STATE_FILE = '.sync_state.json'
+QUEUE_FILE = '.load_queue.json'
+
+# Intervalo, em segundos, entre as consultas condicionais de todos os arquivos quando a
+# página de listagem não muda (0 = a cada sincronização)
+FILE_CHECK_INTERVAL = 24 * 3600
+
+# Arquivos da base de dados bruta usados pelo projeto (os demais links da página são ignorados)
+FILE_PATTERN = re.compile(r'(?:(EXP|IMP)_(\d{4})|NCM)\.csv$', re.IGNORECASE)
+
+# Prefixos dos arquivos de dados e o fluxo correspondente (mesmos do send_data.py)
+FLOW_PREFIXES = {'EXP': 'E', 'IMP': 'I'}
+
+# Nome do arquivo da tabela NCM (a fila de carga o trata à parte dos arquivos EXP/IMP)
+NCM_FILE_NAME = 'NCM.csv'
+
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_json(path, data):
+    """Gravação atômica: uma sincronização interrompida não deixa o arquivo pela metade"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def parse_links(html, page_url):
+    """{nome do arquivo: url} dos arquivos EXP_AAAA.csv, IMP_AAAA.csv e NCM.csv da página"""
+    # Apenas as tags <a> com href são construídas; o restante da página é descartado na leitura
+    soup = BeautifulSoup(html, 'html.parser', parse_only=SoupStrainer('a', href=True))
+    links = {}
+    for tag in soup.find_all('a'):
+        url = urljoin(page_url, tag['href'].strip())
+        name = os.path.basename(urlparse(url).path)
+        match = FILE_PATTERN.fullmatch(name)
+        if match:
+            # Nome canônico (EXP_2021.csv, NCM.csv), independente da grafia do link
+            canonical = f"{match.group(1).upper()}_{match.group(2)}.csv" if match.group(1) else NCM_FILE_NAME
+            links.setdefault(canonical, url)
+    return links
+
+
+def fetch_listing(listing, listing_url):
+    """
+    Consulta a página de listagem com If-None-Match/If-Modified-Since da consulta
+    anterior. Retorna (links, alterada, validadores da resposta); sem alterações,
+    os links vêm do índice guardado no estado, sem ler o HTML.
+    """
+    headers = {}
+    if listing.get('url') == listing_url and listing.get('links') is not None:
+        if listing.get('etag'):
+            headers['If-None-Match'] = listing['etag']
+        if listing.get('last_modified'):
+            headers['If-Modified-Since'] = listing['last_modified']
+
+    response = requests.get(listing_url, headers=headers, timeout=download_data.REQUEST_TIMEOUT)
+    if response.status_code == 304:
+        return listing['links'], False, listing
+    response.raise_for_status()
+
+    validators = {
+        'url': listing_url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'sha256': hashlib.sha256(response.content).hexdigest(),
+    }
+    if headers and validators['sha256'] == listing.get('sha256'):
+        # Servidor sem requisição condicional (ou que a ignora), mas a página é a mesma
+        return listing['links'], False, {**listing, **validators}
+    validators['links'] = parse_links(response.content, listing_url)
+    return validators['links'], True, validators
+
+
+def files_check_due(state, interval):
+    """Verifica se a última consulta de todos os arquivos tem mais de `interval` segundos"""
+    checked_at = state.get('files_checked_at')
+    if not checked_at:
+        return True
+    elapsed = datetime.now(timezone.utc) - datetime.fromisoformat(checked_at)
+    return elapsed.total_seconds() >= interval
+
+
+def select_files(links, years):
+    """Links dos arquivos EXP/IMP dos anos informados e da tabela NCM"""
+    names = [f"{prefix}_{year}.csv" for year in years for prefix in download_data.FILE_PREFIXES]
+    names.append(NCM_FILE_NAME)
+    return {name: links[name] for name in names if name in links}
+
+
+def compute_month_hashes(file_path):
+    """{'AAAA-MM': impressão digital} de cada mês do arquivo (send_data.compute_month_fingerprints)"""
+    # Os módulos de carga (pandas, pyarrow) são importados apenas quando há arquivos a
+    # processar, então uma sincronização sem alterações não paga essa importação
+    import send_data
+
+    fingerprints = send_data.compute_file_fingerprints(file_path)
+    if fingerprints is None:
+        return {}
+    hashes = send_data.format_content_hashes(fingerprints)
+    return {
+        f"{int(ano)}-{int(mes):02d}": f"{int(row.row_count)}:{hashes[(ano, mes)]}"
+        for (ano, mes), row in zip(fingerprints.index, fingerprints.itertuples())
+    }
+
+
+def enqueue(queue, name, kind, months=None):
+    """Adiciona o arquivo à fila de carga; meses já na fila são mantidos"""
+    entry = queue.get(name, {'kind': kind})
+    if months is not None:
+        entry['months'] = sorted({*entry.get('months', []), *months})
+    entry['queued_at'] = now()
+    queue[name] = entry
+
+
+def process_download(name, output_directory, file_state, queue):
+    """
+    Compara o arquivo recém-baixado com a sincronização anterior e coloca na fila
+    os meses afetados. Retorna o novo estado do arquivo.
+    """
+    path = os.path.join(output_directory, name)
+    sha256 = download_data.DownloadMetadata(output_directory).get(name).get('sha256')
+    if sha256 and sha256 == file_state.get('sha256'):
+        print(f"{name}: conteúdo igual ao da sincronização anterior.")
+        return file_state
+
+    if name == NCM_FILE_NAME:
+        enqueue(queue, name, 'NCM')
+        print(f"{name}: tabela NCM alterada, na fila de carga.")
+        return {'sha256': sha256}
+
+    months = compute_month_hashes(path)
+    previous = file_state.get('months', {})
+    changed = sorted(month for month, value in months.items() if previous.get(month) != value)
+    removed = sorted(set(previous) - set(months))
+    if changed:
+        enqueue(queue, name, FLOW_PREFIXES[name.split('_')[0]], changed)
+        print(f"{name}: {len(changed)} meses novos ou alterados na fila de carga ({', '.join(changed)}).")
+    else:
+        print(f"{name}: nenhum mês alterado.")
+    if removed:
+        # Os dados desses meses não são apagados do banco automaticamente
+        print(f"Aviso: {name} não tem mais os meses {', '.join(removed)}.")
+    return {'sha256': sha256, 'months': months}
+
+
+def sync(output_directory=download_data.OUTPUT_DIRECTORY, years=SYNC_YEARS, listing_url=download_data.LISTING_URL,
+         workers=download_data.DOWNLOAD_WORKERS, force=False, check_interval=FILE_CHECK_INTERVAL):
+    """
+    Sincroniza os arquivos dos anos informados com o site. Com a página inalterada,
+    os arquivos já sincronizados só são consultados a cada `check_interval` segundos.
+    Retorna True se não houve erros; os meses afetados ficam na fila de carga (QUEUE_FILE).
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    state_path = os.path.join(output_directory, STATE_FILE)
+    queue_path = os.path.join(output_directory, QUEUE_FILE)
+    state = load_json(state_path, {'listing': {}, 'files': {}})
+
+    links, listing_changed, listing = fetch_listing(state['listing'], listing_url)
+    selected = select_files(links, years)
+    for year in years:
+        for prefix in download_data.FILE_PREFIXES:
+            if f"{prefix}_{year}.csv" not in links:
+                print(f"Aviso: {prefix}_{year}.csv não está na página de listagem.")
+
+    # Com a página inalterada, apenas arquivos ainda não sincronizados (ex.: um ano
+    # novo em --years) são consultados; com a página alterada ou com a última consulta
+    # dos arquivos mais antiga que check_interval, todos os arquivos selecionados
+    # recebem uma requisição condicional (304 para os que não mudaram)
+    files = state['files']
+    check_all = force or listing_changed or files_check_due(state, check_interval)
+    if check_all and not listing_changed and selected:
+        print("Consultando os arquivos já sincronizados, que podem ter sido revisados.")
+    pending = [
+        (url, name) for name, url in sorted(selected.items())
+        if check_all or files.get(name, {}).get('url') != url
+        or not os.path.exists(os.path.join(output_directory, name))
+    ]
+    if not pending:
+        print("Nenhuma alteração na página de listagem.")
+        if listing != state['listing']:
+            state['listing'] = listing
+            save_json(state_path, state)
+        return True
+
+    results = download_data.download_files(pending, output_directory, workers)
+    queue = load_json(queue_path, {})
+    failures = 0
+    for url, name in pending:
+        status = results[name]
+        if status.startswith('erro'):
+            failures += 1
+            print(f"{name}: {status}")
+            continue
+        file_state = files.get(name, {})
+        if status != 'inalterado' or not file_state:
+            file_state = process_download(name, output_directory, file_state, queue)
+        files[name] = {**file_state, 'url': url, 'synced_at': now()}
+        # Fila gravada a cada arquivo: uma falha posterior não perde os meses já detectados
+        save_json(queue_path, queue)
+        save_json(state_path, state)
+
+    if failures == 0:
+        # A página só é dada como sincronizada quando todos os arquivos foram baixados;
+        # caso contrário, a próxima sincronização consulta os arquivos de novo
+        state['listing'] = listing
+        if check_all:
+            state['files_checked_at'] = now()
+        save_json(state_path, state)
+    return failures == 0
+
+
+def process_queue(output_directory=download_data.OUTPUT_DIRECTORY, refresh_rollup=True):
+    """
+    Carrega a fila: a tabela NCM primeiro (a dimensão atualizada é usada no
+    enriquecimento) e depois os meses de cada arquivo EXP/IMP, que substituem os
+    meses no banco (send_data.replace_months). Cada arquivo sai da fila apenas
+    quando carregado. Retorna True se toda a fila foi carregada.
+    """
+    queue_path = os.path.join(output_directory, QUEUE_FILE)
+    queue = load_json(queue_path, {})
+    if not queue:
+        print("Fila de carga vazia.")
+        return True
+
+    import data_version
+    import ncm_data
+    import rollup
+    import send_data
+
+    conn = psycopg2.connect(**send_data.DB_CONFIG)
+    failures = 0
+    loaded = {}
+    try:
+        send_data.create_manifest_table(conn)
+        data_version.create_data_version_table(conn)
+
+        if NCM_FILE_NAME in queue:
+            ncm_mapping = ncm_data.read_ncm_mapping(os.path.join(output_directory, NCM_FILE_NAME))
+            if ncm_mapping is None:
+                failures += 1
+            else:
+                ncm_data.refresh_ncm(conn, ncm_mapping)
+                del queue[NCM_FILE_NAME]
+                save_json(queue_path, queue)
+
+        for name, entry in sorted(queue.items()):
+            if entry['kind'] not in rollup.FLOW_TABLES:
+                continue
+            months = [tuple(int(part) for part in month.split('-')) for month in entry['months']]
+            print(f"Carregando {len(months)} meses de {name}...")
+            chunks = send_data.prefetch(send_data.read_csv_chunks(
+                os.path.join(output_directory, name), send_data.CHUNK_SIZE, months=months
+            ))
+            try:
+                rows = send_data.replace_months(conn, chunks, entry['kind'], months)
+            finally:
+                chunks.close()
+            if rows is None:
+                failures += 1
+                continue
+            loaded.setdefault(entry['kind'], []).extend(months)
+            del queue[name]
+            save_json(queue_path, queue)
+
+        if loaded:
+            cursor = conn.cursor()
+            has_ncm = rollup.table_exists(cursor, ncm_data.NCM_TABLE)
+            cursor.close()
+            if has_ncm:
+                # Descrições dos meses carregados, a partir da dimensão NCM
+                for flow, months in sorted(loaded.items()):
+                    ncm_data.update_table_with_ncm(conn, rollup.FLOW_TABLES[flow], months=sorted(set(months)))
+            if refresh_rollup:
+                rollup.refresh_stale(conn, sorted(loaded))
+    finally:
+        conn.close()
+
+    return failures == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sincroniza os arquivos da base de dados e enfileira as cargas.")
+    parser.add_argument('--years', nargs='+', metavar='ANO', default=[str(year) for year in SYNC_YEARS],
+                        help=f"anos ou intervalos sincronizados (padrão: {' '.join(map(str, SYNC_YEARS))})")
+    parser.add_argument('--output', default=download_data.OUTPUT_DIRECTORY,
+                        help=f"diretório dos arquivos (padrão: {download_data.OUTPUT_DIRECTORY})")
+    parser.add_argument('--listing-url', default=download_data.LISTING_URL, help="página com os links dos arquivos")
+    parser.add_argument('--workers', type=int, default=download_data.DOWNLOAD_WORKERS,
+                        help=f"arquivos baixados em paralelo (padrão: {download_data.DOWNLOAD_WORKERS})")
+    parser.add_argument('--force', action='store_true',
+                        help="consultar todos os arquivos mesmo que a página de listagem não tenha mudado")
+    parser.add_argument('--check-interval', type=float, default=FILE_CHECK_INTERVAL, metavar='SEGUNDOS',
+                        help="consultar todos os arquivos, mesmo com a página de listagem inalterada, se a última "
+                             f"consulta tiver mais de SEGUNDOS (padrão: {FILE_CHECK_INTERVAL:g}; 0 = sempre)")
+    parser.add_argument('--load', action='store_true', help="carregar a fila no PostgreSQL após sincronizar")
+    parser.add_argument('--no-rollup', action='store_true',
+                        help="não atualizar a tabela de resumo do dashboard após a carga (ver rollup.py)")
+    parser.add_argument('--interval', type=float, metavar='SEGUNDOS',
+                        help="repetir a sincronização a cada SEGUNDOS (modo daemon)")
+    args = parser.parse_args()
+    years = download_data.parse_years(args.years)
+
+    while True:
+        start = time.perf_counter()
+        try:
+            ok = sync(args.output, years, args.listing_url, args.workers, args.force, args.check_interval)
+            if args.load:
+                ok = process_queue(args.output, not args.no_rollup) and ok
+        except (requests.RequestException, psycopg2.Error, OSError) as e:
+            print(f"Erro na sincronização: {e}")
+            ok = False
+        print(f"Sincronização concluída em {time.perf_counter() - start:.2f}s.")
+
+        if not args.interval:
+            sys.exit(0 if ok else 1)
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
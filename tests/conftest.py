@@ -0,0 +1,37 @@
+import os
+import sys
+
+import psycopg2
+import pytest
+
+# Os módulos do projeto ficam na raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def write_trade_csv(path, rows):
+    """Grava um EXP/IMP_AAAA.csv no layout do ministério a partir de [(ano, mês, ncm, uf, kg, fob), ...]"""
+    header = ['CO_ANO', 'CO_MES', 'CO_NCM', 'CO_UNID', 'CO_PAIS', 'SG_UF_NCM', 'CO_VIA', 'CO_URF',
+              'QT_ESTAT', 'KG_LIQUIDO', 'VL_FOB']
+    with open(path, 'w', encoding='latin-1', newline='') as file:
+        file.write(';'.join(f'"{col}"' for col in header) + '\n')
+        for ano, mes, ncm, uf, kg, fob in rows:
+            values = [ano, f'{mes:02d}', f'{ncm:08d}', 10, 249, uf, 1, 817600, kg, kg, fob]
+            file.write(';'.join(f'"{value}"' for value in values) + '\n')
+
+
+@pytest.fixture
+def scratch_conn():
+    """Conexão com um banco descartável (benchmarks/scratch_db.py); o teste é pulado sem PostgreSQL"""
+    from benchmarks import scratch_db
+
+    name = f"pytest_{os.getpid()}"
+    try:
+        config = scratch_db.create_database(name)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL indisponível: {e}")
+    conn = psycopg2.connect(**config)
+    try:
+        yield conn
+    finally:
+        conn.close()
+        scratch_db.drop_database(name)
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import psycopg2
+import pytest
+
+import binary_copy
+import send_data
+
+
+@pytest.mark.parametrize('series, pg_type', [
+    (pd.Series([1, 40000], dtype='int32'), 'smallint'),
+    (pd.Series([-70000], dtype='int64'), 'smallint'),
+    (pd.Series([2**40], dtype='int64'), 'integer'),
+    (pd.Series([1.5, 2.0]), 'bigint'),
+    (pd.Series([np.inf]), 'integer'),
+    (pd.Series(['12']), 'integer'),
+])
+def test_values_that_do_not_fit_fall_back_to_text(series, pg_type):
+    df = pd.DataFrame({'valor': series})
+    assert not binary_copy.supports_binary(df, {'valor': pg_type})
+    with pytest.raises(ValueError):
+        binary_copy.encode_column(df['valor'], pg_type)
+
+
+@pytest.mark.parametrize('series, pg_type', [
+    (pd.Series([-32768, 32767], dtype='int32'), 'smallint'),
+    (pd.Series([1.0, np.nan]), 'bigint'),
+    (pd.Series([1, None], dtype='Int16'), 'integer'),
+    (pd.Series([1.5]), 'double precision'),
+])
+def test_values_that_fit_use_binary(series, pg_type):
+    assert binary_copy.supports_binary(pd.DataFrame({'valor': series}), {'valor': pg_type})
+
+
+@pytest.fixture
+def binary_format(monkeypatch):
+    monkeypatch.setattr(send_data, 'COPY_FORMAT', 'binary')
+
+
+def create_table(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("CREATE TABLE destino (pequeno SMALLINT, grande BIGINT)")
+    conn.commit()
+
+
+def test_out_of_range_value_is_rejected_like_text_copy(scratch_conn, binary_format):
+    create_table(scratch_conn)
+    df = pd.DataFrame({'pequeno': np.array([1, 40000], dtype='int32'), 'grande': [1, 2]})
+    with scratch_conn.cursor() as cursor, pytest.raises(psycopg2.errors.NumericValueOutOfRange):
+        send_data.copy_dataframe(cursor, df, 'destino')
+    scratch_conn.rollback()
+
+
+def test_fractional_value_is_rejected_like_text_copy(scratch_conn, binary_format):
+    create_table(scratch_conn)
+    df = pd.DataFrame({'pequeno': [1, 2], 'grande': [1.0, 1.5]})
+    with scratch_conn.cursor() as cursor, pytest.raises(psycopg2.errors.InvalidTextRepresentation):
+        send_data.copy_dataframe(cursor, df, 'destino')
+    scratch_conn.rollback()
+
+
+def test_valid_values_are_copied_in_binary(scratch_conn, binary_format):
+    create_table(scratch_conn)
+    df = pd.DataFrame({'pequeno': np.array([-32768, 32767], dtype='int32'), 'grande': [2.0**40, np.nan]})
+    with scratch_conn.cursor() as cursor:
+        send_data.copy_dataframe(cursor, df, 'destino')
+        cursor.execute("SELECT pequeno, grande FROM destino ORDER BY pequeno")
+        assert cursor.fetchall() == [(-32768, 2**40), (32767, None)]
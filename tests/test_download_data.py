@@ -0,0 +1,93 @@
+import hashlib
+
+import pytest
+
+import download_data
+from benchmarks import local_server
+
+CONTENT = b''.join(f'"{i}";"linha de teste"\n'.encode() for i in range(20000))
+
+
+@pytest.fixture
+def server(tmp_path):
+    site = tmp_path / 'site'
+    site.mkdir()
+    (site / 'EXP_2021.csv').write_bytes(CONTENT)
+    with local_server.serve(str(site)) as url:
+        yield f"{url}/EXP_2021.csv"
+
+
+@pytest.fixture
+def output(tmp_path):
+    output = tmp_path / 'dados'
+    output.mkdir()
+    return output
+
+
+def fetch(url, output):
+    return download_data.fetch_file(url, str(output / 'EXP_2021.csv'), download_data.DownloadMetadata(str(output)))
+
+
+def server_etag(url, output):
+    """ETag do arquivo no servidor, obtido por um download completo"""
+    assert fetch(url, output) == 'baixado'
+    return download_data.DownloadMetadata(str(output)).get('EXP_2021.csv')['etag']
+
+
+def write_partial(output, data, part_validator):
+    (output / 'EXP_2021.csv').unlink(missing_ok=True)
+    (output / 'EXP_2021.csv.part').write_bytes(data)
+    download_data.DownloadMetadata(str(output)).update('EXP_2021.csv', {'part_validator': part_validator})
+
+
+def assert_complete(output):
+    assert (output / 'EXP_2021.csv').read_bytes() == CONTENT
+    assert not (output / 'EXP_2021.csv.part').exists()
+    entry = download_data.DownloadMetadata(str(output)).get('EXP_2021.csv')
+    assert entry['sha256'] == hashlib.sha256(CONTENT).hexdigest()
+    assert entry['size'] == len(CONTENT)
+
+
+def test_unchanged_file_is_not_downloaded_again(server, output):
+    assert fetch(server, output) == 'baixado'
+    assert fetch(server, output) == 'inalterado'
+    assert_complete(output)
+
+
+def test_partial_file_is_resumed(server, output):
+    etag = server_etag(server, output)
+    write_partial(output, CONTENT[:len(CONTENT) // 3], etag)
+    assert fetch(server, output) == 'retomado'
+    assert_complete(output)
+
+
+def test_partial_file_of_another_version_is_replaced(server, output):
+    # If-Range de outra versão: o servidor envia o arquivo inteiro (200)
+    write_partial(output, b'x' * 1000, '"outra-versao"')
+    assert fetch(server, output) == 'baixado'
+    assert_complete(output)
+
+
+def test_rejected_range_restarts_the_download(server, output):
+    # .part maior que o arquivo no servidor: 416, e o download recomeça do zero
+    etag = server_etag(server, output)
+    write_partial(output, CONTENT + b'x' * 100, etag)
+    assert fetch(server, output) == 'baixado'
+    assert_complete(output)
+
+
+def test_rejected_range_tolerates_a_removed_partial(server, output, monkeypatch):
+    etag = server_etag(server, output)
+    write_partial(output, CONTENT + b'x' * 100, etag)
+
+    # O .part é removido (ex.: por outra execução) enquanto a requisição está em andamento
+    session = download_data.get_session()
+    session_get = session.get
+
+    def get(url, **kwargs):
+        (output / 'EXP_2021.csv.part').unlink(missing_ok=True)
+        return session_get(url, **kwargs)
+
+    monkeypatch.setattr(session, 'get', get)
+    assert fetch(server, output) == 'baixado'
+    assert_complete(output)
@@ -0,0 +1,77 @@
+import pytest
+
+import data_version
+import send_data
+from conftest import write_trade_csv
+
+ORIGINAL = [(2020, 1, 1011000, 'SP', 10, 100), (2020, 2, 1011000, 'MG', 20, 200)]
+# Fevereiro revisado pelo ministério: um valor corrigido e uma linha nova
+REVISED = [(2020, 1, 1011000, 'SP', 10, 100), (2020, 2, 1011000, 'MG', 25, 250), (2020, 2, 1011000, 'RJ', 5, 50)]
+
+
+def get_month_totals(conn):
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT "CO_MES", count(*), sum("KG_LIQUIDO") FROM export_data GROUP BY 1 ORDER BY 1')
+        return {int(mes): (count, int(kg)) for mes, count, kg in cursor.fetchall()}
+
+
+@pytest.fixture
+def files(tmp_path):
+    original = tmp_path / 'original' / 'EXP_2020.csv'
+    revised = tmp_path / 'revisado' / 'EXP_2020.csv'
+    for path, rows in ((original, ORIGINAL), (revised, REVISED)):
+        path.parent.mkdir()
+        write_trade_csv(path, rows)
+    return str(original), str(revised)
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_replace_after_appending_a_revised_file(scratch_conn, files, streaming):
+    def load(path, mode):
+        if streaming:
+            return send_data.insert_data_streaming(scratch_conn, path, 'E', mode=mode)
+        return send_data.load_file(scratch_conn, path, 'E', mode=mode)
+
+    original, revised = files
+    send_data.create_manifest_table(scratch_conn)
+    assert load(original, 'append') == 2
+
+    # Em append, apenas a linha nova é acrescentada; o valor corrigido é ignorado como já existente
+    assert load(revised, 'append') == 1
+    assert get_month_totals(scratch_conn) == {1: (1, 10), 2: (2, 25)}
+
+    # O manifesto continua com fevereiro original, então a substituição o reconhece como alterado
+    assert load(revised, 'replace') == 2
+    assert get_month_totals(scratch_conn) == {1: (1, 10), 2: (2, 30)}
+    assert load(revised, 'replace') == 0
+
+
+def get_generation(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(data_version.VERSION_QUERY)
+        return cursor.fetchone()[0]
+
+
+def test_replaced_months_bump_the_generation_before_a_later_failure(scratch_conn, files, monkeypatch):
+    original, revised = files
+    send_data.create_manifest_table(scratch_conn)
+    data_version.create_data_version_table(scratch_conn)
+    send_data.load_file(scratch_conn, original, 'E')
+    generation = get_generation(scratch_conn)
+
+    # O segundo mês substituído falha depois do commit do primeiro
+    record_manifest = send_data.record_manifest
+    calls = []
+
+    def failing_record_manifest(cursor, data_type, fingerprints, only_new=False):
+        calls.append(fingerprints.index[0])
+        if len(calls) == 2:
+            raise RuntimeError("falha simulada")
+        record_manifest(cursor, data_type, fingerprints, only_new)
+
+    monkeypatch.setattr(send_data, 'record_manifest', failing_record_manifest)
+    written = REVISED + [(2020, 1, 1011000, 'RJ', 1, 10)]
+    write_trade_csv(revised, written)
+    assert send_data.load_file(scratch_conn, revised, 'E', mode='replace') is None
+    assert get_month_totals(scratch_conn)[1] == (2, 11)
+    assert get_generation(scratch_conn) == generation + 1
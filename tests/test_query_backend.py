@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+pytest.importorskip('duckdb')
+pytest.importorskip('pyarrow')
+
+import parquet_cache  # noqa: E402
+import query_backend  # noqa: E402
+from conftest import write_trade_csv  # noqa: E402
+
+
+def get_totals(backend):
+    df = backend.query('SELECT "CO_ANO", count(*) AS n, sum("KG_LIQUIDO") AS kg FROM export_data GROUP BY 1 ORDER BY 1')
+    return {int(row.CO_ANO): (int(row.n), int(row.kg)) for row in df.itertuples()}
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data_dir = tmp_path / 'dados'
+    data_dir.mkdir()
+    write_trade_csv(data_dir / 'EXP_2020.csv', [(2020, 1, 1011000, 'SP', 10, 100), (2020, 2, 1011000, 'MG', 20, 200)])
+    write_trade_csv(data_dir / 'EXP_2021.csv', [(2021, 1, 1011000, 'SP', 30, 300)])
+    return data_dir
+
+
+def test_partial_cache_reads_remaining_files_from_csv(data_dir, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    # Apenas 2021 convertido
+    parquet_cache.convert_file(str(data_dir / 'EXP_2021.csv'), cache_dir)
+
+    backend = query_backend.DuckDBBackend(str(data_dir), cache_dir)
+    try:
+        assert get_totals(backend) == {2020: (2, 30), 2021: (1, 30)}
+        assert backend.sources['export_data'] == 'csv+parquet'
+    finally:
+        backend.close()
+
+
+def test_stale_and_orphan_cache_files_are_ignored(data_dir, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    parquet_cache.convert_file(str(data_dir / 'EXP_2021.csv'), cache_dir)
+    # Arquivo do cache cujo CSV de origem não existe mais
+    write_trade_csv(tmp_path / 'EXP_2019.csv', [(2019, 1, 1011000, 'SP', 99, 999)])
+    parquet_cache.convert_file(str(tmp_path / 'EXP_2019.csv'), cache_dir)
+
+    # CSV revisado depois da conversão: o cache de 2021 fica desatualizado
+    time.sleep(0.01)
+    write_trade_csv(data_dir / 'EXP_2021.csv', [(2021, 1, 1011000, 'SP', 30, 300), (2021, 2, 1011000, 'RJ', 5, 50)])
+    assert not parquet_cache.is_fresh(str(data_dir / 'EXP_2021.csv'), cache_dir)
+
+    backend = query_backend.DuckDBBackend(str(data_dir), cache_dir)
+    try:
+        assert get_totals(backend) == {2020: (2, 30), 2021: (2, 35)}
+        assert backend.sources['export_data'] == 'csv'
+    finally:
+        backend.close()
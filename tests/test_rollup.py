@@ -0,0 +1,38 @@
+import pytest
+
+import dashboard_queries
+import query_backend
+import rollup
+import send_data
+from benchmarks import scratch_db
+from conftest import write_trade_csv
+
+
+@pytest.fixture
+def backend(scratch_conn):
+    backend = query_backend.PostgresBackend(scratch_db.get_config(scratch_conn.info.dbname), pool_size=1)
+    yield backend
+    backend.pool.closeall()
+
+
+def get_rollup_totals(conn):
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT "CO_ANO", sum("KG_LIQUIDO") FROM trade_rollup WHERE flow = %s GROUP BY 1 ORDER BY 1',
+                       ('E',))
+        return {ano: int(kg) for ano, kg in cursor.fetchall()}
+
+
+def test_first_refresh_covers_months_loaded_without_manifest(scratch_conn, backend, tmp_path):
+    write_trade_csv(tmp_path / 'EXP_2020.csv', [(2020, 1, 1011000, 'SP', 10, 100), (2020, 2, 1011000, 'MG', 20, 200)])
+    write_trade_csv(tmp_path / 'EXP_2021.csv', [(2021, 1, 1011000, 'SP', 30, 300)])
+    send_data.create_manifest_table(scratch_conn)
+    # 2020 carregado antes do manifesto
+    assert send_data.load_file(scratch_conn, str(tmp_path / 'EXP_2020.csv'), 'E', use_manifest=False) == 2
+    assert send_data.load_file(scratch_conn, str(tmp_path / 'EXP_2021.csv'), 'E') == 1
+
+    assert rollup.refresh_stale(scratch_conn, ['E']) == 3
+    assert get_rollup_totals(scratch_conn) == {2020: 30, 2021: 30}
+    assert dashboard_queries.get_rollup_flows(backend) == ['E']
+
+    # Depois da primeira atualização, apenas os meses do manifesto são considerados
+    assert rollup.refresh_stale(scratch_conn, ['E']) == 0
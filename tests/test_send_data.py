@@ -0,0 +1,39 @@
+import send_data
+from conftest import write_trade_csv
+
+ROWS = [(2020, 1, 1011000, 'SP', 10, 100), (2020, 2, 1011000, 'MG', 20, 200)]
+
+
+def count_rows(conn):
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT count(*) FROM export_data')
+        return cursor.fetchone()[0]
+
+
+def test_unique_index_with_another_name_skips_resent_rows(scratch_conn, tmp_path):
+    path = str(tmp_path / 'EXP_2020.csv')
+    write_trade_csv(path, ROWS)
+    assert send_data.load_file(scratch_conn, path, 'E', use_manifest=False) == 2
+
+    # Índice único criado fora do send_data.py, sem o nome <tabela>_unique
+    with scratch_conn.cursor() as cursor:
+        cursor.execute('ALTER TABLE export_data DROP CONSTRAINT export_data_unique')
+        cursor.execute('CREATE UNIQUE INDEX export_data_chave ON export_data ({})'.format(
+            ', '.join(f'"{col}"' for col in send_data.KEY_COLUMNS)
+        ))
+    scratch_conn.commit()
+
+    assert send_data.load_file(scratch_conn, path, 'E', use_manifest=False) == 0
+    assert count_rows(scratch_conn) == 2
+
+
+def test_bulk_load_copies_without_deduplication_until_finalized(scratch_conn, tmp_path):
+    path = str(tmp_path / 'EXP_2020.csv')
+    write_trade_csv(path, ROWS)
+    send_data.create_table_from_header(scratch_conn, path, 'E', defer_constraints=True)
+    for _ in range(2):
+        assert send_data.load_file(scratch_conn, path, 'E', use_manifest=False, bulk_load=True) == 2
+    assert count_rows(scratch_conn) == 4
+
+    assert send_data.finalize_bulk_load(scratch_conn, 'E')
+    assert count_rows(scratch_conn) == 2
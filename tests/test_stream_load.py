@@ -0,0 +1,89 @@
+import gzip
+import zipfile
+
+import pytest
+
+import download_data
+import send_data
+import stream_load
+from benchmarks import local_server
+from conftest import write_trade_csv
+
+# Três meses, várias UFs e códigos NCM (a chave única não se repete)
+ROWS = [
+    (2021, mes, 1011000 + ncm, uf, 10 * ncm + mes, 100 * ncm + mes)
+    for mes in (1, 2, 3) for ncm in range(200) for uf in ('SP', 'MG')
+]
+
+
+class Unseekable:
+    """Arquivo sem seek: o zipfile grava CRC e tamanhos em um descritor depois dos dados"""
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, data):
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+
+def compress(csv_path, site, kind):
+    data = csv_path.read_bytes()
+    if kind == 'csv':
+        (site / 'EXP_2021.csv').write_bytes(data)
+        return 'EXP_2021.csv'
+    if kind == 'gz':
+        (site / 'EXP_2021.csv.gz').write_bytes(gzip.compress(data))
+        return 'EXP_2021.csv.gz'
+    with open(site / 'EXP_2021.zip', 'wb') as file:
+        target = Unseekable(file) if kind == 'zip-stream' else file
+        with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('EXP_2021.csv', data)
+    return 'EXP_2021.zip'
+
+
+@pytest.fixture
+def conn(scratch_conn):
+    send_data.create_manifest_table(scratch_conn)
+    return scratch_conn
+
+
+def get_totals(conn):
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT count(*), sum("VL_FOB") FROM export_data')
+        count, total = cursor.fetchone()
+        return count, int(total)
+
+
+@pytest.mark.parametrize('kind', ['csv', 'gz', 'zip', 'zip-stream'])
+def test_streamed_load_matches_the_file(conn, tmp_path, kind):
+    write_trade_csv(tmp_path / 'EXP_2021.csv', ROWS)
+    site = tmp_path / 'site'
+    site.mkdir()
+    name = compress(tmp_path / 'EXP_2021.csv', site, kind)
+    tee = tmp_path / 'tee'
+
+    with local_server.serve(str(site)) as url:
+        rows = stream_load.stream_load(conn, f"{url}/{name}", 'E', tee_directory=str(tee), chunksize=250)
+
+    assert rows == len(ROWS)
+    assert get_totals(conn) == (len(ROWS), sum(row[5] for row in ROWS))
+    # O arquivo gravado com --tee é o recebido, registrado como no download_data.py
+    assert (tee / name).read_bytes() == (site / name).read_bytes()
+    assert download_data.DownloadMetadata(str(tee)).get(name)['size'] == (site / name).stat().st_size
+
+
+def test_streamed_replace_substitutes_the_months(conn, tmp_path):
+    site = tmp_path / 'site'
+    site.mkdir()
+    write_trade_csv(site / 'EXP_2021.csv', ROWS)
+    with local_server.serve(str(site)) as url:
+        assert stream_load.stream_load(conn, f"{url}/EXP_2021.csv", 'E') == len(ROWS)
+        # Revisão: apenas o primeiro NCM de cada mês, com valores dobrados
+        revised = [(ano, mes, ncm, uf, kg, 2 * fob) for ano, mes, ncm, uf, kg, fob in ROWS if ncm == 1011000]
+        write_trade_csv(site / 'EXP_2021.csv', revised)
+        assert stream_load.stream_load(conn, f"{url}/EXP_2021.csv", 'E', mode='replace') == len(revised)
+
+    assert get_totals(conn) == (len(revised), sum(row[5] for row in revised))
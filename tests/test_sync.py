@@ -0,0 +1,46 @@
+import json
+import os
+
+import pytest
+
+import sync
+from benchmarks import local_server
+from conftest import write_trade_csv
+
+
+@pytest.fixture
+def site(tmp_path):
+    site = tmp_path / 'site'
+    (site / 'listagem').mkdir(parents=True)
+    (site / 'listagem' / 'index.html').write_text('<a href="../arquivos/EXP_2021.csv">Exportação 2021</a>')
+    (site / 'arquivos').mkdir()
+    write_trade_csv(site / 'arquivos' / 'EXP_2021.csv', [(2021, 1, 1011000, 'SP', 30, 300)])
+    with local_server.serve(str(site)) as url:
+        yield site, f"{url}/listagem/"
+
+
+def run_sync(output, listing_url, check_interval):
+    assert sync.sync(str(output), [2021], listing_url, workers=1, check_interval=check_interval)
+    queue_path = output / sync.QUEUE_FILE
+    queue = json.loads(queue_path.read_text()) if queue_path.exists() else {}
+    if queue_path.exists():
+        queue_path.unlink()
+    return {name: entry['months'] for name, entry in queue.items()}
+
+
+def test_revised_file_under_same_url_is_found_after_check_interval(site, tmp_path):
+    site_dir, listing_url = site
+    output = tmp_path / 'dados'
+    assert run_sync(output, listing_url, 3600) == {'EXP_2021.csv': ['2021-01']}
+
+    # Fevereiro publicado no mesmo arquivo, sem alterar a página de listagem
+    path = site_dir / 'arquivos' / 'EXP_2021.csv'
+    write_trade_csv(path, [(2021, 1, 1011000, 'SP', 30, 300), (2021, 2, 1011000, 'SP', 40, 400)])
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    # Página inalterada e última consulta recente: apenas a listagem é consultada
+    assert run_sync(output, listing_url, 3600) == {}
+    # Última consulta mais antiga que o intervalo: o arquivo revisado é encontrado
+    assert run_sync(output, listing_url, 0) == {'EXP_2021.csv': ['2021-02']}
+    assert run_sync(output, listing_url, 0) == {}